@@ -0,0 +1,278 @@
+"""Benchmark do FinancePro com dados sintéticos (1 mil a 5 milhões de gastos).
+
+Uso:
+    python benchmark_financepro.py                          # 1k, 10k, 100k, 1M
+    python benchmark_financepro.py --tamanhos 1000 5000000  # inclui 5M
+    python benchmark_financepro.py --motor sqlite --saida resultados.json
+    python benchmark_financepro.py --comparar anterior.json
+
+Cada tamanho roda num diretório temporário próprio. Os tempos (mediana das
+repetições) são gravados em JSON para comparar versões; com --comparar, a
+razão novo/anterior de cada operação é impressa ao final.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime
+
+import numpy as np
+
+MOTORES = ["json", "sqlite"]
+TAMANHOS_PADRAO = [1_000, 10_000, 100_000, 1_000_000]
+SEMENTE_PADRAO = 42
+ANOS_PADRAO = 5
+
+# Participação de cada categoria no número de gastos e (média, dispersão)
+# do log-normal dos valores: muitos gastos pequenos de alimentação e
+# transporte, poucos e grandes de moradia e educação
+PERFIL_CATEGORIAS = {
+    "🏠 Moradia": (0.06, 1200.0, 0.5),
+    "🚗 Transporte": (0.20, 45.0, 0.8),
+    "🍎 Alimentação": (0.34, 60.0, 0.9),
+    "🏥 Saúde": (0.06, 150.0, 1.0),
+    "🎮 Lazer": (0.12, 80.0, 1.0),
+    "🛒 Compras": (0.12, 120.0, 1.1),
+    "📚 Educação": (0.04, 400.0, 0.7),
+    "💼 Outros": (0.06, 70.0, 1.2),
+}
+
+DESCRICOES = {
+    "🏠 Moradia": ["Aluguel", "Condomínio", "Conta de luz", "Conta de água", "Internet", "IPTU"],
+    "🚗 Transporte": ["Combustível", "Uber", "Ônibus", "Estacionamento", "Pedágio", "Manutenção"],
+    "🍎 Alimentação": ["Supermercado", "Padaria", "Restaurante", "Delivery", "Feira", "Lanche"],
+    "🏥 Saúde": ["Farmácia", "Consulta", "Exame", "Plano de saúde", "Dentista"],
+    "🎮 Lazer": ["Cinema", "Streaming", "Show", "Viagem", "Bar", "Jogo"],
+    "🛒 Compras": ["Roupas", "Eletrônicos", "Presente", "Casa", "Livraria"],
+    "📚 Educação": ["Mensalidade", "Curso online", "Livros", "Material escolar"],
+    "💼 Outros": ["Doação", "Taxa bancária", "Emergência", "Diversos"],
+}
+
+def gerar_gastos(quantidade, semente=SEMENTE_PADRAO, referencia=None, anos=ANOS_PADRAO):
+    """Lista de gastos sintéticos, idêntica para a mesma (quantidade, semente,
+    referência). As datas cobrem os `anos` anteriores à referência"""
+    referencia = referencia or date.today()
+    gerador = np.random.default_rng(semente)
+    categorias = list(PERFIL_CATEGORIAS)
+    pesos = np.array([PERFIL_CATEGORIAS[c][0] for c in categorias])
+
+    codigos = gerador.choice(len(categorias), size=quantidade, p=pesos / pesos.sum())
+    medias = np.array([PERFIL_CATEGORIAS[c][1] for c in categorias])[codigos]
+    dispersoes = np.array([PERFIL_CATEGORIAS[c][2] for c in categorias])[codigos]
+    valores = np.round(gerador.lognormal(np.log(medias), dispersoes), 2).clip(0.01)
+
+    fim = referencia.toordinal()
+    ordinais = gerador.integers(fim - 365 * anos, fim + 1, size=quantidade)
+    ordinais_unicos, inverso = np.unique(ordinais, return_inverse=True)
+    datas = np.array([date.fromordinal(int(o)).isoformat() for o in ordinais_unicos], dtype=object)[inverso]
+
+    sorteio = gerador.integers(0, 1 << 30, size=quantidade)
+    nomes = [DESCRICOES[c] for c in categorias]
+    return [
+        {
+            "id": i + 1,
+            "descricao": nomes[codigo][sorteio_i % len(nomes[codigo])],
+            "valor": float(valor),
+            "categoria": categorias[codigo],
+            "data": data_i
+        }
+        for i, (codigo, valor, data_i, sorteio_i) in enumerate(
+            zip(codigos.tolist(), valores.tolist(), datas.tolist(), sorteio.tolist())
+        )
+    ]
+
+def cronometrar(funcao, repeticoes=1):
+    """Mediana (segundos) de `repeticoes` execuções de funcao()"""
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao()
+        tempos.append(time.perf_counter() - inicio)
+    return {"segundos": statistics.median(tempos), "repeticoes": repeticoes}
+
+# Módulos que só as páginas e exportações que os usam devem importar
+MODULOS_PESADOS = ["numpy", "pandas", "plotly.express", "streamlit_lottie", "requests", "xlsxwriter"]
+
+CODIGO_INICIALIZACAO = """
+import sys, time
+inicio = time.perf_counter()
+import financepro_final
+financepro_final.FinancePro()
+print(time.perf_counter() - inicio)
+print(",".join(m for m in %r if m in sys.modules))
+""" % MODULOS_PESADOS
+
+def _preencher_cache_lottie(fp, pasta):
+    """Grava as animações no cache em disco de `pasta`, como depois da primeira
+    execução: sem nada a baixar, a thread de download não é criada e não
+    importa requests (nem disputa a CPU) no meio da medição"""
+    cache = fp.CacheLottie(os.path.join(pasta, fp.PASTA_CACHE_LOTTIE))
+    for nome, url in fp.ANIMACOES.items():
+        cache._gravar(cache._caminho(url, "json"), json.dumps(fp.ANIMACOES_EMBUTIDAS[nome]))
+
+def medir_inicializacao(fp, motor, repeticoes):
+    """Partida a frio: importar o app e criar o FinancePro num processo novo,
+    sem dados e com as animações já em cache. Devolve a mediana e os módulos
+    pesados que já foram carregados"""
+    ambiente = dict(os.environ, FINANCEPRO_ARMAZENAMENTO=motor)
+    ambiente["PYTHONPATH"] = os.pathsep.join(
+        filter(None, [os.path.dirname(os.path.abspath(__file__)), ambiente.get("PYTHONPATH")])
+    )
+    tempos = []
+    with tempfile.TemporaryDirectory(prefix="financepro_bench_") as pasta:
+        _preencher_cache_lottie(fp, pasta)
+        for _ in range(repeticoes):
+            saida = subprocess.run(
+                [sys.executable, "-c", CODIGO_INICIALIZACAO],
+                cwd=pasta, env=ambiente, capture_output=True, text=True, check=True
+            ).stdout.split("\n")
+            tempos.append(float(saida[0]))
+    return {
+        "segundos": statistics.median(tempos),
+        "repeticoes": repeticoes,
+        "modulos_pesados": [m for m in saida[1].split(",") if m]
+    }
+
+def importar_app(motor):
+    """Importa o FinancePro com o motor escolhido (lido da variável de
+    ambiente na importação). O backup automático fica desligado: a thread
+    dele disputaria o disco com as medições"""
+    os.environ["FINANCEPRO_ARMAZENAMENTO"] = motor
+    os.environ["FINANCEPRO_BACKUP"] = "0"
+    import financepro_final
+    return financepro_final
+
+def _reiniciar_processo(fp):
+    """Descarta motor de armazenamento e base compartilhada (novo diretório)"""
+    fp.obter_armazenamento.clear()
+    fp.obter_base_compartilhada.clear()
+    fp.obter_cache_figuras.clear()
+    fp.obter_backup_automatico.clear()
+
+def medir_tamanho(fp, quantidade, semente, referencia, repeticoes):
+    """Todas as medições para um tamanho de base"""
+    import streamlit as st
+
+    operacoes = {}
+    gastos = gerar_gastos(quantidade, semente, referencia)
+
+    with tempfile.TemporaryDirectory(prefix="financepro_bench_") as pasta:
+        diretorio_original = os.getcwd()
+        os.chdir(pasta)
+        try:
+            _reiniciar_processo(fp)
+            for chave in list(st.session_state.keys()):
+                del st.session_state[chave]
+
+            operacoes["salvar_dados"] = cronometrar(lambda: fp.salvar_dados(gastos))
+            operacoes["carregar_dados"] = cronometrar(fp.carregar_dados)
+            # Libera a lista (a tabela carregada é a que conta daqui em diante)
+            gastos = None
+
+            # Primeira sessão: tabela colunar, cubo e índice de datas
+            inicio = time.perf_counter()
+            app = fp.FinancePro()
+            operacoes["inicializar_sessao"] = {"segundos": time.perf_counter() - inicio, "repeticoes": 1}
+
+            for nome in (
+                "obter_gastos_mes_atual",
+                "obter_gastos_por_mes",
+                "obter_gastos_por_categoria_mensal",
+                "obter_gastos_por_categoria_total",
+                "obter_resumo_dashboard",
+            ):
+                operacoes[nome] = cronometrar(getattr(app, nome), repeticoes)
+            operacoes["obter_gastos_por_periodo"] = cronometrar(
+                lambda: app.obter_gastos_por_periodo(date(referencia.year - 1, 1, 1), referencia), repeticoes
+            )
+
+            ids_adicionados = []
+
+            def adicionar():
+                app.adicionar_gasto("Benchmark", 12.34, "💼 Outros", referencia)
+                ids_adicionados.append(st.session_state.dados.ids[-1])
+
+            operacoes["adicionar_gasto"] = cronometrar(adicionar, repeticoes)
+            operacoes["remover_gasto"] = cronometrar(lambda: app.remover_gasto(ids_adicionados.pop()), repeticoes)
+
+            tabela = st.session_state.dados
+            operacoes["exportar_csv"] = cronometrar(lambda: fp.exportar_csv(tabela, "exportacao.csv"))
+            operacoes["exportar_excel"] = cronometrar(lambda: fp.exportar_excel(tabela, "exportacao.xlsx"))
+        finally:
+            os.chdir(diretorio_original)
+            _reiniciar_processo(fp)
+
+    return operacoes
+
+def comparar(resultados, anterior):
+    """Imprime a razão novo/anterior de cada operação presente nos dois"""
+    antes = {item["tamanho"]: item["operacoes"] for item in anterior["resultados"]}
+    print("\nComparação com", anterior.get("executado_em", "resultado anterior"))
+    if anterior.get("inicializacao", {}).get("segundos"):
+        razao = resultados["inicializacao"]["segundos"] / anterior["inicializacao"]["segundos"]
+        print(f"\n  {'inicializacao':38s} {razao:6.2f}x")
+    for item in resultados["resultados"]:
+        base = antes.get(item["tamanho"])
+        if not base:
+            continue
+        print(f"\n  {item['tamanho']:,} gastos")
+        for nome, medicao in item["operacoes"].items():
+            if nome in base and base[nome]["segundos"] > 0:
+                razao = medicao["segundos"] / base[nome]["segundos"]
+                alerta = "  <-- mais lento" if razao > 1.2 else ""
+                print(f"    {nome:36s} {razao:6.2f}x{alerta}")
+
+def main(argumentos=None):
+    parser = argparse.ArgumentParser(description="Benchmark do FinancePro com dados sintéticos")
+    parser.add_argument("--tamanhos", type=int, nargs="+", default=TAMANHOS_PADRAO,
+                        help="Quantidades de gastos a medir (padrão: 1k 10k 100k 1M)")
+    parser.add_argument("--motor", choices=MOTORES,
+                        default=os.environ.get("FINANCEPRO_ARMAZENAMENTO", "json"),
+                        help="Motor de armazenamento")
+    parser.add_argument("--semente", type=int, default=SEMENTE_PADRAO)
+    parser.add_argument("--referencia", type=date.fromisoformat, default=date.today(),
+                        help="Data final dos gastos gerados (YYYY-MM-DD); padrão: hoje")
+    parser.add_argument("--repeticoes", type=int, default=5,
+                        help="Repetições das operações rápidas (vale a mediana)")
+    parser.add_argument("--saida", default=f"benchmark_{datetime.now():%Y%m%d_%H%M%S}.json")
+    parser.add_argument("--comparar", help="JSON de uma execução anterior")
+    args = parser.parse_args(argumentos)
+
+    fp = importar_app(args.motor)
+
+    resultados = {
+        "executado_em": datetime.now().isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "plataforma": platform.platform(),
+        "motor": args.motor,
+        "semente": args.semente,
+        "referencia": args.referencia.isoformat(),
+        "resultados": []
+    }
+    print("Partida a frio...", flush=True)
+    resultados["inicializacao"] = medir_inicializacao(fp, args.motor, args.repeticoes)
+    print(f"  {'inicializacao':36s} {resultados['inicializacao']['segundos'] * 1000:10.2f} ms"
+          f"  (já carregados: {', '.join(resultados['inicializacao']['modulos_pesados']) or 'nenhum'})")
+
+    for quantidade in args.tamanhos:
+        print(f"{quantidade:,} gastos...", flush=True)
+        operacoes = medir_tamanho(fp, quantidade, args.semente, args.referencia, args.repeticoes)
+        for nome, medicao in operacoes.items():
+            print(f"  {nome:36s} {medicao['segundos'] * 1000:10.2f} ms")
+        resultados["resultados"].append({"tamanho": quantidade, "operacoes": operacoes})
+
+    with open(args.saida, "w", encoding="utf-8") as f:
+        json.dump(resultados, f, ensure_ascii=False, indent=2)
+    print(f"\nResultados gravados em {args.saida}")
+
+    if args.comparar:
+        with open(args.comparar, "r", encoding="utf-8") as f:
+            comparar(resultados, json.load(f))
+
+if __name__ == "__main__":
+    main()
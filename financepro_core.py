@@ -0,0 +1,864 @@
+"""Núcleo do FinancePro sem interface: arquivos de dados, snapshot binário,
+lock entre processos, gravação atômica, backups deduplicados e o relatório
+em linha de comando.
+
+Uso:
+    python financepro_core.py report                         # resumo mensal em CSV na saída padrão
+    python financepro_core.py report --tabela categorias --saida categorias.csv
+    python financepro_core.py report --formato json --saida relatorio.json
+    python financepro_core.py report --motor sqlite --pasta /dados --inicio 2024-01-01
+
+O relatório lê os gastos em fluxo, registro a registro: a memória usada
+depende do número de meses e categorias, não do tamanho do histórico.
+Nada aqui importa o Streamlit.
+"""
+import argparse
+import contextlib
+import csv
+import functools
+import hashlib
+import io
+import json
+import mmap
+import os
+import sqlite3
+import struct
+import sys
+import tempfile
+import threading
+import zlib
+from array import array
+from datetime import date, datetime
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# ========== ARQUIVOS DE DADOS ==========
+# Snapshot binário (formato abaixo). O JSON é o formato antigo do snapshot,
+# lido enquanto o binário ainda não existe e renomeado para .migrado depois
+ARQUIVO_SNAPSHOT = "dados_financepro.bin"
+ARQUIVO_DADOS = "dados_financepro.json"
+ARQUIVO_DADOS_MIGRADO = "dados_financepro.json.migrado"
+ARQUIVO_JOURNAL = "dados_financepro.journal.jsonl"
+ARQUIVO_JOURNAL_COMPACTANDO = "dados_financepro.journal.compactando.jsonl"
+ARQUIVO_META = "dados_financepro.meta.json"
+ARQUIVO_LOCK = "dados_financepro.lock"
+ARQUIVO_SQLITE = "dados_financepro.db"
+MOTORES = ["json", "sqlite"]
+MOTOR_ARMAZENAMENTO = os.environ.get("FINANCEPRO_ARMAZENAMENTO", "json")
+
+# ========== GRAVAÇÃO ATÔMICA ==========
+def escrever_temporario(caminho, escrever, binario=False):
+    """Escreve (via escrever(f)) num temporário ao lado de `caminho`, já com
+    fsync, e devolve o nome dele; quem chama decide quando fazer o os.replace"""
+    pasta = os.path.dirname(os.path.abspath(caminho))
+    descritor, temporario = tempfile.mkstemp(
+        dir=pasta, prefix=os.path.basename(caminho) + ".", suffix=".tmp"
+    )
+    try:
+        with (os.fdopen(descritor, "wb") if binario else os.fdopen(descritor, "w", encoding='utf-8')) as f:
+            escrever(f)
+            f.flush()
+            os.fsync(f.fileno())
+    except BaseException:
+        os.remove(temporario)
+        raise
+    return temporario
+
+def gravar_atomico(caminho, escrever, binario=False):
+    """Grava o arquivo inteiro ou nada: uma queda no meio da escrita
+    deixa a versão anterior intacta"""
+    os.replace(escrever_temporario(caminho, escrever, binario), caminho)
+
+# ========== LOCK ENTRE PROCESSOS ==========
+if fcntl is not None:
+    def _travar_arquivo(arquivo):
+        fcntl.flock(arquivo.fileno(), fcntl.LOCK_EX)
+
+    def _destravar_arquivo(arquivo):
+        fcntl.flock(arquivo.fileno(), fcntl.LOCK_UN)
+else:
+    def _travar_arquivo(arquivo):
+        arquivo.seek(0)
+        while True:
+            try:
+                # LK_LOCK já espera, mas desiste depois de ~10 s: continua esperando
+                msvcrt.locking(arquivo.fileno(), msvcrt.LK_LOCK, 1)
+                return
+            except OSError:
+                continue
+
+    def _destravar_arquivo(arquivo):
+        arquivo.seek(0)
+        msvcrt.locking(arquivo.fileno(), msvcrt.LK_UNLCK, 1)
+
+class TravaArquivo:
+    """Lock exclusivo entre threads e entre processos (flock/msvcrt sobre um
+    arquivo .lock). Quem chega depois espera a vez; não há novas tentativas.
+    Reentrante dentro da mesma thread"""
+
+    def __init__(self, caminho):
+        self.caminho = caminho
+        self.lock_local = threading.RLock()
+        self.arquivo = None
+        self.profundidade = 0
+
+    def __enter__(self):
+        self.lock_local.acquire()
+        if self.profundidade == 0:
+            arquivo = open(self.caminho, "a+b")
+            try:
+                _travar_arquivo(arquivo)
+            except BaseException:
+                arquivo.close()
+                self.lock_local.release()
+                raise
+            self.arquivo = arquivo
+        self.profundidade += 1
+        return self
+
+    def __exit__(self, *exc):
+        self.profundidade -= 1
+        if self.profundidade == 0:
+            _destravar_arquivo(self.arquivo)
+            self.arquivo.close()
+            self.arquivo = None
+        self.lock_local.release()
+        return False
+
+# ========== SNAPSHOT BINÁRIO ==========
+# Cabeçalho de 32 bytes e depois as colunas, cada uma alinhada em 8 bytes:
+#   ids (int64), valores (float64), datas (int32, número do dia; 0 = sem data),
+#   categorias e descrições (uint32, índice na tabela de textos),
+#   início de cada texto (uint64, quantidade_textos + 1) e os textos em UTF-8.
+# As colunas são lidas direto do arquivo mapeado em memória, sem interpretar
+# registro por registro. Os números estão na ordem de bytes da máquina que
+# gravou; outra ordem é recusada (basta exportar/importar em JSON).
+MAGICA_SNAPSHOT = b"FPSNAP\r\n"
+VERSAO_FORMATO_SNAPSHOT = 1
+_CABECALHO_SNAPSHOT = struct.Struct("<8sIIQQ")
+_COLUNAS_SNAPSHOT = [("ids", "q"), ("valores", "d"), ("datas", "i"), ("categorias", "I"), ("descricoes", "I")]
+
+def _alinhar(posicao):
+    return (posicao + 7) // 8 * 8
+
+@functools.lru_cache(maxsize=None)
+def ordinal_da_data(data_str):
+    """'YYYY-MM-DD' -> número do dia (0 quando ausente/inválida)"""
+    try:
+        return datetime.strptime(data_str, "%Y-%m-%d").toordinal()
+    except (TypeError, ValueError):
+        return 0
+
+@functools.lru_cache(maxsize=None)
+def data_do_ordinal(ordinal):
+    """Número do dia -> 'YYYY-MM-DD' ('' quando ausente)"""
+    return date.fromordinal(ordinal).isoformat() if ordinal else ""
+
+def escrever_snapshot(arquivo, gastos):
+    """Grava os gastos (dicts) no formato binário em `arquivo` (aberto em modo binário)"""
+    colunas = {nome: array(tipo) for nome, tipo in _COLUNAS_SNAPSHOT}
+    indices = {}
+
+    def indice(texto):
+        posicao = indices.get(texto)
+        if posicao is None:
+            posicao = indices[texto] = len(indices)
+        return posicao
+
+    for gasto in gastos:
+        colunas["ids"].append(gasto.get("id") or 0)
+        colunas["valores"].append(float(gasto.get("valor", 0)))
+        colunas["datas"].append(ordinal_da_data(gasto.get("data", "")))
+        colunas["categorias"].append(indice(gasto.get("categoria", "💼 Outros")))
+        colunas["descricoes"].append(indice(gasto.get("descricao", "")))
+
+    textos = [texto.encode("utf-8") for texto in indices]
+    inicios = array("Q", [0])
+    for texto in textos:
+        inicios.append(inicios[-1] + len(texto))
+
+    arquivo.write(_CABECALHO_SNAPSHOT.pack(
+        MAGICA_SNAPSHOT, VERSAO_FORMATO_SNAPSHOT, sys.byteorder == "little",
+        len(colunas["ids"]), len(textos)
+    ))
+    escritos = _CABECALHO_SNAPSHOT.size
+    for bloco in [colunas[nome] for nome, _ in _COLUNAS_SNAPSHOT] + [inicios]:
+        dados = bloco.tobytes()
+        arquivo.write(dados + b"\0" * (_alinhar(escritos + len(dados)) - escritos - len(dados)))
+        escritos = _alinhar(escritos + len(dados))
+    arquivo.write(b"".join(textos))
+
+class SnapshotBinario:
+    """Snapshot binário mapeado em memória (uso: `with SnapshotBinario(caminho)
+    as snapshot`). As colunas são memoryviews sobre o arquivo mapeado: só as
+    páginas efetivamente lidas saem do disco, e nada sobrevive ao `with`"""
+
+    def __init__(self, caminho=ARQUIVO_SNAPSHOT):
+        self.caminho = caminho
+        self.arquivo = None
+        self.mapa = None
+        self.visoes = []
+        # Mesmas colunas como bytes crus (para copiar em bloco com array.frombytes)
+        self.bytes_colunas = {}
+        self._textos = None
+
+    def __enter__(self):
+        self.arquivo = open(self.caminho, "rb")
+        try:
+            self.mapa = mmap.mmap(self.arquivo.fileno(), 0, access=mmap.ACCESS_READ)
+            self._ler_cabecalho()
+        except BaseException:
+            self.fechar()
+            raise
+        return self
+
+    def __exit__(self, *exc):
+        self.fechar()
+        return False
+
+    def _visao(self, inicio, tamanho):
+        visao = memoryview(self.mapa)[inicio:inicio + tamanho]
+        self.visoes.append(visao)
+        return visao
+
+    def _ler_cabecalho(self):
+        if len(self.mapa) < _CABECALHO_SNAPSHOT.size:
+            raise ValueError(f"{self.caminho} não é um snapshot do FinancePro")
+        magica, versao, little, quantidade, textos = _CABECALHO_SNAPSHOT.unpack_from(self.mapa)
+        if magica != MAGICA_SNAPSHOT or versao != VERSAO_FORMATO_SNAPSHOT:
+            raise ValueError(f"{self.caminho} não é um snapshot do FinancePro (versão {VERSAO_FORMATO_SNAPSHOT})")
+        if bool(little) != (sys.byteorder == "little"):
+            raise ValueError(f"{self.caminho} foi gravado com outra ordem de bytes")
+
+        self.quantidade = quantidade
+        self.quantidade_textos = textos
+        posicao = _CABECALHO_SNAPSHOT.size
+        for nome, tipo in _COLUNAS_SNAPSHOT + [("_inicios", "Q")]:
+            itens = textos + 1 if nome == "_inicios" else quantidade
+            tamanho = itens * array(tipo).itemsize
+            if posicao + tamanho > len(self.mapa):
+                raise ValueError(f"{self.caminho} está truncado")
+            self.bytes_colunas[nome] = self._visao(posicao, tamanho)
+            setattr(self, nome, self.bytes_colunas[nome].cast(tipo))
+            self.visoes.append(getattr(self, nome))
+            posicao = _alinhar(posicao + tamanho)
+        self._inicio_textos = posicao
+        if posicao + self._inicios[textos] > len(self.mapa):
+            raise ValueError(f"{self.caminho} está truncado")
+
+    def texto(self, indice):
+        inicio = self._inicio_textos
+        return str(self.mapa[inicio + self._inicios[indice]:inicio + self._inicios[indice + 1]], "utf-8")
+
+    @property
+    def textos(self):
+        """Todos os textos (decodificados uma vez)"""
+        if self._textos is None:
+            self._textos = [self.texto(indice) for indice in range(self.quantidade_textos)]
+        return self._textos
+
+    def gastos(self):
+        """Os gastos como dicts, um de cada vez (memória constante)"""
+        categorias = {}
+        for posicao in range(self.quantidade):
+            codigo = self.categorias[posicao]
+            categoria = categorias.get(codigo)
+            if categoria is None:
+                categoria = categorias[codigo] = self.texto(codigo)
+            yield {
+                "id": self.ids[posicao],
+                "descricao": self.texto(self.descricoes[posicao]),
+                "valor": self.valores[posicao],
+                "categoria": categoria,
+                "data": data_do_ordinal(self.datas[posicao])
+            }
+
+    def fechar(self):
+        # As memoryviews precisam ser liberadas antes de fechar o mapa
+        for visao in reversed(self.visoes):
+            visao.release()
+        self.visoes = []
+        self.bytes_colunas = {}
+        if self.mapa is not None:
+            self.mapa.close()
+            self.mapa = None
+        if self.arquivo is not None:
+            self.arquivo.close()
+            self.arquivo = None
+
+# ========== JOURNAL DE OPERAÇÕES ==========
+# Uma operação JSON por linha, aplicada sobre o snapshot:
+#   {"op": "add", "gasto": {...}}
+#   {"op": "add", "gastos": [...]}  (lote da importação, gravado de uma vez)
+#   {"op": "remove", "ids": [...]}   (linhas antigas usam "id": X)
+#   {"op": "clear"}
+# O app (carga e compactação) e o relatório leem e reaplicam o journal por aqui.
+def operacoes_journal(arquivo, limite=None):
+    """Operações de um journal aberto em modo binário, até o byte `limite`
+    (o tamanho na abertura; None lê até o fim)"""
+    arquivo.seek(0)
+    lidos = 0
+    for linha in arquivo:
+        lidos += len(linha)
+        if limite is not None and lidos > limite:
+            # Linha acrescentada depois da abertura: fica para a próxima leitura
+            return
+        try:
+            yield json.loads(linha)
+        except ValueError:
+            # Última linha incompleta (queda durante a escrita)
+            continue
+
+def ler_journal(caminho):
+    """Operações gravadas no journal em `caminho`, em ordem (nenhuma se ele não existir)"""
+    if not os.path.exists(caminho):
+        return
+    with open(caminho, "rb") as arquivo:
+        yield from operacoes_journal(arquivo)
+
+def gastos_da_operacao(operacao):
+    return operacao.get("gastos", [operacao.get("gasto", {})])
+
+def ids_removidos(operacao):
+    return operacao.get("ids", [operacao.get("id")])
+
+def reaplicar_journal(operacoes, incluir, remover, limpar):
+    """Reaplica as operações chamando incluir(gasto), remover(gasto_id) e
+    limpar() (as operações são idempotentes)"""
+    for operacao in operacoes:
+        tipo = operacao.get("op")
+        if tipo == "add":
+            for gasto in gastos_da_operacao(operacao):
+                incluir(gasto)
+        elif tipo == "remove":
+            for gasto_id in ids_removidos(operacao):
+                remover(gasto_id)
+        elif tipo == "clear":
+            limpar()
+
+# ========== LEITURA EM FLUXO ==========
+TAMANHO_BLOCO_LEITURA = 1024 * 1024
+_SEPARADORES_JSON = " \t\r\n,"
+
+def itens_array_json(arquivo, tamanho_bloco=TAMANHO_BLOCO_LEITURA):
+    """Objetos de um array JSON, um de cada vez, lendo o arquivo (texto) em blocos"""
+    nome = getattr(arquivo, "name", "O arquivo")
+    decodificador = json.JSONDecoder()
+    buffer = arquivo.read(tamanho_bloco).lstrip()
+    if not buffer:
+        return
+    if not buffer.startswith("["):
+        raise ValueError(f"{nome} não contém uma lista de gastos")
+    posicao = 1
+    fim_arquivo = False
+    while True:
+        while posicao < len(buffer) and buffer[posicao] in _SEPARADORES_JSON:
+            posicao += 1
+        if posicao < len(buffer) and buffer[posicao] == "]":
+            return
+        try:
+            if posicao >= len(buffer):
+                raise ValueError("bloco vazio")
+            item, fim = decodificador.raw_decode(buffer, posicao)
+        except ValueError:
+            # Objeto cortado no fim do bloco: lê mais e tenta de novo
+            if fim_arquivo:
+                raise ValueError(f"{nome} termina no meio de um gasto")
+            bloco = arquivo.read(tamanho_bloco)
+            fim_arquivo = not bloco
+            buffer = buffer[posicao:] + bloco
+            posicao = 0
+            continue
+        if not isinstance(item, dict):
+            raise ValueError(f"{nome} não contém uma lista de gastos")
+        yield item
+        posicao = fim
+
+def _abrir_json(pasta, pilha):
+    """Abre (em `pilha`) snapshot e journals sob o lock, guardando o tamanho
+    dos journals. Mapa e descritores continuam apontando para os mesmos
+    arquivos mesmo que uma compactação troque o snapshot depois: a leitura
+    vê um estado consistente"""
+    with TravaArquivo(os.path.join(pasta, ARQUIVO_LOCK)):
+        try:
+            with open(os.path.join(pasta, ARQUIVO_META), "r", encoding='utf-8') as f:
+                versao = json.load(f).get("versao")
+        except (OSError, ValueError):
+            versao = None
+        snapshot = None
+        if os.path.exists(os.path.join(pasta, ARQUIVO_SNAPSHOT)):
+            snapshot = pilha.enter_context(SnapshotBinario(os.path.join(pasta, ARQUIVO_SNAPSHOT)))
+        elif os.path.exists(os.path.join(pasta, ARQUIVO_DADOS)):
+            snapshot = pilha.enter_context(open(os.path.join(pasta, ARQUIVO_DADOS), "r", encoding='utf-8'))
+        journals = []
+        for nome in (ARQUIVO_JOURNAL_COMPACTANDO, ARQUIVO_JOURNAL):
+            caminho = os.path.join(pasta, nome)
+            if os.path.exists(caminho):
+                arquivo = pilha.enter_context(open(caminho, "rb"))
+                journals.append((arquivo, os.fstat(arquivo.fileno()).st_size))
+    return versao, snapshot, journals
+
+def _fluxo_json(snapshot, journals):
+    """Gastos do snapshot + journals. O journal (pequeno) é lido duas vezes:
+    primeiro para saber o que foi removido, limpo ou regravado, depois para
+    emitir as inclusões. Só os IDs do journal ficam em memória"""
+    removidos = set()
+    do_journal = set()
+    ultima_limpeza = -1
+    numero = 0
+    for arquivo, limite in journals:
+        for operacao in operacoes_journal(arquivo, limite):
+            tipo = operacao.get("op")
+            if tipo == "add":
+                do_journal.update(gasto.get("id") for gasto in gastos_da_operacao(operacao))
+            elif tipo == "remove":
+                removidos.update(ids_removidos(operacao))
+            elif tipo == "clear":
+                ultima_limpeza = numero
+            numero += 1
+
+    if snapshot is not None and ultima_limpeza < 0:
+        if isinstance(snapshot, SnapshotBinario):
+            gastos = snapshot.gastos()
+        else:
+            gastos = itens_array_json(snapshot)
+        for gasto in gastos:
+            gasto_id = gasto.get("id")
+            # Se o journal também traz o gasto (compactação interrompida), vale o do journal
+            if gasto_id not in removidos and gasto_id not in do_journal:
+                yield gasto
+
+    emitidos = set()
+    numero = 0
+    for arquivo, limite in journals:
+        for operacao in operacoes_journal(arquivo, limite):
+            if numero > ultima_limpeza and operacao.get("op") == "add":
+                for gasto in gastos_da_operacao(operacao):
+                    gasto_id = gasto.get("id")
+                    if gasto_id not in removidos and gasto_id not in emitidos:
+                        emitidos.add(gasto_id)
+                        yield gasto
+            numero += 1
+
+def _fluxo_sqlite(conexao):
+    cursor = conexao.execute("SELECT id, descricao, valor, categoria, data FROM gastos ORDER BY id")
+    for id_, descricao, valor, categoria, data in cursor:
+        yield {"id": id_, "descricao": descricao, "valor": valor, "categoria": categoria, "data": data}
+
+class LeituraEmFluxo:
+    """Gastos lidos um a um do armazenamento (uso: `with LeituraEmFluxo(...) as
+    leitura: for gasto in leitura.gastos(): ...`). `versao` é a versão dos
+    dados que está sendo lida"""
+
+    def __init__(self, motor=MOTOR_ARMAZENAMENTO, pasta="."):
+        if motor not in MOTORES:
+            raise ValueError(f"Motor de armazenamento desconhecido: {motor}")
+        self.motor = motor
+        self.pasta = pasta
+        self.versao = None
+        self.snapshot = None
+        self.journals = []
+        self.conexao = None
+        self.pilha = contextlib.ExitStack()
+
+    def __enter__(self):
+        try:
+            if self.motor == "sqlite":
+                caminho = os.path.join(self.pasta, ARQUIVO_SQLITE)
+                if not os.path.exists(caminho):
+                    raise FileNotFoundError(f"{caminho} não existe")
+                self.conexao = sqlite3.connect(f"file:{caminho}?mode=ro", uri=True)
+                self.pilha.callback(self.conexao.close)
+                # Uma transação de leitura: o relatório vê uma única versão dos dados
+                self.conexao.execute("BEGIN")
+                linha = self.conexao.execute("SELECT valor FROM meta WHERE chave = 'versao'").fetchone()
+                self.versao = int(linha[0]) if linha else None
+            else:
+                self.versao, self.snapshot, self.journals = _abrir_json(self.pasta, self.pilha)
+        except BaseException:
+            self.pilha.close()
+            raise
+        return self
+
+    def __exit__(self, *exc):
+        self.pilha.close()
+        return False
+
+    def gastos(self):
+        if self.motor == "sqlite":
+            return _fluxo_sqlite(self.conexao)
+        return _fluxo_json(self.snapshot, self.journals)
+
+# ========== RELATÓRIO ==========
+TABELAS_RELATORIO = {
+    "mensal": ["mes", "total", "quantidade"],
+    "categorias": ["categoria", "total", "quantidade"],
+    "mes_categoria": ["mes", "categoria", "total", "quantidade"],
+}
+
+class ResumoRelatorio:
+    """Totais por mês, por categoria e por mês × categoria, acumulados um
+    gasto por vez"""
+
+    def __init__(self, inicio=None, fim=None):
+        # Datas ISO (YYYY-MM-DD) comparam certo como texto
+        self.inicio = inicio.isoformat() if inicio else None
+        self.fim = fim.isoformat() if fim else None
+        self.total = 0.0
+        self.quantidade = 0
+        self.ignorados = 0
+        self.mes_categoria = {}
+
+    def adicionar(self, gasto):
+        data = gasto.get("data")
+        try:
+            valor = float(gasto.get("valor", 0))
+        except (TypeError, ValueError):
+            self.ignorados += 1
+            return
+        if not isinstance(data, str) or len(data) < 7:
+            self.ignorados += 1
+            return
+        if (self.inicio and data < self.inicio) or (self.fim and data > self.fim):
+            return
+        chave = (data[:7], gasto.get("categoria", "💼 Outros"))
+        celula = self.mes_categoria.get(chave)
+        if celula is None:
+            self.mes_categoria[chave] = [valor, 1]
+        else:
+            celula[0] += valor
+            celula[1] += 1
+        self.total += valor
+        self.quantidade += 1
+
+    def _somar_por(self, posicao):
+        somas = {}
+        for chave, (total, quantidade) in self.mes_categoria.items():
+            celula = somas.setdefault(chave[posicao], [0.0, 0])
+            celula[0] += total
+            celula[1] += quantidade
+        return somas
+
+    def linhas(self, tabela):
+        """Linhas (dicts) de uma das TABELAS_RELATORIO"""
+        if tabela == "mensal":
+            return [
+                {"mes": mes, "total": round(total, 2), "quantidade": quantidade}
+                for mes, (total, quantidade) in sorted(self._somar_por(0).items())
+            ]
+        if tabela == "categorias":
+            return [
+                {"categoria": categoria, "total": round(total, 2), "quantidade": quantidade}
+                for categoria, (total, quantidade) in sorted(
+                    self._somar_por(1).items(), key=lambda item: item[1][0], reverse=True
+                )
+            ]
+        return [
+            {"mes": mes, "categoria": categoria, "total": round(total, 2), "quantidade": quantidade}
+            for (mes, categoria), (total, quantidade) in sorted(self.mes_categoria.items())
+        ]
+
+def gerar_relatorio(motor=MOTOR_ARMAZENAMENTO, pasta=".", inicio=None, fim=None):
+    """Lê todos os gastos em fluxo e devolve (ResumoRelatorio, versão lida)"""
+    resumo = ResumoRelatorio(inicio, fim)
+    with LeituraEmFluxo(motor, pasta) as leitura:
+        for gasto in leitura.gastos():
+            resumo.adicionar(gasto)
+    return resumo, leitura.versao
+
+def escrever_csv(resumo, tabela, saida):
+    escritor = csv.DictWriter(saida, fieldnames=TABELAS_RELATORIO[tabela])
+    escritor.writeheader()
+    escritor.writerows(resumo.linhas(tabela))
+
+def escrever_json(resumo, saida, **cabecalho):
+    relatorio = dict(cabecalho)
+    relatorio.update({
+        "total": round(resumo.total, 2),
+        "quantidade": resumo.quantidade,
+        "ignorados": resumo.ignorados,
+    })
+    for tabela in TABELAS_RELATORIO:
+        relatorio[tabela] = resumo.linhas(tabela)
+    json.dump(relatorio, saida, ensure_ascii=False, indent=2)
+    saida.write("\n")
+
+# ========== BACKUP (BLOCOS POR CONTEÚDO) ==========
+# Cada arquivo de dados é cortado em blocos com fronteiras definidas pelo
+# próprio conteúdo (hash de uma janela de JANELA_BLOCOS bytes): incluir ou
+# remover bytes no meio do arquivo só muda os blocos em volta da alteração.
+# Os blocos ficam em blocos/ com o sha256 como nome (cada um gravado uma única
+# vez) e cada ponto de restauração é só um manifesto JSON em pontos/.
+PASTA_BACKUP = os.environ.get("FINANCEPRO_PASTA_BACKUP", ".financepro_backup")
+JANELA_BLOCOS = 16
+MASCARA_FRONTEIRA = (1 << 16) - 1  # blocos de ~64 KiB em média
+TAMANHO_MINIMO_BLOCO = 16 * 1024
+TAMANHO_MAXIMO_BLOCO = 256 * 1024
+TAMANHO_TRECHO_BACKUP = 8 * 1024 * 1024
+# Mantém os últimos pontos, o último de cada dia e o último de cada semana
+RETENCAO_BACKUP = {"recentes": 20, "dias": 14, "semanas": 8}
+
+@functools.lru_cache(maxsize=1)
+def _tabelas_gear():
+    """Tabela de 256 valores de 32 bits derivada do sha256 (igual em qualquer
+    máquina), girada 0..JANELA_BLOCOS-1 bits: uma por posição da janela"""
+    import numpy as np
+    base = np.array(
+        [int.from_bytes(hashlib.sha256(bytes([byte])).digest()[:4], "little") for byte in range(256)],
+        dtype=np.uint32
+    )
+    return [base] + [(base << np.uint32(k)) | (base >> np.uint32(32 - k)) for k in range(1, JANELA_BLOCOS)]
+
+def fronteiras_blocos(dados):
+    """Onde termina cada bloco de `dados` (bytes): o hash da janela é
+    calculado para todas as posições de uma vez, por trecho, com numpy"""
+    import numpy as np
+    todos = np.frombuffer(dados, dtype=np.uint8)
+    candidatos = []
+    for inicio in range(0, len(todos), TAMANHO_TRECHO_BACKUP):
+        # Começa JANELA_BLOCOS-1 bytes antes para a janela das primeiras posições ficar completa
+        origem = max(0, inicio - JANELA_BLOCOS + 1)
+        trecho = todos[origem:inicio + TAMANHO_TRECHO_BACKUP]
+        hashes = np.zeros(len(trecho), dtype=np.uint32)
+        for deslocamento, tabela in enumerate(_tabelas_gear()):
+            if deslocamento < len(trecho):
+                hashes[deslocamento:] ^= tabela[trecho[:len(trecho) - deslocamento]]
+        posicoes = np.flatnonzero((hashes & np.uint32(MASCARA_FRONTEIRA)) == 0) + origem
+        candidatos.append(posicoes[posicoes >= inicio] + 1)
+
+    fronteiras = []
+    ultima = 0
+    for candidato in (np.concatenate(candidatos).tolist() if candidatos else []):
+        while candidato - ultima > TAMANHO_MAXIMO_BLOCO:
+            ultima += TAMANHO_MAXIMO_BLOCO
+            fronteiras.append(ultima)
+        if candidato - ultima >= TAMANHO_MINIMO_BLOCO:
+            fronteiras.append(candidato)
+            ultima = candidato
+    while len(todos) - ultima > TAMANHO_MAXIMO_BLOCO:
+        ultima += TAMANHO_MAXIMO_BLOCO
+        fronteiras.append(ultima)
+    if ultima < len(todos):
+        fronteiras.append(len(todos))
+    return fronteiras
+
+class ArmazemBackup:
+    """Pontos de restauração deduplicados. `criar_ponto` recebe
+    {nome: (identidade, ler)}: se a identidade do arquivo (inode, tamanho,
+    mtime...) é a mesma do ponto anterior, a lista de blocos é reaproveitada
+    sem ler nada; senão o conteúdo é lido aos trechos com `ler(n)` (como
+    `arquivo.read`, b"" no fim) e só os blocos novos são gravados. Um backup
+    custa o tamanho do que mudou"""
+
+    def __init__(self, pasta=PASTA_BACKUP):
+        self.pasta = pasta
+        self.pasta_blocos = os.path.join(pasta, "blocos")
+        self.pasta_pontos = os.path.join(pasta, "pontos")
+        os.makedirs(self.pasta_blocos, exist_ok=True)
+        os.makedirs(self.pasta_pontos, exist_ok=True)
+        # Coleta de lixo e criação de pontos não podem se cruzar (nem entre processos)
+        self.lock = TravaArquivo(os.path.join(pasta, "backup.lock"))
+
+    def _caminho_bloco(self, resumo):
+        return os.path.join(self.pasta_blocos, resumo[:2], resumo)
+
+    def _gravar_blocos(self, ler):
+        """Lê o arquivo em trechos de TAMANHO_TRECHO_BACKUP e grava os blocos
+        novos; devolve (resumos, tamanho). O último bloco de cada trecho pode
+        continuar no seguinte, então ele volta para o começo do próximo: as
+        fronteiras saem iguais às do arquivo inteiro, sem tê-lo todo na memória"""
+        resumos = []
+        tamanho = 0
+        resto = b""
+        while True:
+            trecho = ler(TAMANHO_TRECHO_BACKUP)
+            tamanho += len(trecho)
+            dados = resto + trecho if resto else trecho
+            fronteiras = fronteiras_blocos(dados)
+            if trecho:
+                fronteiras = fronteiras[:-1]
+            visao = memoryview(dados)
+            inicio = 0
+            for fim in fronteiras:
+                bloco = visao[inicio:fim]
+                resumo = hashlib.sha256(bloco).hexdigest()
+                caminho = self._caminho_bloco(resumo)
+                if not os.path.exists(caminho):
+                    os.makedirs(os.path.dirname(caminho), exist_ok=True)
+                    comprimido = zlib.compress(bloco, 1)
+                    gravar_atomico(caminho, lambda f: f.write(comprimido), binario=True)
+                resumos.append(resumo)
+                inicio = fim
+            visao.release()
+            resto = dados[inicio:]
+            if not trecho:
+                return resumos, tamanho
+
+    def pontos(self):
+        """Manifestos dos pontos, do mais antigo para o mais recente"""
+        pontos = []
+        for nome in sorted(os.listdir(self.pasta_pontos)):
+            if not nome.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.pasta_pontos, nome), "r", encoding='utf-8') as f:
+                    ponto = json.load(f)
+            except (OSError, ValueError):
+                continue
+            ponto["nome"] = nome
+            pontos.append(ponto)
+        return pontos
+
+    def criar_ponto(self, arquivos, **metadados):
+        """Grava um ponto com os arquivos dados e aplica a retenção; devolve o manifesto"""
+        with self.lock:
+            anteriores = self.pontos()
+            arquivos_anteriores = anteriores[-1]["arquivos"] if anteriores else {}
+            manifesto = {"criado_em": datetime.now().isoformat(timespec="seconds")}
+            manifesto.update(metadados)
+            manifesto["arquivos"] = {}
+            for nome, (identidade, ler) in arquivos.items():
+                anterior = arquivos_anteriores.get(nome)
+                if identidade is not None and anterior is not None and anterior["identidade"] == list(identidade):
+                    manifesto["arquivos"][nome] = anterior
+                    continue
+                blocos, tamanho = self._gravar_blocos(ler)
+                manifesto["arquivos"][nome] = {
+                    "identidade": list(identidade) if identidade is not None else None,
+                    "tamanho": tamanho,
+                    "blocos": blocos
+                }
+
+            nome = f"{datetime.now():%Y%m%dT%H%M%S%f}-{os.getpid()}.json"
+            gravar_atomico(
+                os.path.join(self.pasta_pontos, nome),
+                lambda f: json.dump(manifesto, f, ensure_ascii=False)
+            )
+            manifesto["nome"] = nome
+            self.aplicar_retencao()
+            return manifesto
+
+    def aplicar_retencao(self, agora=None):
+        """Apaga os pontos fora da política de retenção e os blocos que ficaram sem uso"""
+        with self.lock:
+            pontos = self.pontos()
+            agora = agora or datetime.now()
+            manter = {ponto["nome"] for ponto in pontos[-RETENCAO_BACKUP["recentes"]:]}
+            ultimos_por_periodo = {}
+            for ponto in pontos:
+                criado = datetime.fromisoformat(ponto["criado_em"])
+                dias = (agora.date() - criado.date()).days
+                if dias < RETENCAO_BACKUP["dias"]:
+                    ultimos_por_periodo[("dia", criado.date())] = ponto["nome"]
+                if dias < RETENCAO_BACKUP["semanas"] * 7:
+                    ultimos_por_periodo[("semana", criado.isocalendar()[:2])] = ponto["nome"]
+            manter.update(ultimos_por_periodo.values())
+
+            removidos = [ponto for ponto in pontos if ponto["nome"] not in manter]
+            for ponto in removidos:
+                os.remove(os.path.join(self.pasta_pontos, ponto["nome"]))
+            if removidos:
+                self.coletar_lixo([ponto for ponto in pontos if ponto["nome"] in manter])
+            return len(removidos)
+
+    def coletar_lixo(self, pontos=None):
+        """Remove os blocos que nenhum ponto usa; devolve quantos foram removidos"""
+        with self.lock:
+            usados = set()
+            for ponto in (self.pontos() if pontos is None else pontos):
+                for arquivo in ponto["arquivos"].values():
+                    usados.update(arquivo["blocos"])
+            removidos = 0
+            for raiz, _, nomes in os.walk(self.pasta_blocos):
+                for nome in nomes:
+                    if nome not in usados:
+                        os.remove(os.path.join(raiz, nome))
+                        removidos += 1
+            return removidos
+
+    def tamanho_em_disco(self):
+        return sum(
+            os.path.getsize(os.path.join(raiz, nome))
+            for raiz, _, nomes in os.walk(self.pasta) for nome in nomes
+        )
+
+    def extrair(self, ponto, nome, destino):
+        """Escreve em `destino` (binário) o conteúdo de `nome` no ponto, conferindo cada bloco"""
+        for resumo in ponto["arquivos"][nome]["blocos"]:
+            with open(self._caminho_bloco(resumo), "rb") as f:
+                bloco = zlib.decompress(f.read())
+            if hashlib.sha256(bloco).hexdigest() != resumo:
+                raise ValueError(f"Bloco {resumo[:12]} do backup está corrompido")
+            destino.write(bloco)
+
+    def ler(self, ponto, nome):
+        saida = io.BytesIO()
+        self.extrair(ponto, nome, saida)
+        return saida.getvalue()
+
+def leitor_arquivo_aberto(arquivo, tamanho):
+    """Função `ler(n)` que percorre só os primeiros `tamanho` bytes de um
+    arquivo já aberto em modo binário"""
+    arquivo.seek(0)
+    restante = tamanho
+
+    def ler(n):
+        nonlocal restante
+        dados = arquivo.read(min(n, restante))
+        restante -= len(dados)
+        return dados
+    return ler
+
+# ========== LINHA DE COMANDO ==========
+def comando_report(args):
+    resumo, versao = gerar_relatorio(args.motor, args.pasta, args.inicio, args.fim)
+
+    def escrever(saida):
+        if args.formato == "json":
+            escrever_json(
+                resumo, saida,
+                gerado_em=datetime.now().isoformat(timespec="seconds"),
+                motor=args.motor,
+                versao=versao,
+                inicio=args.inicio.isoformat() if args.inicio else None,
+                fim=args.fim.isoformat() if args.fim else None
+            )
+        else:
+            escrever_csv(resumo, args.tabela, saida)
+
+    if args.saida == "-":
+        escrever(sys.stdout)
+    else:
+        gravar_atomico(args.saida, escrever)
+        print(f"{resumo.quantidade:,} gastos resumidos em {args.saida}", file=sys.stderr)
+    return 0
+
+def main(argumentos=None):
+    parser = argparse.ArgumentParser(prog="financepro", description="FinancePro sem interface")
+    subcomandos = parser.add_subparsers(dest="comando", required=True)
+
+    report = subcomandos.add_parser("report", help="Resumo mensal e por categoria, lendo os dados em fluxo")
+    report.add_argument("--motor", choices=MOTORES, default=MOTOR_ARMAZENAMENTO,
+                        help="Motor de armazenamento")
+    report.add_argument("--pasta", default=".", help="Pasta com os arquivos de dados")
+    report.add_argument("--formato", choices=["csv", "json"], default="csv")
+    report.add_argument("--tabela", choices=list(TABELAS_RELATORIO), default="mensal",
+                        help="Tabela do CSV (o JSON traz todas)")
+    report.add_argument("--inicio", type=date.fromisoformat, help="Primeira data (YYYY-MM-DD)")
+    report.add_argument("--fim", type=date.fromisoformat, help="Última data (YYYY-MM-DD)")
+    report.add_argument("--saida", default="-", help="Arquivo de saída (padrão: saída padrão)")
+    report.set_defaults(executar=comando_report)
+
+    args = parser.parse_args(argumentos)
+    try:
+        return args.executar(args)
+    except (OSError, ValueError, sqlite3.Error) as e:
+        print(f"❌ Erro ao gerar o relatório: {e}", file=sys.stderr)
+        return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
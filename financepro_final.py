@@ -1,16 +1,36 @@
 import streamlit as st
-import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
-from datetime import datetime, timedelta
+from array import array
+from datetime import date, datetime, timedelta
+import bisect
+import collections
+import collections.abc
+import contextlib
+import functools
+import heapq
+import itertools
 import json
+import math
 import os
 import random
-from streamlit_lottie import st_lottie
-import requests
+import re
+import sys
+import time
 import hashlib
 import io
 import base64
+import sqlite3
+import tempfile
+import threading
+import unicodedata
+import uuid
+
+from financepro_core import (
+    ARQUIVO_DADOS, ARQUIVO_DADOS_MIGRADO, ARQUIVO_JOURNAL, ARQUIVO_JOURNAL_COMPACTANDO,
+    ARQUIVO_LOCK, ARQUIVO_META, ARQUIVO_SNAPSHOT, ARQUIVO_SQLITE, MOTOR_ARMAZENAMENTO,
+    PASTA_BACKUP, ArmazemBackup, SnapshotBinario, TravaArquivo, data_do_ordinal, escrever_snapshot,
+    escrever_temporario, gastos_da_operacao, gravar_atomico, ids_removidos, itens_array_json,
+    leitor_arquivo_aberto, ler_journal, ordinal_da_data, reaplicar_journal
+)
 
 # ========== CONFIGURAÇÃO ==========
 st.set_page_config(
@@ -118,43 +138,3001 @@ class ValidadorApp:
             'usuario': f"user_{random.randint(1000, 9999)}"
         }
         
-        with open(self.arquivo_validacao, 'w') as f:
-            json.dump(dados_config, f)
+        gravar_atomico(self.arquivo_validacao, lambda f: json.dump(dados_config, f))
+
+@st.cache_resource
+def aplicacao_validada():
+    """Valida uma vez por processo, não a cada rerun (uma exceção não fica
+    em cache: a validação é tentada de novo no próximo rerun)"""
+    return ValidadorApp().validar_aplicacao()
+
+# ========== INSTRUMENTAÇÃO ==========
+# Ligada com FINANCEPRO_DIAGNOSTICO=1. Desligada, medir() devolve a própria
+# função (custo zero) e contar() só testa uma flag.
+DIAGNOSTICO_ATIVO = os.environ.get("FINANCEPRO_DIAGNOSTICO", "") not in ("", "0")
+ARQUIVO_METRICAS = os.environ.get("FINANCEPRO_METRICAS_ARQUIVO", "financepro_metricas.prom")
+
+class Metricas:
+    """Tempos por seção e contadores de eventos, acumulados no processo"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # {seção: [chamadas, soma, máximo, última]}
+        self.tempos = {}
+        self.contadores = {}
+
+    def registrar_tempo(self, nome, segundos):
+        with self.lock:
+            tempo = self.tempos.get(nome)
+            if tempo is None:
+                self.tempos[nome] = [1, segundos, segundos, segundos]
+            else:
+                tempo[0] += 1
+                tempo[1] += segundos
+                tempo[2] = max(tempo[2], segundos)
+                tempo[3] = segundos
+
+    def somar(self, nome, quantidade=1):
+        with self.lock:
+            self.contadores[nome] = self.contadores.get(nome, 0) + quantidade
+
+    def como_prometheus(self):
+        """Texto no formato de exposição do Prometheus"""
+        with self.lock:
+            tempos = {nome: list(tempo) for nome, tempo in self.tempos.items()}
+            contadores = dict(self.contadores)
+        linhas = [
+            "# HELP financepro_duracao_segundos Tempo gasto em cada seção do FinancePro",
+            "# TYPE financepro_duracao_segundos summary"
+        ]
+        for nome, (chamadas, soma, _, _) in sorted(tempos.items()):
+            linhas.append(f'financepro_duracao_segundos_count{{secao="{nome}"}} {chamadas}')
+            linhas.append(f'financepro_duracao_segundos_sum{{secao="{nome}"}} {soma:.6f}')
+        linhas += [
+            "# HELP financepro_duracao_maxima_segundos Maior duração observada de cada seção",
+            "# TYPE financepro_duracao_maxima_segundos gauge"
+        ]
+        for nome, (_, _, maximo, _) in sorted(tempos.items()):
+            linhas.append(f'financepro_duracao_maxima_segundos{{secao="{nome}"}} {maximo:.6f}')
+        linhas += [
+            "# HELP financepro_eventos_total Reruns, registros percorridos, acertos e faltas de cache",
+            "# TYPE financepro_eventos_total counter"
+        ]
+        for nome, valor in sorted(contadores.items()):
+            linhas.append(f'financepro_eventos_total{{evento="{nome}"}} {valor}')
+        return "\n".join(linhas) + "\n"
+
+    def gravar(self, caminho=ARQUIVO_METRICAS):
+        conteudo = self.como_prometheus()
+        gravar_atomico(caminho, lambda f: f.write(conteudo))
+
+@st.cache_resource
+def obter_metricas():
+    return Metricas()
+
+def medir(nome):
+    """Decorador: acumula o tempo de cada chamada na seção `nome`"""
+    def decorador(funcao):
+        if not DIAGNOSTICO_ATIVO:
+            return funcao
+
+        @functools.wraps(funcao)
+        def medida(*args, **kwargs):
+            inicio = time.perf_counter()
+            try:
+                return funcao(*args, **kwargs)
+            finally:
+                obter_metricas().registrar_tempo(nome, time.perf_counter() - inicio)
+        return medida
+    return decorador
+
+def contar(nome, quantidade=1):
+    """Soma `quantidade` ao contador `nome`"""
+    if DIAGNOSTICO_ATIVO:
+        obter_metricas().somar(nome, quantidade)
+
+# ========== FUNÇÕES AUXILIARES ==========
+# Animações Lottie: baixadas em segundo plano para um cache em disco; a
+# renderização nunca espera a rede. Enquanto (ou se) o download não der
+# certo, usa-se uma animação simples embutida no código.
+PASTA_CACHE_LOTTIE = os.environ.get("FINANCEPRO_CACHE_LOTTIE", ".financepro_cache/lottie")
+TIMEOUT_LOTTIE = 5
+# Depois de uma falha, a URL só é tentada de novo depois desse intervalo
+NOVA_TENTATIVA_LOTTIE_SEGUNDOS = 6 * 60 * 60
+
+def _animacao_embutida(cor):
+    """Animação mínima (círculo pulsando) usada quando não há rede"""
+    r, g, b = (int(cor[i:i + 2], 16) / 255 for i in (1, 3, 5))
+    return {
+        "v": "5.7.4", "fr": 30, "ip": 0, "op": 60, "w": 200, "h": 200, "nm": "financepro", "ddd": 0,
+        "assets": [],
+        "layers": [{
+            "ddd": 0, "ind": 1, "ty": 4, "nm": "circulo", "sr": 1, "ip": 0, "op": 60, "st": 0, "bm": 0,
+            "ao": 0,
+            "ks": {
+                "o": {"a": 0, "k": 100}, "r": {"a": 0, "k": 0},
+                "p": {"a": 0, "k": [100, 100, 0]}, "a": {"a": 0, "k": [0, 0, 0]},
+                "s": {"a": 1, "k": [
+                    {"t": 0, "s": [80, 80, 100], "i": {"x": [0.5], "y": [1]}, "o": {"x": [0.5], "y": [0]}},
+                    {"t": 30, "s": [100, 100, 100], "i": {"x": [0.5], "y": [1]}, "o": {"x": [0.5], "y": [0]}},
+                    {"t": 60, "s": [80, 80, 100]}
+                ]}
+            },
+            "shapes": [
+                {"ty": "el", "nm": "elipse", "d": 1, "p": {"a": 0, "k": [0, 0]}, "s": {"a": 0, "k": [120, 120]}},
+                {"ty": "fl", "nm": "cor", "c": {"a": 0, "k": [r, g, b, 1]}, "o": {"a": 0, "k": 100}, "r": 1}
+            ]
+        }]
+    }
+
+class CacheLottie:
+    """Animações em memória + disco, com cache negativo de falhas e
+    download em segundo plano"""
+
+    def __init__(self, pasta=PASTA_CACHE_LOTTIE):
+        self.pasta = pasta
+        self.lock = threading.Lock()
+        self.memoria = {}
+        self.pendentes = set()
+        self.thread = None
+
+    def _caminho(self, url, extensao):
+        nome = hashlib.sha1(url.encode("utf-8")).hexdigest()
+        return os.path.join(self.pasta, f"{nome}.{extensao}")
+
+    def _ler_disco(self, url):
+        try:
+            with open(self._caminho(url, "json"), "r", encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _falhou_recentemente(self, url):
+        try:
+            with open(self._caminho(url, "falha"), "r", encoding='utf-8') as f:
+                return time.time() - float(f.read()) < NOVA_TENTATIVA_LOTTIE_SEGUNDOS
+        except (OSError, ValueError):
+            return False
+
+    def _gravar(self, caminho, conteudo):
+        os.makedirs(self.pasta, exist_ok=True)
+        gravar_atomico(caminho, lambda f: f.write(conteudo))
+
+    @medir("lottie.baixar")
+    def baixar(self, url):
+        """Download (bloqueante, só chamado pela thread de segundo plano)"""
+        import requests
+        try:
+            r = requests.get(url, timeout=TIMEOUT_LOTTIE)
+            if r.status_code == 200:
+                animacao = r.json()
+                self._gravar(self._caminho(url, "json"), json.dumps(animacao))
+                with self.lock:
+                    self.memoria[url] = animacao
+                return animacao
+        except Exception:
+            pass
+        try:
+            self._gravar(self._caminho(url, "falha"), str(time.time()))
+        except OSError:
+            pass
+        return None
+
+    def _processar_pendentes(self):
+        while True:
+            with self.lock:
+                if not self.pendentes:
+                    self.thread = None
+                    return
+                url = self.pendentes.pop()
+            self.baixar(url)
+
+    def agendar(self, urls):
+        """Coloca na fila as URLs que ainda não estão em cache nem falharam há pouco"""
+        with self.lock:
+            for url in urls:
+                if url in self.memoria or url in self.pendentes:
+                    continue
+                if os.path.exists(self._caminho(url, "json")) or self._falhou_recentemente(url):
+                    continue
+                self.pendentes.add(url)
+            if self.pendentes and self.thread is None:
+                self.thread = threading.Thread(target=self._processar_pendentes, daemon=True)
+                self.thread.start()
+
+    def obter(self, url):
+        """Animação em cache (memória ou disco) ou None, sem tocar na rede"""
+        with self.lock:
+            if url in self.memoria:
+                contar("cache_lottie.memoria")
+                return self.memoria[url]
+        animacao = self._ler_disco(url)
+        if animacao is not None:
+            contar("cache_lottie.disco")
+            with self.lock:
+                self.memoria[url] = animacao
+        else:
+            contar("cache_lottie.falta")
+        return animacao
+
+@st.cache_resource
+def obter_cache_lottie():
+    """Cache de animações compartilhado pelo processo; dispara o download
+    em segundo plano de todas as ANIMACOES assim que é criado"""
+    cache = CacheLottie()
+    cache.agendar(ANIMACOES.values())
+    return cache
+
+def carregar_lottie_url(url: str):
+    """Carrega animação Lottie do cache, sem esperar pela rede"""
+    try:
+        cache = obter_cache_lottie()
+        animacao = cache.obter(url)
+        if animacao is not None:
+            return animacao
+        cache.agendar([url])
+    except Exception:
+        pass
+    nome = next((nome for nome, endereco in ANIMACOES.items() if endereco == url), None)
+    return ANIMACOES_EMBUTIDAS.get(nome)
+
+# ========== ARMAZENAMENTO ==========
+# Motores plugáveis, escolhidos pela variável de ambiente
+# FINANCEPRO_ARMAZENAMENTO:
+#   "json"   - snapshot binário colunar (mapeado em memória na leitura) +
+#              journal JSONL de operações (padrão; o nome vem do snapshot
+#              em JSON das versões anteriores, migrado na primeira gravação)
+#   "sqlite" - banco SQLite indexado, com agregações feitas em SQL
+# Todos recebem as mesmas operações do journal (formato e reaplicação em
+# financepro_core, seção JOURNAL DE OPERAÇÕES).
+#
+# Várias sessões (e processos) gravam no mesmo armazenamento. As escritas
+# são serializadas por um lock de arquivo, os IDs são reservados no próprio
+# armazenamento e cada escrita incrementa uma versão: a sessão que percebe
+# que a versão andou sem ela recarrega os dados em vez de sobrescrevê-los.
+# Nomes dos arquivos, TravaArquivo e gravar_atomico ficam em financepro_core
+# (usados também pelo relatório em linha de comando, sem Streamlit).
+LIMITE_JOURNAL_BYTES = 1024 * 1024
+
+def _ler_snapshot():
+    """Lê o snapshot (lista de gastos): o binário ou, antes da primeira
+    gravação nesse formato, o JSON antigo"""
+    if os.path.exists(ARQUIVO_SNAPSHOT):
+        with SnapshotBinario(ARQUIVO_SNAPSHOT) as snapshot:
+            return list(snapshot.gastos())
+    if not os.path.exists(ARQUIVO_DADOS):
+        return []
+    with open(ARQUIVO_DADOS, "r", encoding='utf-8') as f:
+        dados = json.load(f)
+    if isinstance(dados, list) and all(isinstance(item, dict) for item in dados):
+        return dados
+    raise ValueError(f"{ARQUIVO_DADOS} não contém uma lista de gastos")
+
+def _identidade(caminho):
+    """(inode, tamanho, modificação) do arquivo, ou None se não existir"""
+    try:
+        info = os.stat(caminho)
+    except FileNotFoundError:
+        return None
+    return (info.st_ino, info.st_size, info.st_mtime_ns)
+
+def _aplicar_journal(gastos_por_id, caminho):
+    """Reaplica as operações de um journal sobre os gastos indexados por ID"""
+    reaplicar_journal(
+        ler_journal(caminho),
+        incluir=lambda gasto: gastos_por_id.__setitem__(gasto.get("id"), gasto),
+        remover=lambda gasto_id: gastos_por_id.pop(gasto_id, None),
+        limpar=gastos_por_id.clear
+    )
+
+def _aplicar_journal_tabela(tabela, caminho):
+    """Reaplica as operações de um journal sobre uma TabelaGastos; devolve a
+    tabela resultante (outra, se houve um "clear")"""
+    def incluir(gasto):
+        # Compactação interrompida: o gasto pode já estar no snapshot
+        tabela.remover(gasto.get("id") or 0)
+        tabela.append(gasto)
+
+    def limpar():
+        nonlocal tabela
+        tabela = TabelaGastos()
+
+    reaplicar_journal(ler_journal(caminho), incluir, lambda gasto_id: tabela.remover(gasto_id), limpar)
+    return tabela
+
+def _aposentar_json_antigo():
+    """Depois do primeiro snapshot binário, o JSON antigo fica desatualizado:
+    é guardado como .migrado (com o lock adquirido)"""
+    if os.path.exists(ARQUIVO_DADOS):
+        os.replace(ARQUIVO_DADOS, ARQUIVO_DADOS_MIGRADO)
+
+def _ler_estado():
+    """Snapshot + journals reaplicados (as operações são idempotentes)"""
+    gastos_por_id = {gasto.get("id"): gasto for gasto in _ler_snapshot()}
+    _aplicar_journal(gastos_por_id, ARQUIVO_JOURNAL_COMPACTANDO)
+    _aplicar_journal(gastos_por_id, ARQUIVO_JOURNAL)
+    return list(gastos_por_id.values())
+
+class ArmazenamentoJSON:
+    """Snapshot binário + journal: inclusões e remoções são linhas acrescentadas,
+    e a compactação em segundo plano incorpora o journal ao snapshot.
+    Versão e último ID reservado ficam em ARQUIVO_META"""
+    agrega_no_banco = False
+
+    def __init__(self):
+        self.lock = TravaArquivo(ARQUIVO_LOCK)
+        self.compactacao = None
+
+    def _ler_meta(self):
+        """{"versao", "ultimo_id"} (chamado com o lock adquirido)"""
+        try:
+            with open(ARQUIVO_META, "r", encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            # Dados de antes do controle de versão: o último ID vem dos gastos
+            ultimo_id = max((gasto.get("id") or 0 for gasto in _ler_estado()), default=0)
+            meta = {"versao": 0, "ultimo_id": ultimo_id}
+            self._gravar_meta(meta)
+            return meta
+
+    def _gravar_meta(self, meta):
+        gravar_atomico(ARQUIVO_META, lambda f: json.dump(meta, f))
+
+    def _nova_versao(self):
+        """Incrementa a versão (com o lock adquirido); devolve (anterior, nova)"""
+        meta = self._ler_meta()
+        anterior = meta["versao"]
+        meta["versao"] = anterior + 1
+        self._gravar_meta(meta)
+        return anterior, meta["versao"]
+
+    def versao(self):
+        with self.lock:
+            return self._ler_meta()["versao"]
+
+    def reservar_ids(self, quantidade):
+        """Reserva `quantidade` IDs consecutivos e devolve o primeiro"""
+        with self.lock:
+            meta = self._ler_meta()
+            primeiro = meta["ultimo_id"] + 1
+            meta["ultimo_id"] += quantidade
+            self._gravar_meta(meta)
+        return primeiro
+
+    def carregar(self):
+        """Snapshot com o journal reaplicado"""
+        with self.lock:
+            dados = _ler_estado()
+        self._compactar_se_grande()
+        return dados
+
+    def carregar_tabela(self):
+        """TabelaGastos com as colunas copiadas em bloco do snapshot binário
+        mapeado (sem interpretar registro por registro) e o journal reaplicado"""
+        with self.lock:
+            if os.path.exists(ARQUIVO_SNAPSHOT):
+                with SnapshotBinario(ARQUIVO_SNAPSHOT) as snapshot:
+                    tabela = TabelaGastos.de_snapshot(snapshot)
+            else:
+                tabela = TabelaGastos.de_registros(_ler_snapshot())
+            tabela = _aplicar_journal_tabela(tabela, ARQUIVO_JOURNAL_COMPACTANDO)
+            tabela = _aplicar_journal_tabela(tabela, ARQUIVO_JOURNAL)
+        self._compactar_se_grande()
+        return tabela
+
+    def _compactar_se_grande(self):
+        if os.path.exists(ARQUIVO_JOURNAL) and os.path.getsize(ARQUIVO_JOURNAL) >= LIMITE_JOURNAL_BYTES:
+            self.iniciar_compactacao()
+
+    def salvar(self, dados):
+        """Grava o snapshot completo (atomicamente) e descarta o journal já incorporado"""
+        with self.lock:
+            gravar_atomico(ARQUIVO_SNAPSHOT, lambda f: escrever_snapshot(f, dados), binario=True)
+            _aposentar_json_antigo()
+            for caminho in (ARQUIVO_JOURNAL, ARQUIVO_JOURNAL_COMPACTANDO):
+                if os.path.exists(caminho):
+                    os.remove(caminho)
+            return self._nova_versao()
+
+    def aplicar(self, operacao):
+        """Acrescenta a operação ao journal sem reescrever o snapshot.
+        Devolve (versão anterior, versão nova)"""
+        with self.lock:
+            with open(ARQUIVO_JOURNAL, "a", encoding='utf-8') as f:
+                f.write(json.dumps(operacao, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            tamanho_journal = os.path.getsize(ARQUIVO_JOURNAL)
+            versoes = self._nova_versao()
+
+        if tamanho_journal >= LIMITE_JOURNAL_BYTES:
+            self.iniciar_compactacao()
+        return versoes
+
+    @staticmethod
+    def _identidade_snapshot():
+        return tuple(
+            _identidade(caminho) for caminho in (ARQUIVO_SNAPSHOT, ARQUIVO_DADOS, ARQUIVO_JOURNAL_COMPACTANDO)
+        )
+
+    @medir("armazenamento.compactar")
+    def compactar(self):
+        """Incorpora o journal ao snapshot (não muda o conteúdo nem a versão)"""
+        with self.lock:
+            # Novas operações passam a ir para um journal vazio enquanto compactamos
+            if os.path.exists(ARQUIVO_JOURNAL) and not os.path.exists(ARQUIVO_JOURNAL_COMPACTANDO):
+                os.replace(ARQUIVO_JOURNAL, ARQUIVO_JOURNAL_COMPACTANDO)
+            if not os.path.exists(ARQUIVO_JOURNAL_COMPACTANDO):
+                return
+            # Outro processo pode compactar ao mesmo tempo: só vale o resultado
+            # se snapshot e journal ainda forem os mesmos arquivos no final
+            origem = self._identidade_snapshot()
+
+        # A parte cara (ler e reescrever o snapshot) roda fora do lock
+        try:
+            gastos_por_id = {gasto.get("id"): gasto for gasto in _ler_snapshot()}
+            _aplicar_journal(gastos_por_id, ARQUIVO_JOURNAL_COMPACTANDO)
+            arquivo_temporario = escrever_temporario(
+                ARQUIVO_SNAPSHOT,
+                lambda f: escrever_snapshot(f, gastos_por_id.values()),
+                binario=True
+            )
+        except Exception:
+            # O journal continua válido; tentamos de novo na próxima escrita
+            return
+
+        with self.lock:
+            # salvar() (ou outro processo) pode ter gravado um snapshot novo no meio do caminho
+            if self._identidade_snapshot() != origem:
+                os.remove(arquivo_temporario)
+                return
+            os.replace(arquivo_temporario, ARQUIVO_SNAPSHOT)
+            _aposentar_json_antigo()
+            os.remove(ARQUIVO_JOURNAL_COMPACTANDO)
+
+    def iniciar_compactacao(self):
+        """Dispara a compactação em segundo plano, se ainda não estiver rodando"""
+        with self.lock:
+            if self.compactacao is not None and self.compactacao.is_alive():
+                return
+            self.compactacao = threading.Thread(target=self.compactar, daemon=True)
+            self.compactacao.start()
+
+    def assinatura(self, versao=None):
+        """Identifica o conteúdo atual (ou o de uma versão já conhecida)"""
+        return f"json|{self.versao() if versao is None else versao}"
+
+    @contextlib.contextmanager
+    def arquivos_para_backup(self):
+        """(versão, {nome: (identidade, ler)}) de um estado consistente: os
+        arquivos são abertos com o lock adquirido e lidos depois, sem segurar
+        as escritas (o snapshot é substituído, nunca reescrito, e o journal só
+        cresce, então basta ler até o tamanho visto sob o lock)"""
+        with contextlib.ExitStack() as pilha:
+            with self.lock:
+                meta = self._ler_meta()
+                conteudo_meta = json.dumps(meta).encode("utf-8")
+                arquivos = {ARQUIVO_META: (None, io.BytesIO(conteudo_meta).read)}
+                for caminho in (ARQUIVO_SNAPSHOT, ARQUIVO_DADOS, ARQUIVO_JOURNAL_COMPACTANDO, ARQUIVO_JOURNAL):
+                    if not os.path.exists(caminho):
+                        continue
+                    arquivo = pilha.enter_context(open(caminho, "rb"))
+                    info = os.fstat(arquivo.fileno())
+                    arquivos[caminho] = (
+                        (info.st_ino, info.st_size, info.st_mtime_ns),
+                        leitor_arquivo_aberto(arquivo, info.st_size)
+                    )
+            yield meta["versao"], arquivos
+
+    def restaurar(self, armazem, ponto):
+        """Volta os arquivos para um ponto de backup. A versão continua
+        crescendo (as sessões abertas percebem e recarregam) e o último ID
+        reservado nunca diminui. Devolve (versão anterior, nova)"""
+        arquivos = ponto["arquivos"]
+        meta_ponto = json.loads(armazem.ler(ponto, ARQUIVO_META))
+        with self.lock:
+            meta = self._ler_meta()
+            for caminho in (ARQUIVO_SNAPSHOT, ARQUIVO_DADOS, ARQUIVO_JOURNAL_COMPACTANDO, ARQUIVO_JOURNAL):
+                if caminho in arquivos:
+                    gravar_atomico(caminho, functools.partial(armazem.extrair, ponto, caminho), binario=True)
+                elif os.path.exists(caminho):
+                    os.remove(caminho)
+            anterior = meta["versao"]
+            self._gravar_meta({
+                "versao": anterior + 1,
+                "ultimo_id": max(meta["ultimo_id"], meta_ponto["ultimo_id"])
+            })
+        return anterior, anterior + 1
+
+class ArmazenamentoSQLite:
+    """Banco SQLite: inclusões e remoções são de uma linha só, e os totais
+    por mês × categoria são calculados pelo banco usando os índices.
+    O próprio SQLite serializa os escritores (que esperam até TIMEOUT_SQLITE)"""
+    agrega_no_banco = True
+    TIMEOUT_SQLITE = 30
+
+    ESQUEMA = """
+    CREATE TABLE IF NOT EXISTS gastos (
+        id INTEGER PRIMARY KEY,
+        descricao TEXT NOT NULL,
+        valor REAL NOT NULL,
+        categoria TEXT NOT NULL,
+        data TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_gastos_data ON gastos (data, categoria, valor);
+    CREATE INDEX IF NOT EXISTS idx_gastos_categoria ON gastos (categoria, valor);
+    CREATE TABLE IF NOT EXISTS meta (
+        chave TEXT PRIMARY KEY,
+        valor TEXT
+    );
+    """
+
+    def __init__(self, caminho=ARQUIVO_SQLITE):
+        self.lock = threading.Lock()
+        self.caminho = caminho
+        self.conexao = sqlite3.connect(caminho, check_same_thread=False, timeout=self.TIMEOUT_SQLITE)
+        self.conexao.execute("PRAGMA journal_mode=WAL")
+        self.conexao.executescript(self.ESQUEMA)
+        with self.conexao:
+            self.conexao.execute("INSERT OR IGNORE INTO meta VALUES ('versao', 0)")
+        self.migrar_json()
+        with self.conexao:
+            self.conexao.execute(
+                "INSERT OR IGNORE INTO meta SELECT 'ultimo_id', COALESCE(MAX(id), 0) FROM gastos"
+            )
+
+    @staticmethod
+    def _linha(gasto):
+        return (
+            gasto.get("id"),
+            gasto.get("descricao", ""),
+            float(gasto.get("valor", 0)),
+            gasto.get("categoria", "💼 Outros"),
+            gasto.get("data", "")
+        )
+
+    def migrar_json(self):
+        """Importa dados_financepro.json (e o journal) uma única vez"""
+        with self.lock, self.conexao:
+            # A marca é gravada primeiro: a transação já nasce escritora e só
+            # um processo (o que conseguiu inserir a marca) faz a migração
+            marcado = self.conexao.execute(
+                "INSERT OR IGNORE INTO meta VALUES ('migrado_json', ?)", (datetime.now().isoformat(),)
+            ).rowcount
+            if not marcado:
+                return
+            if not self.conexao.execute("SELECT 1 FROM gastos LIMIT 1").fetchone():
+                self.conexao.executemany(
+                    "INSERT OR REPLACE INTO gastos VALUES (?, ?, ?, ?, ?)",
+                    (self._linha(gasto) for gasto in _ler_estado())
+                )
+
+    def carregar(self):
+        """Todos os gastos, na ordem de inclusão"""
+        with self.lock:
+            linhas = self.conexao.execute(
+                "SELECT id, descricao, valor, categoria, data FROM gastos ORDER BY id"
+            ).fetchall()
+        return [
+            {"id": id_, "descricao": descricao, "valor": valor, "categoria": categoria, "data": data}
+            for id_, descricao, valor, categoria, data in linhas
+        ]
+
+    def carregar_tabela(self):
+        return TabelaGastos.de_registros(self.carregar())
+
+    def _nova_versao(self):
+        """Incrementa a versão dentro da transação aberta; devolve (anterior, nova).
+        O UPDATE vem primeiro para a transação já nascer como escritora"""
+        self.conexao.execute("UPDATE meta SET valor = valor + 1 WHERE chave = 'versao'")
+        nova = int(self.conexao.execute("SELECT valor FROM meta WHERE chave = 'versao'").fetchone()[0])
+        return nova - 1, nova
+
+    def versao(self):
+        with self.lock:
+            return int(self.conexao.execute("SELECT valor FROM meta WHERE chave = 'versao'").fetchone()[0])
+
+    def reservar_ids(self, quantidade):
+        """Reserva `quantidade` IDs consecutivos e devolve o primeiro"""
+        with self.lock, self.conexao:
+            self.conexao.execute(
+                "UPDATE meta SET valor = valor + ? WHERE chave = 'ultimo_id'", (quantidade,)
+            )
+            ultimo = int(self.conexao.execute("SELECT valor FROM meta WHERE chave = 'ultimo_id'").fetchone()[0])
+        return ultimo - quantidade + 1
+
+    def salvar(self, dados):
+        """Substitui todo o conteúdo da tabela"""
+        with self.lock, self.conexao:
+            versoes = self._nova_versao()
+            self.conexao.execute("DELETE FROM gastos")
+            self.conexao.executemany(
+                "INSERT OR REPLACE INTO gastos VALUES (?, ?, ?, ?, ?)",
+                (self._linha(gasto) for gasto in dados)
+            )
+        return versoes
+
+    def aplicar(self, operacao):
+        """Executa a operação em uma transação; devolve (versão anterior, versão nova)"""
+        tipo = operacao.get("op")
+        with self.lock, self.conexao:
+            versoes = self._nova_versao()
+            if tipo == "add":
+                self.conexao.executemany(
+                    "INSERT OR REPLACE INTO gastos VALUES (?, ?, ?, ?, ?)",
+                    (self._linha(gasto) for gasto in gastos_da_operacao(operacao))
+                )
+            elif tipo == "remove":
+                self.conexao.executemany(
+                    "DELETE FROM gastos WHERE id = ?",
+                    ((gasto_id,) for gasto_id in ids_removidos(operacao))
+                )
+            elif tipo == "clear":
+                self.conexao.execute("DELETE FROM gastos")
+        return versoes
+
+    def assinatura(self, versao=None):
+        """Contador de alterações gravado na mesma transação de cada escrita"""
+        return f"sqlite|{self.versao() if versao is None else versao}"
+
+    @contextlib.contextmanager
+    def arquivos_para_backup(self):
+        """(versão, {nome: (identidade, ler)}) a partir de uma cópia do banco
+        feita pela API de backup do SQLite. A cópia sai de uma conexão de
+        leitura própria, sem o lock: no modo WAL ela enxerga um snapshot
+        consistente enquanto as escritas continuam na conexão principal"""
+        descritor, temporario = tempfile.mkstemp(prefix="financepro_backup_", suffix=".db")
+        os.close(descritor)
+        try:
+            origem = sqlite3.connect(self.caminho, timeout=self.TIMEOUT_SQLITE)
+            copia = sqlite3.connect(temporario)
+            try:
+                origem.backup(copia)
+                versao = int(copia.execute("SELECT valor FROM meta WHERE chave = 'versao'").fetchone()[0])
+                # A cópia vira um arquivo único (sem -wal) para o backup
+                copia.execute("PRAGMA journal_mode=DELETE")
+            finally:
+                copia.close()
+                origem.close()
+            with open(temporario, "rb") as arquivo:
+                yield versao, {ARQUIVO_SQLITE: (None, arquivo.read)}
+        finally:
+            os.remove(temporario)
+
+    def restaurar(self, armazem, ponto):
+        """Copia o banco de um ponto de backup para dentro do banco atual.
+        A versão continua crescendo e o último ID reservado nunca diminui.
+        Devolve (versão anterior, nova)"""
+        descritor, temporario = tempfile.mkstemp(prefix="financepro_restauracao_", suffix=".db")
+        try:
+            with os.fdopen(descritor, "wb") as f:
+                armazem.extrair(ponto, ARQUIVO_SQLITE, f)
+            origem = sqlite3.connect(temporario)
+            try:
+                with self.lock:
+                    meta = dict(self.conexao.execute("SELECT chave, valor FROM meta").fetchall())
+                    anterior, ultimo_id = int(meta["versao"]), int(meta["ultimo_id"])
+                    origem.backup(self.conexao)
+                    with self.conexao:
+                        self.conexao.execute(
+                            "UPDATE meta SET valor = ? WHERE chave = 'versao'", (anterior + 1,)
+                        )
+                        self.conexao.execute(
+                            "UPDATE meta SET valor = MAX(CAST(valor AS INTEGER), ?) WHERE chave = 'ultimo_id'",
+                            (ultimo_id,)
+                        )
+            finally:
+                origem.close()
+        finally:
+            os.remove(temporario)
+        return anterior, anterior + 1
+
+    @medir("armazenamento.agregar_mes_categoria")
+    def agregar_mes_categoria(self):
+        """Linhas (mês, categoria, total, quantidade) calculadas pelo banco"""
+        with self.lock:
+            return self.conexao.execute(
+                "SELECT substr(data, 1, 7) AS mes, categoria, SUM(valor), COUNT(*) "
+                "FROM gastos GROUP BY mes, categoria"
+            ).fetchall()
+
+MOTORES_ARMAZENAMENTO = {
+    "json": ArmazenamentoJSON,
+    "sqlite": ArmazenamentoSQLite
+}
+
+@st.cache_resource
+def obter_armazenamento(motor=MOTOR_ARMAZENAMENTO):
+    """Motor de armazenamento compartilhado por todas as sessões do processo
+    (o script é reexecutado a cada rerun, então não pode ser uma global)"""
+    if motor not in MOTORES_ARMAZENAMENTO:
+        raise ValueError(f"Motor de armazenamento desconhecido: {motor}")
+    return MOTORES_ARMAZENAMENTO[motor]()
+
+@medir("armazenamento.carregar")
+def carregar_dados():
+    """Carrega dados com tratamento de erro (None se não foi possível ler)"""
+    try:
+        return obter_armazenamento().carregar()
+    except Exception as e:
+        st.sidebar.error(f"Erro ao carregar dados: {str(e)}")
+
+    return None
+
+@medir("armazenamento.carregar_tabela")
+def carregar_tabela():
+    """Gastos já na TabelaGastos (o motor JSON monta as colunas direto do
+    snapshot binário); None se não foi possível ler"""
+    try:
+        return obter_armazenamento().carregar_tabela()
+    except Exception as e:
+        st.sidebar.error(f"Erro ao carregar dados: {str(e)}")
+
+    return None
+
+def versao_armazenamento():
+    """Versão atual dos dados gravados (None se não foi possível ler)"""
+    try:
+        return obter_armazenamento().versao()
+    except Exception:
+        return None
+
+@medir("armazenamento.reservar_ids")
+def reservar_ids(quantidade=1):
+    """Primeiro de `quantidade` IDs novos, exclusivos entre todas as sessões"""
+    try:
+        return obter_armazenamento().reservar_ids(quantidade)
+    except Exception as e:
+        st.error(f"Erro ao salvar dados: {str(e)}")
+        return None
+
+@medir("armazenamento.salvar")
+def salvar_dados(dados):
+    """Salva o conjunto completo de dados; devolve (versão anterior, nova) ou None"""
+    try:
+        versoes = obter_armazenamento().salvar(dados)
+    except Exception as e:
+        st.error(f"Erro ao salvar dados: {str(e)}")
+        return None
+    agendar_backup()
+    return versoes
+
+@medir("armazenamento.registrar_operacao")
+def registrar_operacao(operacao):
+    """Grava uma única inclusão/remoção sem reescrever o restante;
+    devolve (versão anterior, nova) ou None"""
+    try:
+        versoes = obter_armazenamento().aplicar(operacao)
+    except Exception as e:
+        st.error(f"Erro ao salvar dados: {str(e)}")
+        return None
+    agendar_backup()
+    return versoes
+
+# ========== BACKUP AUTOMÁTICO ==========
+# Depois de cada escrita um backup incremental é agendado numa thread: o
+# formulário não espera, e uma sequência de escritas seguidas (importação,
+# remoção em lote) vira um único ponto de restauração. Os blocos são
+# deduplicados por conteúdo (ArmazemBackup, em financepro_core), então cada
+# ponto custa só o que mudou. FINANCEPRO_BACKUP=0 desliga.
+BACKUP_ATIVO = os.environ.get("FINANCEPRO_BACKUP", "1") != "0"
+ESPERA_BACKUP_SEGUNDOS = 5
+
+class BackupAutomatico:
+    """Cria os pontos de restauração do motor de armazenamento do processo"""
+
+    def __init__(self, armazenamento, pasta=PASTA_BACKUP):
+        self.armazenamento = armazenamento
+        self.armazem = ArmazemBackup(pasta)
+        self.lock = threading.Lock()
+        self.pendente = False
+        self.thread = None
+        self.ultimo_erro = None
+
+    def agendar(self):
+        """Pede um backup em segundo plano (pedidos próximos são agrupados)"""
+        with self.lock:
+            self.pendente = True
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._processar_pendentes, daemon=True)
+                self.thread.start()
+
+    def _processar_pendentes(self):
+        while True:
+            time.sleep(ESPERA_BACKUP_SEGUNDOS)
+            with self.lock:
+                if not self.pendente:
+                    self.thread = None
+                    return
+                self.pendente = False
+            self.criar_ponto()
+
+    def pontos(self):
+        """Pontos deste motor, do mais recente para o mais antigo"""
+        try:
+            pontos = self.armazem.pontos()
+        except OSError:
+            return []
+        return [ponto for ponto in reversed(pontos) if ponto.get("motor") == MOTOR_ARMAZENAMENTO]
+
+    @medir("backup.criar_ponto")
+    def criar_ponto(self):
+        """Cria um ponto agora, se a versão atual ainda não tem backup;
+        devolve o ponto (novo ou o já existente) ou None se falhou"""
+        try:
+            with self.armazenamento.arquivos_para_backup() as (versao, arquivos):
+                pontos = self.pontos()
+                if pontos and pontos[0]["versao"] == versao:
+                    return pontos[0]
+                ponto = self.armazem.criar_ponto(arquivos, motor=MOTOR_ARMAZENAMENTO, versao=versao)
+        except Exception as e:
+            self.ultimo_erro = str(e)
+            return None
+        self.ultimo_erro = None
+        contar("backup.pontos")
+        return ponto
+
+    @medir("backup.restaurar")
+    def restaurar(self, ponto):
+        """Volta os dados para o ponto; devolve (versão anterior, nova)"""
+        return self.armazenamento.restaurar(self.armazem, ponto)
+
+@st.cache_resource
+def obter_backup_automatico():
+    return BackupAutomatico(obter_armazenamento())
+
+def agendar_backup():
+    if BACKUP_ATIVO:
+        obter_backup_automatico().agendar()
+
+# ========== TABELA DE GASTOS (COLUNAR) ==========
+# ordinal_da_data e data_do_ordinal (número do dia <-> 'YYYY-MM-DD') vêm de
+# financepro_core, que grava as datas do snapshot no mesmo formato
+@functools.lru_cache(maxsize=None)
+def _mes_do_ordinal(ordinal):
+    """Número do dia -> 'YYYY-MM' ('' quando ausente)"""
+    return data_do_ordinal(ordinal)[:7]
+
+# Remoções ficam marcadas até passarem desta fração das linhas da tabela
+FRACAO_COMPACTACAO_TABELA = 0.1
+
+class _ColunasGastos:
+    """Colunas de uma TabelaGastos, compartilhadas por todas as versões dela.
+    Só crescem: cada versão enxerga as suas primeiras linhas e nenhuma linha
+    já gravada é reescrita. A capacidade é reservada de antemão, então gravar
+    uma linha nova nunca redimensiona um array que outra sessão esteja lendo
+    (com visões NumPy abertas); quando enche, os arrays são trocados por
+    cópias maiores, com as mesmas linhas"""
+
+    def __init__(self):
+        self.ids = array('q')
+        self.valores = array('d')
+        self.datas = array('i')
+        self.categorias = array('B')
+        self.descricoes = []
+        # Linhas já gravadas (por qualquer versão)
+        self.usadas = 0
+        # ID -> posição: array denso para os IDs sequenciais, dict para o resto.
+        # Uma entrada só vale se a posição existe na versão e guarda o mesmo ID
+        self.posicao_por_id = array('q')
+        self.posicoes_esparsas = {}
+        # Se alguma cópia da tabela também usa estas colunas
+        self.compartilhadas = False
+
+    def reservar(self, linhas):
+        """Garante espaço para mais `linhas` depois das já gravadas"""
+        necessario = self.usadas + linhas
+        if necessario <= len(self.ids):
+            return
+        extra = max(necessario, len(self.ids) + len(self.ids) // 2 + 1024) - len(self.ids)
+        self.ids = self.ids + array('q', bytes(8 * extra))
+        self.valores = self.valores + array('d', bytes(8 * extra))
+        self.datas = self.datas + array('i', bytes(4 * extra))
+        self.categorias = self.categorias + array('B', bytes(extra))
+        self.descricoes = self.descricoes + [""] * extra
+
+    def reservar_id(self, gasto_id):
+        """Garante que o array denso cobre o ID"""
+        if gasto_id >= len(self.posicao_por_id):
+            extra = max(gasto_id + 1, len(self.posicao_por_id) * 3 // 2 + 1024) - len(self.posicao_por_id)
+            self.posicao_por_id = self.posicao_por_id + array('q', [-1]) * extra
+
+class _Prefixo(collections.abc.Sequence):
+    """As primeiras `tamanho` posições de uma lista, sem copiá-la"""
+
+    def __init__(self, lista, tamanho):
+        self.lista = lista
+        self.tamanho = tamanho
+
+    def __len__(self):
+        return self.tamanho
+
+    def __getitem__(self, posicao):
+        if isinstance(posicao, slice):
+            return self.lista[slice(*posicao.indices(self.tamanho))]
+        if posicao < 0:
+            posicao += self.tamanho
+        if not 0 <= posicao < self.tamanho:
+            raise IndexError("índice fora da tabela")
+        return self.lista[posicao]
+
+    def __iter__(self):
+        return itertools.islice(self.lista, self.tamanho)
+
+class TabelaGastos:
+    """Gastos em colunas compactas: valores e IDs em arrays, datas como
+    número do dia, categorias como código em CATEGORIAS_DETALHADAS e
+    descrições internadas.
+
+    Continua se comportando como a antiga lista de dicts (len, iteração,
+    índice, append, pop), mas cada gasto lido é um dict montado na hora:
+    alterá-lo não altera a tabela.
+
+    As colunas são compartilhadas entre as cópias (copy-on-write): uma cópia
+    custa O(1), a inclusão grava depois das linhas que as outras versões
+    enxergam e a remoção só marca a posição (as marcas são da versão). Quando
+    as marcas passam de FRACAO_COMPACTACAO_TABELA, as linhas que valem são
+    copiadas para colunas novas. A ordem física é sempre a de inclusão.
+
+    Um índice ID -> posição deixa busca e remoção em O(1).
+    """
+
+    def __init__(self):
+        self._colunas = _ColunasGastos()
+        # Linhas das colunas que esta versão enxerga
+        self._tamanho = 0
+        # Posições removidas nesta versão (compartilhadas com as cópias até a próxima remoção)
+        self._apagadas = set()
+        self._apagadas_proprias = True
+        self.nomes_categorias = list(CATEGORIAS_DETALHADAS)
+        self._codigos_categorias = {nome: codigo for codigo, nome in enumerate(self.nomes_categorias)}
+        # Muda a cada alteração: chave para caches derivados (exportações etc.)
+        self.geracao = uuid.uuid4().hex
+        self.versao = 0
+
+    def chave_versao(self):
+        """Identifica este conteúdo exato da tabela (muda a cada alteração)"""
+        return f"{self.geracao}:{self.versao}"
+
+    @classmethod
+    def de_registros(cls, registros):
+        """Monta a tabela a partir de uma lista de dicts"""
+        tabela = cls()
+        for gasto in registros:
+            tabela.append(gasto)
+        return tabela
+
+    @classmethod
+    def de_snapshot(cls, snapshot):
+        """Monta a tabela a partir de um SnapshotBinario aberto: as colunas
+        numéricas são copiadas em bloco do arquivo mapeado e as descrições
+        apontam para a tabela de textos (cada texto é decodificado uma vez)"""
+        import numpy as np
+        tabela = cls()
+        colunas = tabela._colunas
+        for nome in ("ids", "valores", "datas"):
+            getattr(colunas, nome).frombytes(snapshot.bytes_colunas[nome])
+
+        indices_categorias = np.frombuffer(snapshot.categorias, dtype=np.uint32)
+        codigos = np.zeros(snapshot.quantidade_textos, dtype=np.uint8)
+        for indice in np.flatnonzero(np.bincount(indices_categorias, minlength=snapshot.quantidade_textos)):
+            codigos[indice] = tabela.codigo_categoria(snapshot.textos[indice])
+        colunas.categorias.frombytes(codigos[indices_categorias].tobytes())
+
+        textos = np.array(snapshot.textos, dtype=object)
+        colunas.descricoes = textos[np.frombuffer(snapshot.descricoes, dtype=np.uint32)].tolist()
+
+        tabela._tamanho = colunas.usadas = len(colunas.ids)
+        tabela._indexar_posicoes()
+        return tabela
+
+    def _indexar_posicoes(self):
+        """Refaz o índice ID -> posição de uma vez (vetorizado)"""
+        import numpy as np
+        ids = np.frombuffer(self._colunas.ids, dtype=np.int64, count=self._tamanho)
+        densos = (ids >= 0) & (ids <= 2 * len(ids) + 1024)
+        posicoes = np.full(int(ids[densos].max()) + 1 if densos.any() else 0, -1, dtype=np.int64)
+        posicoes[ids[densos]] = np.flatnonzero(densos)
+        self._colunas.posicao_por_id = array('q', posicoes.tobytes())
+        self._colunas.posicoes_esparsas = dict(zip(ids[~densos].tolist(), np.flatnonzero(~densos).tolist()))
+
+    def copia(self):
+        """Nova versão (com nova geração) que compartilha as colunas: O(1)"""
+        nova = TabelaGastos()
+        nova._colunas = self._colunas
+        nova._colunas.compartilhadas = True
+        nova._tamanho = self._tamanho
+        nova._apagadas = self._apagadas
+        # Daqui em diante as marcas são das duas versões
+        nova._apagadas_proprias = self._apagadas_proprias = False
+        nova.nomes_categorias = self.nomes_categorias[:]
+        nova._codigos_categorias = dict(self._codigos_categorias)
+        return nova
+
+    def _reconstruir(self):
+        """Copia as linhas que valem para colunas só desta versão: somem as
+        removidas e o que outras versões gravaram depois das nossas linhas"""
+        import numpy as np
+        contar("tabela.reconstrucao")
+        antigas = self._colunas
+        vivas = self.mascara_vivas()
+        novas = _ColunasGastos()
+        for nome, tipo in (("ids", np.int64), ("valores", np.float64), ("datas", np.int32), ("categorias", np.uint8)):
+            coluna = np.frombuffer(getattr(antigas, nome), dtype=tipo, count=self._tamanho)
+            getattr(novas, nome).frombytes((coluna if vivas is None else coluna[vivas]).tobytes())
+        descricoes = antigas.descricoes[:self._tamanho]
+        novas.descricoes = descricoes if vivas is None else list(itertools.compress(descricoes, vivas.tolist()))
+        self._colunas = novas
+        self._tamanho = novas.usadas = len(novas.ids)
+        self._apagadas = set()
+        self._apagadas_proprias = True
+        self._indexar_posicoes()
+
+    def _preparar_escrita(self, gasto_ids):
+        """Garante espaço para gravar os IDs sem que outra versão perceba. Se
+        outra versão já gravou depois das nossas linhas, ou se algum ID volta
+        e uma cópia ainda enxerga a posição antiga dele, esta versão passa a
+        ter colunas próprias"""
+        colunas = self._colunas
+        if self._tamanho != colunas.usadas or (
+            colunas.compartilhadas and len(self._posicoes_indexadas(gasto_ids, colunas.usadas))
+        ):
+            self._reconstruir()
+        self._colunas.reservar(len(gasto_ids))
+
+    def codigo_categoria(self, nome):
+        """Código da categoria (categorias desconhecidas ganham um código novo)"""
+        codigo = self._codigos_categorias.get(nome)
+        if codigo is None:
+            codigo = len(self.nomes_categorias)
+            self.nomes_categorias.append(nome)
+            self._codigos_categorias[nome] = codigo
+        return codigo
+
+    # Visões das colunas (sem cópia) até o tamanho desta versão; incluem as
+    # posições removidas (ver mascara_vivas)
+    @property
+    def ids(self):
+        return memoryview(self._colunas.ids)[:self._tamanho]
+
+    @property
+    def valores(self):
+        return memoryview(self._colunas.valores)[:self._tamanho]
+
+    @property
+    def datas(self):
+        return memoryview(self._colunas.datas)[:self._tamanho]
+
+    @property
+    def categorias(self):
+        return memoryview(self._colunas.categorias)[:self._tamanho]
+
+    @property
+    def descricoes(self):
+        return _Prefixo(self._colunas.descricoes, self._tamanho)
+
+    def mascara_vivas(self):
+        """Máscara (NumPy) das posições que valem; None se nenhuma foi removida"""
+        import numpy as np
+        if not self._apagadas:
+            return None
+        mascara = np.ones(self._tamanho, dtype=bool)
+        mascara[np.fromiter(self._apagadas, dtype=np.int64, count=len(self._apagadas))] = False
+        return mascara
+
+    def linhas(self, *nomes):
+        """zip das colunas pedidas (por nome), só nas posições que valem"""
+        linhas = zip(*(getattr(self, nome) for nome in nomes))
+        vivas = self.mascara_vivas()
+        return linhas if vivas is None else itertools.compress(linhas, vivas.tolist())
+
+    def _posicoes_vivas(self):
+        if not self._apagadas:
+            return iter(range(self._tamanho))
+        return (posicao for posicao in range(self._tamanho) if posicao not in self._apagadas)
+
+    def _definir_posicao(self, gasto_id, posicao):
+        # Cada ID fica em um só lugar: no array denso se já couber nele (a
+        # capacidade só cresce) ou se estiver perto do número de linhas
+        colunas = self._colunas
+        if 0 <= gasto_id < len(colunas.posicao_por_id) or 0 <= gasto_id <= 2 * colunas.usadas + 1024:
+            colunas.reservar_id(gasto_id)
+            colunas.posicao_por_id[gasto_id] = posicao
+            if colunas.posicoes_esparsas:
+                colunas.posicoes_esparsas.pop(gasto_id, None)
+        else:
+            colunas.posicoes_esparsas[gasto_id] = posicao
+
+    def _registro(self, posicao):
+        colunas = self._colunas
+        return {
+            "id": colunas.ids[posicao],
+            "descricao": colunas.descricoes[posicao],
+            "valor": colunas.valores[posicao],
+            "categoria": self.nomes_categorias[colunas.categorias[posicao]],
+            "data": data_do_ordinal(colunas.datas[posicao])
+        }
+
+    def __len__(self):
+        return self._tamanho - len(self._apagadas)
+
+    def __iter__(self):
+        for posicao in self._posicoes_vivas():
+            yield self._registro(posicao)
+
+    def _posicao_fisica(self, indice):
+        """Posição da indice-ésima linha que vale"""
+        import numpy as np
+        if indice < 0:
+            indice += len(self)
+        if not 0 <= indice < len(self):
+            raise IndexError("índice fora da tabela")
+        vivas = self.mascara_vivas()
+        return indice if vivas is None else int(np.flatnonzero(vivas)[indice])
+
+    def __getitem__(self, indice):
+        if isinstance(indice, slice):
+            return [self._registro(self._posicao_fisica(i)) for i in range(*indice.indices(len(self)))]
+        return self._registro(self._posicao_fisica(indice))
+
+    def append(self, gasto):
+        gasto_id = gasto.get("id") or 0
+        self._preparar_escrita([gasto_id])
+        colunas = self._colunas
+        posicao = self._tamanho
+        colunas.ids[posicao] = gasto_id
+        colunas.valores[posicao] = float(gasto.get("valor", 0))
+        colunas.datas[posicao] = ordinal_da_data(gasto.get("data", ""))
+        colunas.categorias[posicao] = self.codigo_categoria(gasto.get("categoria", "💼 Outros"))
+        colunas.descricoes[posicao] = sys.intern(gasto.get("descricao", ""))
+        self._tamanho = colunas.usadas = posicao + 1
+        self._definir_posicao(gasto_id, posicao)
+        self.versao += 1
+
+    def estender(self, lote):
+        """Acrescenta um lote inteiro (DataFrame com id, descricao, valor,
+        categoria e data 'YYYY-MM-DD') copiando colunas, sem montar dicts"""
+        import numpy as np
+        import pandas as pd
+        if not len(lote):
+            return
+        ids = lote["id"].to_numpy(dtype=np.int64)
+        self._preparar_escrita(ids)
+        self.versao += 1
+        datas = pd.to_datetime(lote["data"], format="%Y-%m-%d", errors="coerce")
+        ordinais = np.where(
+            datas.isna(), 0,
+            datas.to_numpy(dtype="datetime64[D]").astype(np.int64) + date(1970, 1, 1).toordinal()
+        )
+        codigos = [self.codigo_categoria(nome) for nome in lote["categoria"]]
+
+        colunas = self._colunas
+        inicio, fim = self._tamanho, self._tamanho + len(ids)
+        # Grava nas linhas reservadas, que nenhuma outra versão enxerga
+        np.frombuffer(colunas.ids, dtype=np.int64)[inicio:fim] = ids
+        np.frombuffer(colunas.valores, dtype=np.float64)[inicio:fim] = lote["valor"].to_numpy(dtype=np.float64)
+        np.frombuffer(colunas.datas, dtype=np.int32)[inicio:fim] = ordinais
+        np.frombuffer(colunas.categorias, dtype=np.uint8)[inicio:fim] = codigos
+        colunas.descricoes[inicio:fim] = [sys.intern(str(descricao)) for descricao in lote["descricao"]]
+        self._tamanho = colunas.usadas = fim
+        for posicao, gasto_id in enumerate(ids.tolist(), start=inicio):
+            self._definir_posicao(gasto_id, posicao)
+
+    def _apagar(self, posicao):
+        """Remove em O(1): a posição só é marcada nesta versão"""
+        self.versao += 1
+        gasto = self._registro(posicao)
+        if not self._apagadas_proprias:
+            self._apagadas = set(self._apagadas)
+            self._apagadas_proprias = True
+        self._apagadas.add(posicao)
+        if len(self._apagadas) > FRACAO_COMPACTACAO_TABELA * self._tamanho:
+            self._reconstruir()
+        return gasto
+
+    def pop(self, indice=-1):
+        if not len(self):
+            raise IndexError("pop de tabela vazia")
+        return self._apagar(self._posicao_fisica(indice))
+
+    def posicao(self, gasto_id):
+        """Posição do gasto com o ID informado (None se não existir)"""
+        colunas = self._colunas
+        posicao = -1
+        if 0 <= gasto_id < len(colunas.posicao_por_id):
+            posicao = colunas.posicao_por_id[gasto_id]
+        if posicao < 0:
+            posicao = colunas.posicoes_esparsas.get(gasto_id, -1)
+        if 0 <= posicao < self._tamanho and colunas.ids[posicao] == gasto_id and posicao not in self._apagadas:
+            return posicao
+        return None
+
+    def buscar(self, gasto_id):
+        """Gasto com o ID informado (None se não existir)"""
+        posicao = self.posicao(gasto_id)
+        return None if posicao is None else self._registro(posicao)
+
+    def remover(self, gasto_id):
+        """Remove o gasto com o ID informado e o devolve (None se não existir)"""
+        posicao = self.posicao(gasto_id)
+        if posicao is None:
+            return None
+        return self._apagar(posicao)
+
+    def remover_varios(self, gasto_ids):
+        """Remove vários gastos e devolve os que existiam"""
+        removidos = []
+        for gasto_id in gasto_ids:
+            gasto = self.remover(gasto_id)
+            if gasto is not None:
+                removidos.append(gasto)
+        return removidos
+
+    def _posicoes_indexadas(self, gasto_ids, limite):
+        """Posições que o índice guarda para os IDs, entre as `limite` primeiras
+        linhas das colunas (vetorizado); IDs sem posição ficam de fora"""
+        import numpy as np
+        colunas = self._colunas
+        gasto_ids = np.asarray(gasto_ids, dtype=np.int64)
+        densas = np.frombuffer(colunas.posicao_por_id, dtype=np.int64)
+        posicoes = np.full(len(gasto_ids), -1, dtype=np.int64)
+        no_array = (gasto_ids >= 0) & (gasto_ids < len(densas))
+        posicoes[no_array] = densas[gasto_ids[no_array]]
+        if colunas.posicoes_esparsas:
+            for k in np.flatnonzero(posicoes < 0).tolist():
+                posicoes[k] = colunas.posicoes_esparsas.get(int(gasto_ids[k]), -1)
+        validas = (posicoes >= 0) & (posicoes < limite)
+        ids = np.frombuffer(colunas.ids, dtype=np.int64, count=limite)
+        validas[validas] = ids[posicoes[validas]] == gasto_ids[validas]
+        return posicoes[validas]
+
+    def posicoes_de(self, gasto_ids):
+        """Posições dos IDs informados (vetorizado); IDs que não existem ficam de fora"""
+        posicoes = self._posicoes_indexadas(gasto_ids, self._tamanho)
+        vivas = self.mascara_vivas()
+        return posicoes if vivas is None else posicoes[vivas[posicoes]]
+
+    def recentes(self, quantidade):
+        """Os gastos com as datas mais recentes"""
+        posicoes = heapq.nlargest(quantidade, self._posicoes_vivas(), key=self._colunas.datas.__getitem__)
+        return [self._registro(p) for p in posicoes]
+
+    def _colunas_np(self):
+        """Visões NumPy das colunas até o tamanho desta versão (sem cópia)"""
+        import numpy as np
+        colunas = self._colunas
+        return (
+            np.frombuffer(colunas.ids, dtype=np.int64, count=self._tamanho),
+            np.frombuffer(colunas.valores, dtype=np.float64, count=self._tamanho),
+            np.frombuffer(colunas.datas, dtype=np.int32, count=self._tamanho),
+            np.frombuffer(colunas.categorias, dtype=np.uint8, count=self._tamanho)
+        )
+
+    def intervalo_datas(self):
+        """(primeira, última) data registrada, ou None se não houver datas"""
+        datas = self._colunas_np()[2]
+        vivas = self.mascara_vivas()
+        if vivas is not None:
+            datas = datas[vivas]
+        datas = datas[datas > 0]
+        if not len(datas):
+            return None
+        return date.fromordinal(int(datas.min())), date.fromordinal(int(datas.max()))
+
+    @medir("tabela.consultar")
+    def consultar(self, inicio=None, fim=None, categorias=None, valor_min=None, valor_max=None,
+                  ordenar_por="data", decrescente=True, posicoes=None):
+        """Posições dos gastos que passam nos filtros, já ordenadas (com
+        posicoes, só entre elas: o resultado de uma busca, por exemplo).
+        Tudo vetorizado sobre as colunas: nenhum dict é montado aqui"""
+        import numpy as np
+        ids, valores, datas, codigos = self._colunas_np()
+        selecao = slice(None) if posicoes is None else np.asarray(posicoes, dtype=np.intp)
+        contar("registros.consultados", len(ids) if posicoes is None else len(selecao))
+        vivas = self.mascara_vivas()
+        mascara = np.ones(len(ids[selecao]), dtype=bool) if vivas is None else vivas[selecao]
+        if inicio is not None:
+            mascara &= datas[selecao] >= inicio.toordinal()
+        if fim is not None:
+            mascara &= datas[selecao] <= fim.toordinal()
+        if categorias:
+            mascara &= np.isin(codigos[selecao], [self._codigos_categorias.get(c, -1) for c in categorias])
+        if valor_min is not None:
+            mascara &= valores[selecao] >= valor_min
+        if valor_max is not None:
+            mascara &= valores[selecao] <= valor_max
+        posicoes = np.flatnonzero(mascara) if posicoes is None else selecao[mascara]
+
+        if ordenar_por == "descricao":
+            posicoes = np.array(
+                sorted(posicoes.tolist(), key=self._colunas.descricoes.__getitem__, reverse=decrescente),
+                dtype=np.intp
+            )
+        else:
+            coluna = {"data": datas, "valor": valores, "id": ids}[ordenar_por]
+            # Desempate pelo ID para a paginação ser estável
+            ordem = np.lexsort((ids[posicoes], coluna[posicoes]))
+            posicoes = posicoes[ordem[::-1] if decrescente else ordem]
+        return posicoes
+
+    @medir("tabela.para_dataframe")
+    def para_dataframe(self, posicoes=None):
+        """DataFrame montado direto das colunas (vetorizado, sem passar por dicts).
+        Com posicoes, monta só essas linhas, na ordem dada"""
+        import numpy as np
+        import pandas as pd
+        if posicoes is None and self._apagadas:
+            posicoes = np.flatnonzero(self.mascara_vivas())
+        if posicoes is None:
+            # .copy(): o DataFrame não fica preso às colunas compartilhadas
+            ids, valores, ordinais, codigos = (coluna.copy() for coluna in self._colunas_np())
+            ordinais = ordinais.astype(np.int64)
+            codigos = codigos.astype(np.intp)
+            descricoes = np.array(self._colunas.descricoes[:self._tamanho], dtype=object)
+        else:
+            # Só as linhas pedidas (uma página, um bloco da exportação) são copiadas
+            posicoes = np.asarray(posicoes, dtype=np.intp)
+            ids, valores, ordinais, codigos = (coluna[posicoes] for coluna in self._colunas_np())
+            ordinais = ordinais.astype(np.int64)
+            codigos = codigos.astype(np.intp)
+            descricoes = np.array([self._colunas.descricoes[p] for p in posicoes.tolist()], dtype=object)
+        contar("registros.convertidos", len(ids))
+
+        ordinais_unicos, inverso = np.unique(ordinais, return_inverse=True)
+        datas = np.array([data_do_ordinal(int(o)) for o in ordinais_unicos], dtype=object)[inverso]
+        categorias = np.array(self.nomes_categorias, dtype=object)[codigos]
+        return pd.DataFrame({
+            "id": ids,
+            "descricao": descricoes,
+            "valor": valores,
+            "categoria": categorias,
+            "data": datas
+        })
+
+# ========== AGREGADOS (MÊS × CATEGORIA) ==========
+ARQUIVO_CUBO = "dados_financepro.cubo.json"
+
+class CuboAgregado:
+    """Totais por mês × categoria, atualizados em O(1) a cada inclusão/remoção.
+    Os meses são compartilhados entre cópias e só copiados quando alterados"""
+
+    def __init__(self, celulas=None):
+        # {"YYYY-MM": {categoria: [total, quantidade]}}
+        self.celulas = celulas or {}
+        # Meses que só esta instância usa (os demais são compartilhados)
+        self._meses_proprios = set(self.celulas)
+
+    @classmethod
+    @medir("cubo.construir")
+    def construir(cls, tabela):
+        """Monta o cubo a partir das colunas da TabelaGastos"""
+        contar("registros.agregados", len(tabela))
+        cubo = cls()
+        nomes = tabela.nomes_categorias
+        for ordinal, codigo, valor in tabela.linhas("datas", "categorias", "valores"):
+            cubo._acumular(_mes_do_ordinal(ordinal), nomes[codigo], valor, 1)
+        return cubo
+
+    @classmethod
+    def de_linhas(cls, linhas):
+        """Monta o cubo a partir de linhas (mês, categoria, total, quantidade)"""
+        cubo = cls()
+        for mes, categoria, total, quantidade in linhas:
+            cubo._acumular(mes, categoria, total, quantidade)
+        return cubo
+
+    def copia(self):
+        cubo = CuboAgregado()
+        cubo.celulas = dict(self.celulas)
+        # Daqui em diante os meses são das duas instâncias
+        self._meses_proprios = set()
+        return cubo
+
+    def _acumular(self, mes, categoria, valor, quantidade):
+        categorias = self.celulas.get(mes)
+        if categorias is None or mes not in self._meses_proprios:
+            categorias = self.celulas[mes] = {
+                categoria: celula[:] for categoria, celula in (categorias or {}).items()
+            }
+            self._meses_proprios.add(mes)
+        celula = categorias.setdefault(categoria, [0.0, 0])
+        celula[0] += valor
+        celula[1] += quantidade
+        # Célula vazia sai do cubo (e leva junto o resíduo de ponto flutuante)
+        if celula[1] <= 0:
+            del categorias[categoria]
+            if not categorias:
+                del self.celulas[mes]
+                self._meses_proprios.discard(mes)
+
+    def adicionar(self, gasto):
+        self._acumular(gasto.get("data", "")[:7], gasto.get("categoria", "💼 Outros"), gasto.get("valor", 0), 1)
+
+    def remover(self, gasto):
+        self._acumular(gasto.get("data", "")[:7], gasto.get("categoria", "💼 Outros"), -gasto.get("valor", 0), -1)
+
+    def total_geral(self):
+        return sum(celula[0] for categorias in self.celulas.values() for celula in categorias.values())
+
+    def total_mes(self, mes):
+        return sum(celula[0] for celula in self.celulas.get(mes, {}).values())
+
+    def total_celula(self, mes, categoria):
+        """Total de uma categoria num mês (YYYY-MM), em O(1)"""
+        celula = self.celulas.get(mes, {}).get(categoria)
+        return celula[0] if celula else 0.0
+
+    def totais_por_categoria(self, mes_inicio=None):
+        """{categoria: total} de todo o histórico ou a partir de mes_inicio (YYYY-MM)"""
+        totais = {}
+        for mes, categorias in self.celulas.items():
+            if mes_inicio is not None and (not mes or mes < mes_inicio):
+                continue
+            for categoria, celula in categorias.items():
+                totais[categoria] = totais.get(categoria, 0) + celula[0]
+        return totais
+
+    def meses(self):
+        """Meses (YYYY-MM) que têm pelo menos um gasto"""
+        return [mes for mes in self.celulas if mes]
+
+    def categorias(self):
+        """Categorias que têm pelo menos um gasto"""
+        return {categoria for categorias in self.celulas.values() for categoria in categorias}
+
+@medir("cubo.carregar")
+def carregar_cubo(tabela, versao=None):
+    """Lê o cubo persistido; reconstrói a partir dos gastos se o checksum não bate.
+    `versao` é a versão lida antes de carregar a tabela"""
+    try:
+        armazenamento = obter_armazenamento()
+        assinatura = armazenamento.assinatura(versao)
+    except Exception:
+        # Sem armazenamento não há o que validar: agrega o que foi carregado
+        return CuboAgregado.construir(tabela)
+
+    try:
+        if os.path.exists(ARQUIVO_CUBO):
+            with open(ARQUIVO_CUBO, "r", encoding='utf-8') as f:
+                conteudo = json.load(f)
+            if conteudo.get("checksum") == assinatura:
+                contar("cache_cubo.acerto")
+                return CuboAgregado(conteudo.get("celulas"))
+    except Exception:
+        pass
+
+    contar("cache_cubo.falta")
+    if armazenamento.agrega_no_banco:
+        cubo = CuboAgregado.de_linhas(armazenamento.agregar_mes_categoria())
+    else:
+        cubo = CuboAgregado.construir(tabela)
+    salvar_cubo(cubo, versao)
+    return cubo
+
+@medir("cubo.salvar")
+def salvar_cubo(cubo, versao=None):
+    """Persiste o cubo com o checksum da versão dos dados que ele reflete
+    (a atual, se não informada)"""
+    try:
+        checksum = obter_armazenamento().assinatura(versao)
+        gravar_atomico(
+            ARQUIVO_CUBO,
+            lambda f: json.dump({"checksum": checksum, "celulas": cubo.celulas}, f, ensure_ascii=False)
+        )
+    except Exception:
+        # Não é fatal: o cubo será reconstruído na próxima inicialização
+        pass
+
+# ========== ÍNDICE DE DATAS (SOMAS PREFIXADAS) ==========
+class SerieDiaria:
+    """Dias com gastos de uma categoria, em ordem, com somas prefixadas:
+    o total de qualquer intervalo é um bisect + uma subtração"""
+
+    def __init__(self):
+        self.dias = array('i')
+        self.totais = array('d')
+        self.quantidades = array('i')
+        # acumulado[k] = soma de totais[:k]
+        self.acumulado = array('d', [0.0])
+        self.sujo_desde = None
+
+    def copia(self):
+        nova = SerieDiaria()
+        nova.dias = self.dias[:]
+        nova.totais = self.totais[:]
+        nova.quantidades = self.quantidades[:]
+        nova.acumulado = self.acumulado[:]
+        nova.sujo_desde = self.sujo_desde
+        return nova
+
+    def _invalidar(self, posicao):
+        if self.sujo_desde is None or posicao < self.sujo_desde:
+            self.sujo_desde = posicao
+
+    def acumular(self, ordinal, valor, quantidade):
+        j = bisect.bisect_left(self.dias, ordinal)
+        if j < len(self.dias) and self.dias[j] == ordinal:
+            self.totais[j] += valor
+            self.quantidades[j] += quantidade
+            if self.quantidades[j] <= 0:
+                # Dia sem gastos sai do índice
+                del self.dias[j]
+                del self.totais[j]
+                del self.quantidades[j]
+                self._invalidar(j)
+            elif j == len(self.dias) - 1 and self.sujo_desde is None:
+                self.acumulado[-1] += valor
+            else:
+                self._invalidar(j)
+        else:
+            self.dias.insert(j, ordinal)
+            self.totais.insert(j, valor)
+            self.quantidades.insert(j, quantidade)
+            if j == len(self.dias) - 1 and self.sujo_desde is None:
+                # Caso comum (gasto no dia mais recente): só estende o acumulado
+                self.acumulado.append(self.acumulado[-1] + valor)
+            else:
+                self._invalidar(j)
+
+    def _atualizar(self):
+        """Recalcula o acumulado a partir do primeiro dia alterado"""
+        if self.sujo_desde is None:
+            return
+        j = self.sujo_desde
+        del self.acumulado[j + 1:]
+        soma = self.acumulado[j]
+        for total in self.totais[j:]:
+            soma += total
+            self.acumulado.append(soma)
+        self.sujo_desde = None
+
+    def intervalo(self, inicio, fim=None):
+        """Posições [lo, hi) dos dias entre inicio e fim (ordinais, inclusivos)"""
+        lo = bisect.bisect_left(self.dias, inicio)
+        hi = len(self.dias) if fim is None else bisect.bisect_right(self.dias, fim)
+        return lo, hi
+
+    def soma(self, inicio, fim=None):
+        self._atualizar()
+        lo, hi = self.intervalo(inicio, fim)
+        return self.acumulado[hi] - self.acumulado[lo] if hi > lo else 0.0
+
+    def acumulado_ate(self, ordinais):
+        """Total acumulado até cada ordinal (inclusive), todos de uma vez"""
+        import numpy as np
+        self._atualizar()
+        # Visões sem cópia, que não sobrevivem à chamada
+        dias = np.frombuffer(self.dias, dtype=np.int32)
+        acumulado = np.frombuffer(self.acumulado, dtype=np.float64)
+        return acumulado[np.searchsorted(dias, ordinais, side="right")]
+
+class IndiceDatas:
+    """Índice ordenado por data, por categoria, mantido a cada inclusão/remoção.
+    As séries são compartilhadas entre cópias e só copiadas quando alteradas"""
+
+    def __init__(self):
+        self.series = {}
+        # Categorias cujas séries só esta instância usa
+        self._series_proprias = set()
+
+    @classmethod
+    @medir("indice_datas.construir")
+    def construir(cls, tabela):
+        """Monta o índice a partir das colunas da TabelaGastos (sem parsing de datas)"""
+        contar("registros.indexados", len(tabela))
+        agrupado = {}
+        for ordinal, codigo, valor in tabela.linhas("datas", "categorias", "valores"):
+            celula = agrupado.setdefault(codigo, {}).setdefault(ordinal, [0.0, 0])
+            celula[0] += valor
+            celula[1] += 1
+
+        indice = cls()
+        for codigo, dias in agrupado.items():
+            serie = SerieDiaria()
+            soma = 0.0
+            for ordinal in sorted(dias):
+                total, quantidade = dias[ordinal]
+                serie.dias.append(ordinal)
+                serie.totais.append(total)
+                serie.quantidades.append(quantidade)
+                soma += total
+                serie.acumulado.append(soma)
+            indice.series[tabela.nomes_categorias[codigo]] = serie
+        indice._series_proprias = set(indice.series)
+        return indice
+
+    def copia(self):
+        indice = IndiceDatas()
+        indice.series = dict(self.series)
+        # Daqui em diante as séries são das duas instâncias
+        self._series_proprias = set()
+        return indice
+
+    def consolidar(self):
+        """Recalcula agora os acumulados pendentes: depois disso a leitura não
+        altera nada e o índice pode ser lido por várias threads ao mesmo tempo"""
+        for serie in self.series.values():
+            serie._atualizar()
+
+    def _acumular(self, gasto, sinal):
+        categoria = gasto.get("categoria", "💼 Outros")
+        serie = self.series.get(categoria)
+        if serie is None or categoria not in self._series_proprias:
+            serie = self.series[categoria] = serie.copia() if serie is not None else SerieDiaria()
+            self._series_proprias.add(categoria)
+        serie.acumular(ordinal_da_data(gasto.get("data", "")), sinal * gasto.get("valor", 0), sinal)
+
+    def adicionar(self, gasto):
+        self._acumular(gasto, 1)
+
+    def remover(self, gasto):
+        self._acumular(gasto, -1)
+
+    def totais_por_categoria(self, inicio, fim=None):
+        """{categoria: total} dos gastos entre inicio e fim (datas, inclusivas)"""
+        inicio = inicio.toordinal()
+        fim = None if fim is None else fim.toordinal()
+        totais = {}
+        for categoria, serie in self.series.items():
+            lo, hi = serie.intervalo(inicio, fim)
+            if hi > lo:
+                totais[categoria] = serie.soma(inicio, fim)
+        return totais
+
+    def _series_escolhidas(self, categorias):
+        return [serie for categoria, serie in self.series.items() if not categorias or categoria in categorias]
+
+    def total(self, inicio, fim=None, categorias=None):
+        """Total entre inicio e fim (datas, inclusivas) das categorias escolhidas
+        (todas, se nenhuma): uma subtração por categoria"""
+        inicio = inicio.toordinal()
+        fim = None if fim is None else fim.toordinal()
+        return sum(serie.soma(inicio, fim) for serie in self._series_escolhidas(categorias))
+
+    def acumulado_ate(self, ordinais, categorias=None):
+        """Total acumulado até cada ordinal (inclusive), somando as categorias
+        escolhidas; qualquer total de intervalo é a diferença de dois pontos"""
+        import numpy as np
+        ordinais = np.asarray(ordinais)
+        acumulado = np.zeros(len(ordinais))
+        for serie in self._series_escolhidas(categorias):
+            acumulado += serie.acumulado_ate(ordinais)
+        return acumulado
+
+# ========== SÉRIES TEMPORAIS ==========
+# Visões diárias, semanais, móveis e comparativas, todas calculadas sobre as
+# somas prefixadas do IndiceDatas: o custo depende do número de pontos do
+# gráfico (e de categorias), nunca do tamanho do histórico
+JANELAS_MOVEIS = (7, 30, 90)
+NOMES_MESES = ["Jan", "Fev", "Mar", "Abr", "Mai", "Jun", "Jul", "Ago", "Set", "Out", "Nov", "Dez"]
+
+def mesmo_dia_ano_anterior(dia):
+    """Mesma data um ano antes (29/02 vira 28/02)"""
+    try:
+        return dia.replace(year=dia.year - 1)
+    except ValueError:
+        return dia.replace(year=dia.year - 1, day=28)
+
+@medir("series.moveis")
+def series_moveis(indice, fim, dias=365, categorias=None, janelas=JANELAS_MOVEIS):
+    """Gasto de cada dia dos últimos `dias` até `fim` e as somas móveis de
+    cada janela (DataFrame indexado pela data)"""
+    import numpy as np
+    import pandas as pd
+    maior = max(janelas)
+    ordinais = np.arange(fim.toordinal() - dias - maior + 1, fim.toordinal() + 1)
+    acumulado = indice.acumulado_ate(ordinais, categorias)
+    colunas = {"Diário": acumulado[maior:] - acumulado[maior - 1:-1]}
+    for janela in janelas:
+        colunas[f"{janela} dias"] = acumulado[maior:] - acumulado[maior - janela:len(acumulado) - janela]
+    datas = [date.fromordinal(int(ordinal)) for ordinal in ordinais[maior:]]
+    return pd.DataFrame(colunas, index=pd.Index(datas, name="Data"))
+
+@medir("series.semanais")
+def totais_semanais(indice, fim, semanas=26, categorias=None):
+    """Total de cada semana (segunda a domingo) das últimas `semanas`, até a de `fim`"""
+    import numpy as np
+    import pandas as pd
+    segunda = fim - timedelta(days=fim.weekday())
+    inicios = [segunda - timedelta(weeks=k) for k in range(semanas - 1, -1, -1)]
+    limites = [inicio.toordinal() - 1 for inicio in inicios] + [segunda.toordinal() + 6]
+    return pd.Series(
+        np.diff(indice.acumulado_ate(limites, categorias)),
+        index=pd.Index(inicios, name="Semana"), name="Gastos"
+    )
+
+@medir("series.mes_a_mes")
+def comparativo_mes_atual(indice, hoje, categorias=None):
+    """Gasto acumulado dia a dia no mês atual (até hoje) e no mês anterior
+    inteiro (DataFrame indexado pelo dia do mês)"""
+    import numpy as np
+    import pandas as pd
+    inicio_mes = hoje.replace(day=1)
+    fim_anterior = inicio_mes - timedelta(days=1)
+
+    def acumulado_no_mes(inicio, fim):
+        acumulado = indice.acumulado_ate(np.arange(inicio.toordinal() - 1, fim.toordinal() + 1), categorias)
+        return pd.Series(acumulado[1:] - acumulado[0], index=range(1, fim.day + 1))
+
+    return pd.DataFrame({
+        "Mês atual": acumulado_no_mes(inicio_mes, hoje),
+        "Mês anterior": acumulado_no_mes(fim_anterior.replace(day=1), fim_anterior)
+    }).rename_axis("Dia")
+
+@medir("series.ano_a_ano")
+def comparativo_anual(indice, hoje, categorias=None):
+    """Total de cada mês deste ano e do anterior (os meses que ainda não
+    chegaram ficam vazios)"""
+    import numpy as np
+    import pandas as pd
+    colunas = {}
+    for ano in (hoje.year - 1, hoje.year):
+        limites = [date(ano, mes, 1).toordinal() - 1 for mes in range(1, 13)] + [date(ano, 12, 31).toordinal()]
+        colunas[str(ano)] = np.diff(indice.acumulado_ate(limites, categorias))
+    colunas[str(hoje.year)][hoje.month:] = np.nan
+    return pd.DataFrame(colunas, index=pd.Index(NOMES_MESES, name="Mês"))
+
+# ========== BUSCA POR DESCRIÇÃO (ÍNDICE INVERTIDO) ==========
+# Cada palavra das descrições (minúscula, sem acentos) aponta para os IDs dos
+# gastos que a contêm, e cada trigrama aponta para as palavras que o contêm.
+# A busca consulta só o vocabulário (bem menor que o histórico) e junta as
+# listas de IDs com NumPy: as descrições não são percorridas
+_PALAVRA = re.compile(r"\w+")
+# Remoções ficam pendentes até passarem desta fração dos gastos indexados
+FRACAO_COMPACTACAO_BUSCA = 0.1
+
+@functools.lru_cache(maxsize=65536)
+def palavras_da_descricao(texto):
+    """Palavras normalizadas (minúsculas, sem acentos), sem repetição"""
+    texto = texto.lower()
+    if not texto.isascii():
+        decomposto = unicodedata.normalize("NFKD", texto)
+        texto = "".join(c for c in decomposto if not unicodedata.combining(c))
+    return tuple(dict.fromkeys(_PALAVRA.findall(texto)))
+
+def _trigramas(palavra):
+    return {palavra[i:i + 3] for i in range(len(palavra) - 2)}
+
+class IndiceTexto:
+    """Índice invertido das descrições, mantido a cada inclusão/remoção.
+    As listas são compartilhadas entre cópias e só copiadas quando alteradas,
+    então a cópia de cada escrita (copy-on-write) não duplica o índice.
+    Remoções são marcadas e aplicadas em lote (compactar)"""
+
+    def __init__(self):
+        # palavra -> IDs (array 'q'), trigrama -> palavras
+        self.ids_por_palavra = {}
+        self.palavras_por_trigrama = {}
+        # Listas que só esta instância usa (as demais são compartilhadas)
+        self._palavras_proprias = set()
+        self._trigramas_proprios = set()
+        self.removidos = set()
+        self.palavras_com_removidos = set()
+        self._removidos_proprios = True
+        self.indexados = 0
+
+    @classmethod
+    @medir("indice_texto.construir")
+    def construir(cls, tabela):
+        """Monta o índice tokenizando cada descrição distinta uma única vez"""
+        contar("registros.indexados", len(tabela))
+        ids_por_descricao = {}
+        for gasto_id, descricao in tabela.linhas("ids", "descricoes"):
+            ids_por_descricao.setdefault(descricao, []).append(gasto_id)
+
+        listas = {}
+        for descricao, ids in ids_por_descricao.items():
+            for palavra in palavras_da_descricao(descricao):
+                listas.setdefault(palavra, []).extend(ids)
+
+        indice = cls()
+        for palavra, ids in listas.items():
+            indice.ids_por_palavra[palavra] = array('q', ids)
+            for trigrama in _trigramas(palavra):
+                indice.palavras_por_trigrama.setdefault(trigrama, set()).add(palavra)
+        indice._palavras_proprias = set(indice.ids_por_palavra)
+        indice._trigramas_proprios = set(indice.palavras_por_trigrama)
+        indice.indexados = len(tabela)
+        return indice
+
+    def copia(self):
+        indice = IndiceTexto()
+        indice.ids_por_palavra = dict(self.ids_por_palavra)
+        indice.palavras_por_trigrama = dict(self.palavras_por_trigrama)
+        indice.removidos = self.removidos
+        indice.palavras_com_removidos = self.palavras_com_removidos
+        indice.indexados = self.indexados
+        # Daqui em diante as listas e as remoções pendentes são das duas instâncias
+        self._palavras_proprias = set()
+        self._trigramas_proprios = set()
+        indice._removidos_proprios = self._removidos_proprios = False
+        return indice
+
+    def _lista_propria(self, palavra):
+        lista = self.ids_por_palavra.get(palavra)
+        if lista is None:
+            lista = array('q')
+            for trigrama in _trigramas(palavra):
+                if trigrama in self._trigramas_proprios:
+                    palavras = self.palavras_por_trigrama.setdefault(trigrama, set())
+                else:
+                    palavras = self.palavras_por_trigrama[trigrama] = set(self.palavras_por_trigrama.get(trigrama, ()))
+                    self._trigramas_proprios.add(trigrama)
+                palavras.add(palavra)
+        elif palavra not in self._palavras_proprias:
+            lista = lista[:]
+        self.ids_por_palavra[palavra] = lista
+        self._palavras_proprias.add(palavra)
+        return lista
+
+    def adicionar(self, gasto):
+        gasto_id = gasto.get("id") or 0
+        if gasto_id in self.removidos:
+            # ID de volta (raro): as entradas antigas dele saem antes
+            self.compactar()
+        for palavra in palavras_da_descricao(gasto.get("descricao", "")):
+            self._lista_propria(palavra).append(gasto_id)
+        self.indexados += 1
+
+    def remover(self, gasto):
+        if not self._removidos_proprios:
+            self.removidos = set(self.removidos)
+            self.palavras_com_removidos = set(self.palavras_com_removidos)
+            self._removidos_proprios = True
+        self.removidos.add(gasto.get("id") or 0)
+        self.palavras_com_removidos.update(palavras_da_descricao(gasto.get("descricao", "")))
+        if len(self.removidos) > FRACAO_COMPACTACAO_BUSCA * self.indexados:
+            self.compactar()
+
+    def compactar(self):
+        """Tira os IDs removidos das listas das palavras afetadas"""
+        import numpy as np
+        if not self.removidos:
+            return
+        removidos = np.fromiter(self.removidos, dtype=np.int64, count=len(self.removidos))
+        for palavra in self.palavras_com_removidos:
+            if palavra not in self.ids_por_palavra:
+                continue
+            ids = np.frombuffer(self.ids_por_palavra[palavra], dtype=np.int64)
+            restantes = ids[~np.isin(ids, removidos)]
+            if len(restantes):
+                self.ids_por_palavra[palavra] = array('q', restantes.tobytes())
+                self._palavras_proprias.add(palavra)
+            else:
+                # Palavra sem gastos sai do vocabulário
+                del self.ids_por_palavra[palavra]
+                for trigrama in _trigramas(palavra):
+                    palavras = self.palavras_por_trigrama.get(trigrama)
+                    if palavras is None:
+                        continue
+                    palavras = self.palavras_por_trigrama[trigrama] = palavras - {palavra}
+                    self._trigramas_proprios.add(trigrama)
+                    if not palavras:
+                        del self.palavras_por_trigrama[trigrama]
+                        self._trigramas_proprios.discard(trigrama)
+        self.indexados -= len(self.removidos)
+        self.removidos = set()
+        self.palavras_com_removidos = set()
+        self._removidos_proprios = True
+
+    def _palavras_com(self, termo):
+        """Palavras do vocabulário que contêm o termo"""
+        if len(termo) < 3:
+            return [palavra for palavra in self.ids_por_palavra if termo in palavra]
+        candidatas = None
+        # Do trigrama mais raro para o mais comum: a interseção encolhe rápido
+        for trigrama in sorted(_trigramas(termo), key=lambda t: len(self.palavras_por_trigrama.get(t, ()))):
+            palavras = self.palavras_por_trigrama.get(trigrama, set())
+            candidatas = set(palavras) if candidatas is None else candidatas & palavras
+            if not candidatas:
+                return []
+        return [palavra for palavra in candidatas if termo in palavra]
+
+    def _ids_com(self, termo):
+        import numpy as np
+        listas = [np.frombuffer(self.ids_por_palavra[palavra], dtype=np.int64) for palavra in self._palavras_com(termo)]
+        if not listas:
+            return np.array([], dtype=np.int64)
+        ids = np.concatenate(listas)
+        maior = int(ids.max())
+        if 0 <= ids.min() and maior <= 4 * len(ids) + 1024:
+            # IDs sequenciais: marcar num vetor de bits é linear (sem ordenar)
+            presentes = np.zeros(maior + 1, dtype=bool)
+            presentes[ids] = True
+            return np.flatnonzero(presentes)
+        return np.unique(ids)
+
+    @medir("indice_texto.buscar")
+    def buscar(self, consulta):
+        """IDs (ordenados) dos gastos cuja descrição contém todos os termos da
+        consulta, cada um como parte de alguma palavra ("merc" acha
+        "Supermercado"); None se a consulta não tem termos"""
+        import numpy as np
+        termos = palavras_da_descricao(consulta)
+        if not termos:
+            return None
+        resultado = None
+        # Termos longos primeiro: costumam ser os mais seletivos
+        for termo in sorted(termos, key=len, reverse=True):
+            ids = self._ids_com(termo)
+            resultado = ids if resultado is None else resultado[np.isin(resultado, ids, assume_unique=True)]
+            if not len(resultado):
+                break
+        if self.removidos and len(resultado):
+            removidos = np.fromiter(self.removidos, dtype=np.int64, count=len(self.removidos))
+            resultado = resultado[~np.isin(resultado, removidos)]
+        return resultado
+
+# ========== CATEGORIZAÇÃO AUTOMÁTICA ==========
+# Naive Bayes multinomial sobre as palavras das descrições: cada inclusão ou
+# remoção só soma ou subtrai contagens (nada é retreinado), e a sugestão olha
+# apenas as palavras da descrição nova, em microssegundos
+CATEGORIA_AUTOMATICA = "🤖 Automática"
+# Abaixo desta probabilidade a sugestão é descartada (fica a categoria padrão)
+CONFIANCA_MINIMA_SUGESTAO = 0.6
+SUAVIZACAO_CLASSIFICADOR = 1.0
+
+def palavras_para_classificar(descricao):
+    """Palavras da descrição que ajudam a classificar (números ficam de fora)"""
+    return [palavra for palavra in palavras_da_descricao(descricao) if not palavra.isdigit()]
+
+class ClassificadorCategorias:
+    """Contagens palavra × categoria mantidas a cada inclusão/remoção.
+    Como no IndiceTexto, as contagens de cada palavra são compartilhadas
+    entre cópias e só copiadas quando alteradas"""
+
+    def __init__(self):
+        # palavra -> {categoria: ocorrências}
+        self.contagens = {}
+        self._palavras_proprias = set()
+        self.palavras_por_categoria = {}
+        self.gastos_por_categoria = {}
+        self.total_gastos = 0
+
+    @classmethod
+    @medir("classificador.construir")
+    def construir(cls, tabela):
+        """Treina com a tabela inteira, tokenizando cada descrição distinta uma vez"""
+        classificador = cls()
+        pares = collections.Counter(tabela.linhas("descricoes", "categorias"))
+        for (descricao, codigo), quantidade in pares.items():
+            classificador._acumular(descricao, tabela.nomes_categorias[codigo], quantidade)
+        classificador._palavras_proprias = set(classificador.contagens)
+        return classificador
+
+    def copia(self):
+        classificador = ClassificadorCategorias()
+        classificador.contagens = dict(self.contagens)
+        classificador.palavras_por_categoria = dict(self.palavras_por_categoria)
+        classificador.gastos_por_categoria = dict(self.gastos_por_categoria)
+        classificador.total_gastos = self.total_gastos
+        # Daqui em diante as contagens são das duas instâncias
+        self._palavras_proprias = set()
+        return classificador
+
+    def _acumular(self, descricao, categoria, quantidade):
+        for palavra in palavras_para_classificar(descricao):
+            contagem = self.contagens.get(palavra)
+            if contagem is None or palavra not in self._palavras_proprias:
+                contagem = self.contagens[palavra] = dict(contagem or {})
+                self._palavras_proprias.add(palavra)
+            contagem[categoria] = contagem.get(categoria, 0) + quantidade
+            if contagem[categoria] <= 0:
+                del contagem[categoria]
+                if not contagem:
+                    del self.contagens[palavra]
+            self.palavras_por_categoria[categoria] = self.palavras_por_categoria.get(categoria, 0) + quantidade
+        self.gastos_por_categoria[categoria] = self.gastos_por_categoria.get(categoria, 0) + quantidade
+        if self.gastos_por_categoria[categoria] <= 0:
+            del self.gastos_por_categoria[categoria]
+        self.total_gastos += quantidade
+
+    def adicionar(self, gasto):
+        self._acumular(gasto.get("descricao", ""), gasto.get("categoria", "💼 Outros"), 1)
+
+    def remover(self, gasto):
+        self._acumular(gasto.get("descricao", ""), gasto.get("categoria", "💼 Outros"), -1)
+
+    def probabilidades(self, descricao):
+        """{categoria: probabilidade} para a descrição; {} se nenhuma palavra
+        dela aparece no histórico"""
+        palavras = [palavra for palavra in palavras_para_classificar(descricao) if palavra in self.contagens]
+        if not palavras:
+            return {}
+        vocabulario = len(self.contagens)
+        alfa = SUAVIZACAO_CLASSIFICADOR
+        pontuacoes = {}
+        for categoria, gastos in self.gastos_por_categoria.items():
+            denominador = math.log(self.palavras_por_categoria.get(categoria, 0) + alfa * vocabulario)
+            pontuacao = math.log(gastos / self.total_gastos)
+            for palavra in palavras:
+                pontuacao += math.log(self.contagens[palavra].get(categoria, 0) + alfa) - denominador
+            pontuacoes[categoria] = pontuacao
+        maior = max(pontuacoes.values())
+        exponenciais = {categoria: math.exp(p - maior) for categoria, p in pontuacoes.items()}
+        soma = sum(exponenciais.values())
+        return {categoria: valor / soma for categoria, valor in exponenciais.items()}
+
+    def sugerir(self, descricao):
+        """(categoria, probabilidade) mais provável, ou None se não há confiança suficiente"""
+        probabilidades = self.probabilidades(descricao)
+        if not probabilidades:
+            return None
+        categoria = max(probabilidades, key=probabilidades.get)
+        if probabilidades[categoria] < CONFIANCA_MINIMA_SUGESTAO:
+            return None
+        return categoria, probabilidades[categoria]
+
+    @medir("classificador.sugerir_varios")
+    def sugerir_varios(self, descricoes):
+        """Categoria sugerida (ou None) para cada descrição de um lote; descrições
+        repetidas são classificadas uma vez"""
+        sugestoes = {}
+        resultado = []
+        for descricao in descricoes:
+            if descricao not in sugestoes:
+                sugestao = self.sugerir(descricao)
+                sugestoes[descricao] = sugestao[0] if sugestao else None
+            resultado.append(sugestoes[descricao])
+        return resultado
+
+# ========== GASTOS RECORRENTES ==========
+# Gastos com a mesma descrição normalizada (hash) e valores próximos formam
+# um grupo; o grupo vira série quando os intervalos entre as datas seguem uma
+# periodicidade. Tudo é feito com duas ordenações e somas por grupo (NumPy),
+# O(n log n) sobre o histórico inteiro, e o resultado vale até os dados mudarem
+# Valores de um mesmo grupo diferem no máximo isto do valor vizinho
+TOLERANCIA_VALOR_RECORRENTE = 0.1
+MINIMO_OCORRENCIAS_RECORRENTE = 3
+# Fração mínima de intervalos dentro da tolerância da periodicidade
+REGULARIDADE_MINIMA = 0.75
+# (nome, dias, meses para projetar (0: projeta em dias), tolerância em dias)
+PERIODICIDADES = (
+    ("Semanal", 7, 0, 1),
+    ("Quinzenal", 14, 0, 2),
+    ("Mensal", 30.44, 1, 4),
+    ("Bimestral", 60.88, 2, 6),
+    ("Trimestral", 91.31, 3, 8),
+    ("Semestral", 182.62, 6, 12),
+    ("Anual", 365.25, 12, 15),
+)
+
+@functools.lru_cache(maxsize=65536)
+def chave_recorrencia(descricao):
+    """Hash (int64) da descrição normalizada: minúsculas, sem acentos e sem
+    números ("Netflix 03/2024" e "NETFLIX 04/2024" têm a mesma chave).
+    0 quando não sobra nenhuma palavra"""
+    palavras = palavras_para_classificar(descricao)
+    if not palavras:
+        return 0
+    resumo = hashlib.blake2b(" ".join(palavras).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(resumo, "little", signed=True) or 1
+
+def _somar_mes(dia, meses):
+    """Mesma data `meses` depois (o dia é limitado ao fim do mês)"""
+    ano, mes = divmod(dia.month - 1 + meses, 12)
+    ano, mes = dia.year + ano, mes + 1
+    ultimo = (date(ano + mes // 12, mes % 12 + 1, 1) - timedelta(days=1)).day
+    return dia.replace(year=ano, month=mes, day=min(dia.day, ultimo))
+
+def proximas_ocorrencias(serie, hoje, quantidade=3):
+    """Próximas `quantidade` datas previstas da série, a partir de hoje"""
+    _, dias, meses, _ = PERIODICIDADES[serie["periodicidade"]]
+    proximas = []
+    passo = 1
+    while len(proximas) < quantidade:
+        if meses:
+            prevista = _somar_mes(serie["ultima"], meses * passo)
+        else:
+            prevista = serie["ultima"] + timedelta(days=dias * passo)
+        if prevista >= hoje:
+            proximas.append(prevista)
+        passo += 1
+    return proximas
+
+def serie_ativa(serie, hoje):
+    """A série teve ocorrência nos últimos dois períodos"""
+    return (hoje - serie["ultima"]).days <= 2 * PERIODICIDADES[serie["periodicidade"]][1]
+
+@medir("recorrentes.detectar")
+def detectar_recorrentes(tabela):
+    """Séries recorrentes da tabela, da maior para a menor em custo mensal.
+    Cada série é um dict com descricao, categoria, valor (o mais recente),
+    periodicidade (índice em PERIODICIDADES), ocorrencias, primeira, ultima,
+    regularidade e custo_mensal"""
+    import numpy as np
+    if not len(tabela):
+        return []
+    # Cada descrição distinta é normalizada e resumida uma única vez; hashes
+    # iguais recebem o mesmo código sequencial (0: sem palavras)
+    codigos_por_chave = {0: 0}
+    codigos_por_descricao = {
+        descricao: codigos_por_chave.setdefault(chave_recorrencia(descricao), len(codigos_por_chave))
+        for descricao in dict.fromkeys(tabela.descricoes)
+    }
+    codigos = np.fromiter(
+        map(codigos_por_descricao.__getitem__, tabela.descricoes), dtype=np.int64, count=len(tabela.descricoes)
+    )
+    vivas = tabela.mascara_vivas()
+    if vivas is not None:
+        # Posições removidas contam como "sem palavras" e ficam de fora
+        codigos[~vivas] = 0
+    valores = np.frombuffer(tabela.valores, dtype=np.float64)
+    datas = np.frombuffer(tabela.datas, dtype=np.int32)
+    # Descrições com menos ocorrências que o mínimo nem entram na ordenação
+    frequentes = np.bincount(codigos)[codigos] >= MINIMO_OCORRENCIAS_RECORRENTE
+    posicoes = np.flatnonzero(frequentes & (codigos != 0) & (datas > 0) & (valores > 0))
+
+    # 1) Grupos: mesmo código e valores vizinhos dentro da tolerância.
+    # Uma só ordenação pela chave combinada código | centavos
+    centavos = np.minimum(np.rint(valores[posicoes] * 100), 2**32 - 1).astype(np.int64)
+    posicoes = posicoes[np.argsort((codigos[posicoes] << 32) | centavos, kind="stable")]
+    codigos_ordenados = codigos[posicoes]
+    valores_ordenados = valores[posicoes]
+    inicio_grupo = np.ones(len(posicoes), dtype=bool)
+    inicio_grupo[1:] = (
+        (codigos_ordenados[1:] != codigos_ordenados[:-1])
+        | (valores_ordenados[1:] > valores_ordenados[:-1] * (1 + TOLERANCIA_VALOR_RECORRENTE) + 0.01)
+    )
+    grupos = np.cumsum(inicio_grupo) - 1
+    candidatos = np.bincount(grupos)[grupos] >= MINIMO_OCORRENCIAS_RECORRENTE
+    posicoes, grupos = posicoes[candidatos], grupos[candidatos]
+    if not len(posicoes):
+        return []
+    # Renumera os grupos que sobraram em sequência (0, 1, 2...)
+    grupos = np.cumsum(np.append(True, grupos[1:] != grupos[:-1])) - 1
+
+    # 2) Dentro de cada grupo, em ordem de data (chave combinada grupo | data):
+    # intervalos entre ocorrências
+    ordem = np.argsort((grupos << 32) | datas[posicoes], kind="stable")
+    posicoes, grupos = posicoes[ordem], grupos[ordem]
+    datas_grupo = datas[posicoes].astype(np.int64)
+    mesmo_grupo = grupos[1:] == grupos[:-1]
+    intervalos = (datas_grupo[1:] - datas_grupo[:-1])[mesmo_grupo]
+    grupo_intervalo = grupos[1:][mesmo_grupo]
+
+    # Mediana dos intervalos de cada grupo: ordenar por (grupo, intervalo)
+    quantidade_grupos = int(grupos[-1]) + 1
+    contagens = np.bincount(grupo_intervalo, minlength=quantidade_grupos)
+    inicios = np.cumsum(contagens) - contagens
+    ordenados = intervalos[np.lexsort((intervalos, grupo_intervalo))]
+    com_intervalos = contagens > 0
+    medianas = np.zeros(quantidade_grupos)
+    medianas[com_intervalos] = ordenados[inicios[com_intervalos] + (contagens[com_intervalos] - 1) // 2]
+
+    # Periodicidade mais próxima da mediana (-1: nenhuma)
+    periodicidade = np.full(quantidade_grupos, -1)
+    for indice, (_, dias, _, tolerancia) in enumerate(PERIODICIDADES):
+        periodicidade[com_intervalos & (np.abs(medianas - dias) <= tolerancia)] = indice
+    dias_periodo = np.array([p[1] for p in PERIODICIDADES] + [0.0])[periodicidade]
+    tolerancia_periodo = np.array([p[3] for p in PERIODICIDADES] + [0.0])[periodicidade]
+
+    # Regularidade: fração dos intervalos dentro da tolerância da periodicidade
+    regulares = np.abs(intervalos - dias_periodo[grupo_intervalo]) <= tolerancia_periodo[grupo_intervalo]
+    regularidade = np.bincount(grupo_intervalo, weights=regulares, minlength=quantidade_grupos)
+    regularidade[com_intervalos] /= contagens[com_intervalos]
+    recorrentes = np.flatnonzero((periodicidade >= 0) & (regularidade >= REGULARIDADE_MINIMA))
+
+    # Primeira e última ocorrência de cada grupo (os grupos estão em sequência)
+    fim_grupo = np.flatnonzero(np.append(grupos[1:] != grupos[:-1], True))
+    inicio_grupo = np.append(0, fim_grupo[:-1] + 1)
+
+    series = []
+    for grupo in recorrentes.tolist():
+        ultima = int(posicoes[fim_grupo[grupo]])
+        indice = int(periodicidade[grupo])
+        valor = float(valores[ultima])
+        series.append({
+            "descricao": tabela.descricoes[ultima],
+            "categoria": tabela.nomes_categorias[tabela.categorias[ultima]],
+            "valor": valor,
+            "periodicidade": indice,
+            "ocorrencias": int(fim_grupo[grupo] - inicio_grupo[grupo] + 1),
+            "primeira": date.fromordinal(int(datas_grupo[inicio_grupo[grupo]])),
+            "ultima": date.fromordinal(int(datas_grupo[fim_grupo[grupo]])),
+            "regularidade": float(regularidade[grupo]),
+            "custo_mensal": valor * PERIODICIDADES[2][1] / PERIODICIDADES[indice][1]
+        })
+    series.sort(key=lambda serie: serie["custo_mensal"], reverse=True)
+    return series
+
+class CacheRecorrentes:
+    """Séries detectadas para a última versão dos dados, compartilhadas entre
+    as sessões: só são recalculadas quando a tabela muda"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.chave = None
+        self.series = []
+
+    def obter(self, tabela):
+        chave = tabela.chave_versao()
+        with self.lock:
+            if chave == self.chave:
+                contar("cache_recorrentes.acerto")
+                return self.series
+        contar("cache_recorrentes.falta")
+        series = detectar_recorrentes(tabela)
+        with self.lock:
+            self.chave, self.series = chave, series
+        return series
+
+@st.cache_resource
+def obter_cache_recorrentes():
+    return CacheRecorrentes()
+
+# ========== RESUMO DO DASHBOARD ==========
+# Períodos do gráfico por categoria -> quantidade de meses de calendário
+PERIODOS_CATEGORIA = {
+    "Este Mês": 1,
+    "Últimos 3 Meses": 3,
+    "Últimos 6 Meses": 6,
+    "Total": None
+}
+
+def meses_anteriores(referencia, quantidade):
+    """Os últimos N meses de calendário ('YYYY-MM'), do mais recente ao mais antigo"""
+    ano, mes = referencia.year, referencia.month
+    meses = []
+    for _ in range(quantidade):
+        meses.append(f"{ano:04d}-{mes:02d}")
+        mes -= 1
+        if mes == 0:
+            ano, mes = ano - 1, 12
+    return meses
+
+class ResumoDashboard:
+    """Todas as métricas e séries que o dashboard exibe"""
+
+    def __init__(self, total_geral=0.0, gastos_mes_atual=0.0, meses_distintos=0,
+                 total_registros=0, gastos_por_mes=None, gastos_por_categoria=None):
+        self.total_geral = total_geral
+        self.gastos_mes_atual = gastos_mes_atual
+        self.meses_distintos = meses_distintos
+        self.media_mensal = total_geral / max(1, meses_distintos)
+        self.total_registros = total_registros
+        # {'YYYY-MM': total}, do mês mais recente ao mais antigo
+        self.gastos_por_mes = gastos_por_mes or {}
+        # {período: {categoria: total}}, um para cada chave de PERIODOS_CATEGORIA
+        self.gastos_por_categoria = gastos_por_categoria or {periodo: {} for periodo in PERIODOS_CATEGORIA}
+
+@medir("resumo.calcular")
+def calcular_resumo_dashboard(cubo, hoje=None, meses=6):
+    """Calcula o resumo inteiro com um único groupby vetorizado sobre o cubo
+    mês × categoria (o custo depende do número de meses, não de gastos)"""
+    import pandas as pd
+    hoje = hoje or date.today()
+    ultimos_meses = meses_anteriores(hoje, max([meses] + [n for n in PERIODOS_CATEGORIA.values() if n]))
+
+    celulas = pd.DataFrame(
+        [
+            (mes, categoria, celula[0], celula[1])
+            for mes, categorias in cubo.celulas.items()
+            for categoria, celula in categorias.items()
+        ],
+        columns=["mes", "categoria", "total", "quantidade"]
+    )
+    if celulas.empty:
+        return ResumoDashboard(gastos_por_mes={mes: 0.0 for mes in ultimos_meses[:meses]})
+
+    # Mês × categoria, do mês mais recente para o mais antigo ('' = sem data fica por último)
+    tabela = celulas.pivot_table(
+        index="mes", columns="categoria", values="total", aggfunc="sum", fill_value=0.0
+    ).sort_index(ascending=False)
+    por_mes = tabela.sum(axis=1)
+    # acumulado.iloc[k] = gastos de cada categoria do k-ésimo mês em diante
+    acumulado = tabela.cumsum()
+
+    gastos_por_categoria = {}
+    for periodo, quantidade in PERIODOS_CATEGORIA.items():
+        if quantidade is None:
+            linhas_no_periodo = len(tabela)
+        else:
+            linhas_no_periodo = int((tabela.index >= ultimos_meses[quantidade - 1]).sum())
+        if linhas_no_periodo == 0:
+            gastos_por_categoria[periodo] = {}
+            continue
+        totais = acumulado.iloc[linhas_no_periodo - 1]
+        gastos_por_categoria[periodo] = {
+            categoria: float(total) for categoria, total in totais.items() if total != 0
+        }
+
+    return ResumoDashboard(
+        total_geral=float(por_mes.sum()),
+        gastos_mes_atual=float(por_mes.get(ultimos_meses[0], 0.0)),
+        meses_distintos=int((tabela.index != "").sum()),
+        total_registros=int(celulas["quantidade"].sum()),
+        gastos_por_mes={mes: float(por_mes.get(mes, 0.0)) for mes in ultimos_meses[:meses]},
+        gastos_por_categoria=gastos_por_categoria
+    )
+
+# ========== BASE COMPARTILHADA ==========
+class EstadoDados:
+    """Uma versão dos dados: a tabela e as estruturas derivadas dela.
+    Depois de publicada na BaseCompartilhada nunca mais é alterada, então
+    todas as sessões leem o mesmo objeto sem lock; quem altera trabalha
+    numa copia() e publica a cópia. A cópia é copy-on-write em cada estrutura
+    (colunas da tabela, meses do cubo, séries, palavras): só o que a
+    alteração toca é copiado"""
+
+    def __init__(self, tabela=None, cubo=None, indice_datas=None, indice_texto=None, classificador=None,
+                 versao=None):
+        self.tabela = tabela if tabela is not None else TabelaGastos()
+        self.cubo = cubo if cubo is not None else CuboAgregado()
+        self.indice_datas = indice_datas if indice_datas is not None else IndiceDatas()
+        self.indice_texto = indice_texto if indice_texto is not None else IndiceTexto()
+        self.classificador = classificador if classificador is not None else ClassificadorCategorias()
+        # Versão do armazenamento que este estado reflete (None: desconhecida)
+        self.versao = versao
+
+    @classmethod
+    @medir("estado.carregar")
+    def carregar(cls, versao):
+        """Lê os gastos da versão informada (lida antes dos dados: se alguém
+        gravar no meio, a diferença de versão faz recarregar de novo)"""
+        tabela = carregar_tabela()
+        if tabela is None:
+            # Leitura falhou: estado vazio, que será relido na próxima consulta
+            tabela, versao = TabelaGastos(), None
+        return cls(
+            tabela, carregar_cubo(tabela, versao), IndiceDatas.construir(tabela),
+            IndiceTexto.construir(tabela), ClassificadorCategorias.construir(tabela), versao
+        )
+
+    def copia(self):
+        return EstadoDados(
+            self.tabela.copia(), self.cubo.copia(), self.indice_datas.copia(),
+            self.indice_texto.copia(), self.classificador.copia(), self.versao
+        )
+
+    def estruturas_derivadas(self):
+        """Estruturas mantidas em sincronia com a tabela"""
+        return (self.cubo, self.indice_datas, self.indice_texto, self.classificador)
+
+    def adicionar(self, gastos):
+        for gasto in gastos:
+            self.tabela.append(gasto)
+            for estrutura in self.estruturas_derivadas():
+                estrutura.adicionar(gasto)
+
+    def adicionar_lote(self, lote, registros):
+        """Lote já validado: colunas copiadas direto para a tabela"""
+        self.tabela.estender(lote)
+        for gasto in registros:
+            for estrutura in self.estruturas_derivadas():
+                estrutura.adicionar(gasto)
+
+    def remover(self, gasto_ids):
+        """Remove os gastos e devolve os que existiam"""
+        removidos = self.tabela.remover_varios(gasto_ids)
+        for gasto in removidos:
+            for estrutura in self.estruturas_derivadas():
+                estrutura.remover(gasto)
+        return removidos
+
+    def limpar(self):
+        self.tabela = TabelaGastos()
+        self.cubo = CuboAgregado()
+        self.indice_datas = IndiceDatas()
+        self.indice_texto = IndiceTexto()
+        self.classificador = ClassificadorCategorias()
+
+class BaseCompartilhada:
+    """Os dados do processo, compartilhados por todas as sessões: cinquenta
+    abas abertas custam uma cópia dos dados, não cinquenta"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.estado = None
+
+    def atual(self):
+        """Estado atual; relê o armazenamento só se a versão gravada mudou
+        (outro processo escreveu ou a última leitura falhou)"""
+        versao = versao_armazenamento()
+        estado = self.estado
+        if estado is None or (versao is not None and versao != estado.versao):
+            with self.lock:
+                if self.estado is None or (versao is not None and versao != self.estado.versao):
+                    contar("base.recarga")
+                    self._publicar(EstadoDados.carregar(versao))
+                estado = self.estado
+        return estado
+
+    def alterar(self, operacao, mutacao):
+        """Aplica `mutacao(estado)` numa cópia do estado, grava a operação e
+        publica a cópia. Devolve (novo estado, retorno da mutação); se a
+        gravação falhar, nada muda e o estado devolvido é None"""
+        self.atual()
+        with self.lock:
+            novo = self.estado.copia()
+            retorno = mutacao(novo)
+            novo.indice_datas.consolidar()
+            
+            versoes = registrar_operacao(operacao)
+            if versoes is None:
+                return None, retorno
+            anterior, nova = versoes
+            if anterior == novo.versao:
+                novo.versao = nova
+                salvar_cubo(novo.cubo, nova)
+            else:
+                # Outro processo gravou antes: a operação já está mesclada no
+                # armazenamento e o estado será relido na próxima consulta
+                novo.versao = None
+            self._publicar(novo)
+        return novo, retorno
+
+    def _publicar(self, estado):
+        """Troca o estado atual (com o lock); exportações da versão anterior
+        deixam de valer e seus arquivos são apagados"""
+        self.estado = estado
+        obter_exportacoes().descartar_outras_versoes(estado.tabela.chave_versao())
+
+@st.cache_resource
+def obter_base_compartilhada():
+    """Base única por processo (o script é reexecutado a cada rerun)"""
+    return BaseCompartilhada()
+
+# ========== CACHE DE FIGURAS ==========
+CAPACIDADE_CACHE_FIGURAS = 64
+
+class CacheFiguras:
+    """Figuras Plotly já montadas, por (versão dos dados, gráfico, opções de
+    visualização), com descarte LRU. Compartilhado entre as sessões: como a
+    chave inclui a versão dos dados, sessões que veem os mesmos dados
+    reaproveitam as mesmas figuras"""
+
+    def __init__(self, capacidade=CAPACIDADE_CACHE_FIGURAS):
+        self.capacidade = capacidade
+        self.lock = threading.Lock()
+        self.figuras = collections.OrderedDict()
+        self.acertos = 0
+        self.faltas = 0
+
+    def obter(self, chave, construir):
+        """Figura em cache para a chave, ou construir() (guardada para as próximas)"""
+        with self.lock:
+            figura = self.figuras.get(chave)
+            if figura is not None:
+                self.figuras.move_to_end(chave)
+                self.acertos += 1
+                contar("cache_figuras.acerto")
+                return figura
+            self.faltas += 1
+        contar("cache_figuras.falta")
+
+        # Montar fora do lock: outras sessões não esperam por este gráfico
+        figura = construir()
+        with self.lock:
+            self.figuras[chave] = figura
+            self.figuras.move_to_end(chave)
+            while len(self.figuras) > self.capacidade:
+                self.figuras.popitem(last=False)
+        return figura
+
+@st.cache_resource
+def obter_cache_figuras():
+    return CacheFiguras()
+
+@medir("figura.evolucao_mensal")
+def figura_evolucao_mensal(gastos_mensais):
+    """Linha dos gastos mensais ({'YYYY-MM': total})"""
+    import pandas as pd
+    import plotly.express as px
+    df_mensal = pd.DataFrame({
+        'Mês': [f"{mes[5:7]}/{mes[2:4]}" for mes in gastos_mensais],  # MM/YY
+        'Gastos': list(gastos_mensais.values())
+    })
+    
+    fig = px.line(
+        df_mensal, x='Mês', y='Gastos',
+        markers=True,
+        line_shape='spline',
+        color_discrete_sequence=['#667eea'],
+        title="Gastos dos Últimos 6 Meses"
+    )
+    fig.update_layout(
+        plot_bgcolor='rgba(0,0,0,0)',
+        paper_bgcolor='rgba(0,0,0,0)',
+        height=300,
+        margin=dict(l=20, r=20, t=50, b=20),
+        xaxis_title="Mês",
+        yaxis_title="Gastos (R$)",
+        showlegend=False
+    )
+    fig.update_traces(
+        line=dict(width=3),
+        marker=dict(size=8)
+    )
+    return fig
+
+@medir("figura.pizza_categorias")
+def figura_pizza_categorias(categorias_nomes, valores, cores, titulo):
+    """Rosca da distribuição por categoria"""
+    import pandas as pd
+    import plotly.express as px
+    df_pizza = pd.DataFrame({
+        'Categoria': categorias_nomes,
+        'Valor': valores,
+        'Cor': cores
+    })
+    
+    fig = px.pie(
+        df_pizza,
+        values='Valor',
+        names='Categoria',
+        color='Categoria',
+        color_discrete_map=dict(zip(categorias_nomes, cores)),
+        hole=0.4,
+        title=titulo
+    )
+    
+    fig.update_layout(
+        height=400,
+        margin=dict(l=20, r=20, t=50, b=20),
+        showlegend=True,
+        legend=dict(
+            orientation="v",
+            yanchor="middle",
+            y=0.5,
+            xanchor="left",
+            x=1.1
+        )
+    )
+    
+    fig.update_traces(
+        textposition='inside',
+        textinfo='percent+label',
+        texttemplate='%{label}<br>%{percent}<br>R$ %{value:,.2f}',
+        hovertemplate='<b>%{label}</b><br>Valor: R$ %{value:,.2f}<br>Percentual: %{percent}'
+    )
+    return fig
+
+@medir("figura.barras_categorias")
+def figura_barras_categorias(gastos_categoria):
+    """Barras com o total de cada categoria ({categoria: total})"""
+    import pandas as pd
+    import plotly.express as px
+    df_cat = pd.DataFrame({
+        'Categoria': [cat.split(' ')[1] if ' ' in cat else cat for cat in gastos_categoria.keys()],
+        'Gastos': list(gastos_categoria.values()),
+        'Cor': [CATEGORIAS_DETALHADAS.get(cat, {}).get('cor', '#B2B2B2') for cat in gastos_categoria.keys()]
+    })
+    
+    fig = px.bar(
+        df_cat, x='Categoria', y='Gastos',
+        color='Cor',
+        color_discrete_map='identity',
+        text_auto='.2s',
+        title="Gastos Totais por Categoria"
+    )
+    fig.update_layout(
+        plot_bgcolor='rgba(0,0,0,0)',
+        paper_bgcolor='rgba(0,0,0,0)',
+        showlegend=False,
+        height=400
+    )
+    return fig
+
+@medir("figura.series_moveis")
+def figura_series_moveis(df_series):
+    """Gasto diário (barras) e somas móveis (linhas)"""
+    import plotly.express as px
+    moveis = [coluna for coluna in df_series.columns if coluna != "Diário"]
+    fig = px.line(
+        df_series.reset_index(), x="Data", y=moveis,
+        color_discrete_sequence=['#667eea', '#764ba2', '#FF6B6B'],
+        title="Somas Móveis"
+    )
+    fig.add_bar(x=df_series.index, y=df_series["Diário"], name="Diário", marker_color='#B2B2B2', opacity=0.5)
+    fig.update_layout(
+        plot_bgcolor='rgba(0,0,0,0)',
+        paper_bgcolor='rgba(0,0,0,0)',
+        height=400,
+        xaxis_title="Data",
+        yaxis_title="Gastos (R$)",
+        legend_title_text=""
+    )
+    return fig
+
+@medir("figura.semanal")
+def figura_semanal(totais):
+    """Barras com o total de cada semana"""
+    import plotly.express as px
+    fig = px.bar(
+        totais.reset_index(), x="Semana", y="Gastos",
+        color_discrete_sequence=['#667eea'],
+        title="Gastos por Semana"
+    )
+    fig.update_layout(
+        plot_bgcolor='rgba(0,0,0,0)',
+        paper_bgcolor='rgba(0,0,0,0)',
+        height=400,
+        yaxis_title="Gastos (R$)"
+    )
+    return fig
+
+@medir("figura.mes_a_mes")
+def figura_mes_a_mes(df_meses):
+    """Acumulado do mês atual contra o do mês anterior, dia a dia"""
+    import plotly.express as px
+    fig = px.line(
+        df_meses.reset_index(), x="Dia", y=list(df_meses.columns),
+        markers=True,
+        color_discrete_sequence=['#667eea', '#B2B2B2'],
+        title="Acumulado no Mês: Atual × Anterior"
+    )
+    fig.update_layout(
+        plot_bgcolor='rgba(0,0,0,0)',
+        paper_bgcolor='rgba(0,0,0,0)',
+        height=400,
+        yaxis_title="Gastos (R$)",
+        legend_title_text=""
+    )
+    return fig
+
+@medir("figura.ano_a_ano")
+def figura_ano_a_ano(df_anos):
+    """Barras agrupadas com o total de cada mês nos dois anos"""
+    import plotly.express as px
+    fig = px.bar(
+        df_anos.reset_index(), x="Mês", y=list(df_anos.columns),
+        barmode="group",
+        color_discrete_sequence=['#B2B2B2', '#667eea'],
+        title="Ano Atual × Ano Anterior"
+    )
+    fig.update_layout(
+        plot_bgcolor='rgba(0,0,0,0)',
+        paper_bgcolor='rgba(0,0,0,0)',
+        height=400,
+        yaxis_title="Gastos (R$)",
+        legend_title_text=""
+    )
+    return fig
+
+# ========== EXPORTAÇÃO ==========
+TAMANHO_BLOCO_EXPORTACAO = 50_000
+
+FORMATOS_EXPORTACAO = {
+    "csv": {
+        "rotulo": "📥 Baixar CSV",
+        "preparar": "⚙️ Preparar CSV",
+        "extensao": "csv",
+        "mime": "text/csv",
+        "ajuda": "Baixe os dados em formato CSV para Excel ou outros programas"
+    },
+    "excel": {
+        "rotulo": "📊 Baixar Excel",
+        "preparar": "⚙️ Preparar Excel",
+        "extensao": "xlsx",
+        "mime": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        "ajuda": "Baixe os dados em formato Excel"
+    },
+    "json": {
+        "rotulo": "🧾 Baixar JSON",
+        "preparar": "⚙️ Preparar JSON",
+        "extensao": "json",
+        "mime": "application/json",
+        "ajuda": "Baixe os dados em JSON (lista de gastos), o formato de troca aceito na importação"
+    }
+}
+
+def _blocos_exportacao(tabela, tamanho=TAMANHO_BLOCO_EXPORTACAO):
+    """DataFrames de até `tamanho` linhas, em ordem de inclusão (id)"""
+    posicoes = tabela.consultar(ordenar_por="id", decrescente=False)
+    for inicio in range(0, len(posicoes), tamanho):
+        yield tabela.para_dataframe(posicoes[inicio:inicio + tamanho])
+
+@medir("exportacao.csv")
+def exportar_csv(tabela, caminho):
+    """Grava o CSV bloco a bloco: a memória usada não depende do tamanho do histórico"""
+    with open(caminho, "w", encoding="utf-8", newline="") as arquivo:
+        for numero, bloco in enumerate(_blocos_exportacao(tabela)):
+            bloco.to_csv(arquivo, index=False, header=(numero == 0))
+
+@medir("exportacao.excel")
+def exportar_excel(tabela, caminho):
+    """Grava o Excel linha a linha em modo constant_memory (o xlsxwriter descarrega
+    cada linha no disco assim que a próxima começa)"""
+    import xlsxwriter
+
+    colunas = ["id", "descricao", "valor", "categoria", "data"]
+    workbook = xlsxwriter.Workbook(caminho, {"constant_memory": True})
+    try:
+        planilha = workbook.add_worksheet("Gastos")
+        negrito = workbook.add_format({"bold": True, "border": 1})
+        planilha.write_row(0, 0, colunas, negrito)
+        linha = 1
+        for bloco in _blocos_exportacao(tabela):
+            for registro in bloco[colunas].itertuples(index=False, name=None):
+                planilha.write_row(linha, 0, registro)
+                linha += 1
+    finally:
+        workbook.close()
+
+@medir("exportacao.json")
+def exportar_json(tabela, caminho):
+    """Grava a lista de gastos em JSON bloco a bloco, um gasto por linha"""
+    with open(caminho, "w", encoding="utf-8") as arquivo:
+        arquivo.write("[")
+        separador = "\n"
+        for bloco in _blocos_exportacao(tabela):
+            for registro in bloco.to_dict("records"):
+                arquivo.write(separador + json.dumps(registro, ensure_ascii=False))
+                separador = ",\n"
+        arquivo.write("\n]\n")
+
+EXPORTADORES = {"csv": exportar_csv, "excel": exportar_excel, "json": exportar_json}
+
+class RegistroExportacoes:
+    """Arquivos exportados compartilhados pelas sessões do processo, um por
+    (versão dos dados, formato), numa pasta temporária própria. Quando
+    aparece uma versão nova dos dados, os arquivos das anteriores são apagados:
+    no máximo uma versão fica em disco, e sessões fechadas não deixam sobras"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pasta = tempfile.mkdtemp(prefix="financepro_exportacoes_")
+        self.arquivos = {}
+        # Um lock por (versão, formato): duas sessões pedindo o mesmo arquivo
+        # geram uma vez só, sem bloquear os outros formatos
+        self.gerando = {}
+
+    def descartar_outras_versoes(self, chave):
+        """Apaga os arquivos de versões diferentes de `chave` (chamado quando
+        a base compartilhada publica uma versão nova)"""
+        with self.lock:
+            self._descartar_outras_versoes(chave)
+
+    def _descartar_outras_versoes(self, chave):
+        for antiga in [item for item in self.arquivos if item[0] != chave]:
+            try:
+                os.remove(self.arquivos.pop(antiga))
+            except OSError:
+                pass
+        for antiga in [item for item in self.gerando if item[0] != chave]:
+            del self.gerando[antiga]
+
+    def preparar(self, tabela, formato):
+        """Caminho do arquivo exportado para a versão atual da tabela
+        (gerado na primeira vez, reaproveitado até a tabela mudar)"""
+        item = (tabela.chave_versao(), formato)
+        with self.lock:
+            self._descartar_outras_versoes(item[0])
+            trava = self.gerando.setdefault(item, threading.Lock())
+        with trava:
+            with self.lock:
+                caminho = self.arquivos.get(item)
+            if caminho is not None and os.path.exists(caminho):
+                contar("cache_exportacao.acerto")
+                return caminho
+            contar("cache_exportacao.falta")
+
+            descritor, caminho = tempfile.mkstemp(
+                prefix="financepro_", suffix="." + FORMATOS_EXPORTACAO[formato]["extensao"], dir=self.pasta
+            )
+            os.close(descritor)
+            try:
+                EXPORTADORES[formato](tabela, caminho)
+            except Exception:
+                os.remove(caminho)
+                raise
+
+            with self.lock:
+                # Se a versão foi substituída enquanto o arquivo era gerado, ele
+                # ainda serve a esta sessão e sai na próxima troca de versão
+                self.arquivos[item] = caminho
+            return caminho
+
+@st.cache_resource
+def obter_exportacoes():
+    return RegistroExportacoes()
+
+# ========== IMPORTAÇÃO (CSV/OFX/JSON) ==========
+# Extratos são lidos e validados em blocos: cada bloco vira um único lote no
+# armazenamento ({"op": "add", "gastos": [...]}), com IDs atribuídos de uma vez
+TAMANHO_BLOCO_IMPORTACAO = 10_000
+
+# Nomes de coluna aceitos no CSV -> coluna interna
+COLUNAS_IMPORTACAO = {
+    "descricao": "descricao", "descrição": "descricao", "description": "descricao",
+    "historico": "descricao", "histórico": "descricao", "memo": "descricao",
+    "lancamento": "descricao", "lançamento": "descricao",
+    "valor": "valor", "value": "valor", "amount": "valor", "quantia": "valor",
+    "categoria": "categoria", "category": "categoria",
+    "data": "data", "date": "data", "data lancamento": "data", "data lançamento": "data"
+}
 
-# ========== FUNÇÕES AUXILIARES ==========
-@st.cache_data(ttl=300)
-def carregar_lottie_url(url: str):
-    """Carrega animação Lottie com cache"""
-    try:
-        r = requests.get(url, timeout=5)
-        if r.status_code == 200:
-            return r.json()
-    except:
-        pass
-    return None
+class ResultadoImportacao:
+    """Contagem do que foi importado e do que foi rejeitado (por motivo)"""
 
-def carregar_dados():
-    """Carrega dados com tratamento de erro"""
-    try:
-        if os.path.exists("dados_financepro.json"):
-            with open("dados_financepro.json", "r", encoding='utf-8') as f:
-                dados = json.load(f)
-                if isinstance(dados, list) and all(isinstance(item, dict) for item in dados):
-                    return dados
-    except Exception as e:
-        st.sidebar.error(f"Erro ao carregar dados: {str(e)}")
-    
-    return []
+    def __init__(self):
+        self.importados = 0
+        self.lotes = 0
+        # Linhas sem categoria que receberam a sugerida pela descrição
+        self.categorizados = 0
+        self.motivos = {}
+        # (mês, categoria) que receberam gastos, para conferir os orçamentos
+        self.meses_categorias = set()
+        self.avisos_orcamento = []
 
-def salvar_dados(dados):
-    """Salva dados com backup automático"""
+    @property
+    def rejeitados(self):
+        return sum(self.motivos.values())
+
+    def rejeitar(self, motivo, quantidade):
+        if quantidade:
+            self.motivos[motivo] = self.motivos.get(motivo, 0) + int(quantidade)
+
+def _texto_do_arquivo(arquivo):
+    """Envolve o arquivo (bytes) em texto, detectando UTF-8 ou Latin-1"""
+    if hasattr(arquivo, "seek"):
+        arquivo.seek(0)
+    amostra = arquivo.read(64 * 1024)
+    arquivo.seek(0)
+    if isinstance(amostra, str):
+        return arquivo, amostra
     try:
-        with open("dados_financepro.json", "w", encoding='utf-8') as f:
-            json.dump(dados, f, ensure_ascii=False, indent=2)
-        return True
-    except Exception as e:
-        st.error(f"Erro ao salvar dados: {str(e)}")
-        return False
+        amostra.decode("utf-8")
+        codificacao = "utf-8-sig"
+    except UnicodeDecodeError as e:
+        # Amostra cortada no meio de um caractere ainda é UTF-8
+        codificacao = "utf-8-sig" if e.start >= len(amostra) - 3 else "latin-1"
+    texto = io.TextIOWrapper(arquivo, encoding=codificacao, newline="")
+    return texto, amostra.decode(codificacao, errors="ignore")
+
+def _valores_numericos(serie):
+    """Converte valores como '1.234,56', '1,234.56', 'R$ 1.000', '10,00' ou
+    '-12.5' em float (NaN se inválido). Com '.' e ',' juntos, o último é o
+    separador decimal; um só tipo de separador seguido de grupos de
+    exatamente 3 dígitos ('1.000', '1,000', '12.345.678') separa milhares"""
+    import pandas as pd
+    if pd.api.types.is_numeric_dtype(serie):
+        return serie.astype(float)
+    texto = serie.fillna("").astype(str).str.replace(r"[R$\s]", "", regex=True)
+    milhares = texto.str.fullmatch(r"[-+]?[1-9]\d{0,2}(?:\.\d{3})+|[-+]?[1-9]\d{0,2}(?:,\d{3})+")
+    decimal_virgula = texto.str.rfind(",") > texto.str.rfind(".")
+    texto = texto.mask(milhares, texto.str.replace(r"[.,]", "", regex=True))
+    texto = texto.mask(
+        ~milhares & decimal_virgula,
+        texto.str.replace(".", "", regex=False).str.replace(",", ".", regex=False)
+    )
+    texto = texto.mask(~milhares & ~decimal_virgula, texto.str.replace(",", "", regex=False))
+    return pd.to_numeric(texto, errors="coerce")
+
+def _datas_normalizadas(serie):
+    """Datas 'YYYY-MM-DD', 'DD/MM/YYYY' ou 'YYYYMMDD...' (OFX) -> 'YYYY-MM-DD' (NaN se inválida)"""
+    import pandas as pd
+    texto = serie.astype(str).str.strip()
+    datas = pd.to_datetime(texto, format="%Y-%m-%d", errors="coerce")
+    for formato, parte in (("%d/%m/%Y", texto), ("%Y%m%d", texto.str[:8])):
+        faltam = datas.isna()
+        if not faltam.any():
+            break
+        datas = datas.where(~faltam, pd.to_datetime(parte, format=formato, errors="coerce"))
+    return datas.dt.strftime("%Y-%m-%d")
+
+def _categorias_conhecidas(serie, categoria_padrao):
+    """Aceita a chave completa ('🏠 Moradia') ou só o nome ('moradia');
+    vazio vira categoria_padrao, desconhecida vira NaN"""
+    por_nome = {nome.lower(): nome for nome in CATEGORIAS_DETALHADAS}
+    por_nome.update({nome.split(" ", 1)[-1].lower(): nome for nome in CATEGORIAS_DETALHADAS})
+    texto = serie.fillna("").astype(str).str.strip()
+    categorias = texto.str.lower().map(por_nome)
+    return categorias.where(texto != "", categoria_padrao)
+
+def validar_lote(bloco, categoria_padrao, resultado, classificador=None):
+    """Aplica as regras de adicionar_gasto a um bloco inteiro de uma vez.
+    Com um classificador, linhas sem categoria recebem a sugerida pela
+    descrição (ou categoria_padrao, se não houver sugestão confiável).
+    Devolve só as linhas válidas (descricao, valor, categoria, data)"""
+    import pandas as pd
+    descricoes = bloco["descricao"].fillna("").astype(str).str.strip().str.slice(0, 100)
+    valores = _valores_numericos(bloco["valor"])
+    if "categoria" in bloco:
+        categorias = _categorias_conhecidas(bloco["categoria"], categoria_padrao)
+        sem_categoria = bloco["categoria"].fillna("").astype(str).str.strip() == ""
+    else:
+        categorias = pd.Series(categoria_padrao, index=bloco.index)
+        sem_categoria = pd.Series(True, index=bloco.index)
+    if classificador is not None and sem_categoria.any():
+        sugeridas = pd.Series(
+            classificador.sugerir_varios(descricoes[sem_categoria].tolist()),
+            index=descricoes.index[sem_categoria], dtype=object
+        )
+        categorias = categorias.copy()
+        categorias[sem_categoria] = sugeridas.fillna(categoria_padrao)
+        resultado.categorizados += int(sugeridas.notna().sum())
+    datas = _datas_normalizadas(bloco["data"])
+
+    regras = (
+        ("Descrição vazia", descricoes == ""),
+        ("Valor inválido", valores.isna()),
+        ("Valor deve ser maior que zero", ~(valores > 0)),
+        ("Categoria inválida", categorias.isna()),
+        ("Data inválida", datas.isna())
+    )
+    invalido = pd.Series(False, index=bloco.index)
+    for motivo, falhou in regras:
+        # Cada linha conta só no primeiro motivo que a rejeitou
+        resultado.rejeitar(motivo, (falhou & ~invalido).sum())
+        invalido |= falhou
+
+    validos = ~invalido
+    return pd.DataFrame({
+        "descricao": descricoes[validos],
+        "valor": valores[validos].round(2),
+        "categoria": categorias[validos],
+        "data": datas[validos]
+    })
+
+def ler_csv_em_blocos(arquivo, debitos_negativos=False, tamanho=TAMANHO_BLOCO_IMPORTACAO):
+    """Blocos (DataFrames) de um CSV com colunas descricao, valor, data e,
+    opcionalmente, categoria. Separador (',', ';' ou tab) detectado sozinho.
+    Com debitos_negativos, valores negativos (saídas do extrato) viram gastos"""
+    import pandas as pd
+    texto, amostra = _texto_do_arquivo(arquivo)
+    cabecalho = amostra.split("\n", 1)[0]
+    separador = max((",", ";", "\t"), key=cabecalho.count)
+
+    leitor = pd.read_csv(texto, sep=separador, dtype=str, chunksize=tamanho, skipinitialspace=True)
+    for bloco in leitor:
+        bloco = bloco.rename(columns=lambda nome: COLUNAS_IMPORTACAO.get(str(nome).strip().lower(), nome))
+        faltando = {"descricao", "valor", "data"} - set(bloco.columns)
+        if faltando:
+            raise ValueError(f"Colunas obrigatórias ausentes no CSV: {', '.join(sorted(faltando))}")
+        if debitos_negativos:
+            bloco["valor"] = -_valores_numericos(bloco["valor"])
+        yield bloco
+
+def ler_json_em_blocos(arquivo, tamanho=TAMANHO_BLOCO_IMPORTACAO):
+    """Blocos (DataFrames) de uma lista de gastos em JSON (o formato da
+    exportação), lida em fluxo: o arquivo nunca é carregado inteiro"""
+    import pandas as pd
+    texto, _ = _texto_do_arquivo(arquivo)
+    gastos = []
+    for gasto in itens_array_json(texto):
+        gastos.append(gasto)
+        if len(gastos) >= tamanho:
+            yield pd.DataFrame(gastos, columns=["descricao", "valor", "categoria", "data"])
+            gastos = []
+    if gastos:
+        yield pd.DataFrame(gastos, columns=["descricao", "valor", "categoria", "data"])
+
+def ler_ofx_em_blocos(arquivo, tamanho=TAMANHO_BLOCO_IMPORTACAO):
+    """Blocos (DataFrames) das transações de um extrato OFX (SGML ou XML),
+    lido linha a linha. Débitos (TRNAMT negativo) viram gastos positivos;
+    créditos ficam com valor negativo e são rejeitados na validação"""
+    texto, _ = _texto_do_arquivo(arquivo)
+    etiqueta = re.compile(r"<(/?)([A-Za-z0-9.]+)>([^<\r\n]*)")
+    transacoes = []
+    atual = None
+    for linha in texto:
+        for fechamento, nome, conteudo in etiqueta.findall(linha):
+            nome = nome.upper()
+            if nome == "STMTTRN":
+                if fechamento:
+                    if atual is not None:
+                        transacoes.append(atual)
+                    atual = None
+                else:
+                    atual = {}
+            elif atual is not None and not fechamento and conteudo.strip():
+                atual[nome] = conteudo.strip()
+        if len(transacoes) >= tamanho:
+            yield _bloco_ofx(transacoes)
+            transacoes = []
+    if transacoes:
+        yield _bloco_ofx(transacoes)
+
+def _bloco_ofx(transacoes):
+    import pandas as pd
+    bloco = pd.DataFrame(transacoes, columns=["MEMO", "NAME", "TRNAMT", "DTPOSTED"])
+    return pd.DataFrame({
+        "descricao": bloco["MEMO"].fillna(bloco["NAME"]),
+        "valor": -pd.to_numeric(bloco["TRNAMT"].str.replace(",", ".", regex=False), errors="coerce"),
+        "data": bloco["DTPOSTED"]
+    })
 
 # ========== CONFIGURAÇÕES ==========
 CATEGORIAS_DETALHADAS = {
@@ -214,23 +3192,87 @@ ANIMACOES = {
     "success": "https://assets1.lottiefiles.com/packages/lf20_ykfpefcp.json"
 }
 
+# Usadas enquanto a animação original não está no cache (ou sem rede)
+ANIMACOES_EMBUTIDAS = {
+    "dashboard": _animacao_embutida("#667eea"),
+    "add": _animacao_embutida("#764ba2"),
+    "success": _animacao_embutida("#2ecc71")
+}
+
+# ========== ORÇAMENTOS ==========
+# Limite mensal por categoria. A verificação lê a célula mês × categoria do
+# cubo (mantida a cada inclusão/remoção): custa O(1), com qualquer número de
+# orçamentos e de gastos no histórico
+ARQUIVO_ORCAMENTOS = "dados_financepro.orcamentos.json"
+# A partir desta fração do limite a barra do dashboard fica amarela
+ALERTA_ORCAMENTO = 0.8
+
+class Orcamentos:
+    """Orçamentos ({categoria: limite mensal}) compartilhados pelas sessões
+    do processo; o arquivo só é relido quando muda (outro processo gravou)"""
+
+    def __init__(self, caminho=ARQUIVO_ORCAMENTOS):
+        self.caminho = caminho
+        self.lock = threading.Lock()
+        self.limites = {}
+        self.identidade = None
+        # Motivo de o arquivo ter sido ignorado (corrompido ou editado à mão)
+        self.erro = None
+
+    def atuais(self):
+        identidade = _identidade(self.caminho)
+        if identidade != self.identidade:
+            with self.lock:
+                try:
+                    with open(self.caminho, "r", encoding='utf-8') as f:
+                        limites = {
+                            categoria: float(limite) for categoria, limite in json.load(f).items()
+                            if categoria in CATEGORIAS_DETALHADAS
+                        }
+                    self.erro = None
+                except FileNotFoundError:
+                    limites = {}
+                    self.erro = None
+                except (ValueError, TypeError, AttributeError) as e:
+                    # Arquivo inválido vale como "sem orçamentos", sem derrubar quem consulta
+                    limites = {}
+                    self.erro = f"Arquivo de orçamentos inválido ({self.caminho}): {str(e)}"
+                self.limites = {categoria: limite for categoria, limite in limites.items() if limite > 0}
+                self.identidade = identidade
+        return self.limites
+
+    def definir(self, limites):
+        """Grava os limites (valores zerados removem o orçamento da categoria)"""
+        limites = {categoria: float(limite) for categoria, limite in limites.items() if limite and limite > 0}
+        with self.lock:
+            gravar_atomico(self.caminho, lambda f: json.dump(limites, f, ensure_ascii=False, indent=2))
+            self.limites = limites
+            self.identidade = _identidade(self.caminho)
+            self.erro = None
+
+@st.cache_resource
+def obter_orcamentos():
+    return Orcamentos()
+
+def situacao_orcamento(cubo, limites, mes, categoria):
+    """(gasto da categoria no mês, limite), ou None se ela não tem orçamento"""
+    limite = limites.get(categoria)
+    if limite is None:
+        return None
+    return cubo.total_celula(mes, categoria), limite
+
 # ========== APLICAÇÃO PRINCIPAL ==========
 class FinancePro:
     def __init__(self):
-        self.validador = ValidadorApp()
-        self.dados = carregar_dados()
+        # Começa a baixar as animações antes de qualquer página precisar delas
+        obter_cache_lottie()
         self.inicializar_session_state()
     
     def inicializar_session_state(self):
         """Inicialização do session state"""
-        # Inicializar dados se não existirem
-        if 'dados' not in st.session_state:
-            st.session_state.dados = self.dados
-        
-        # Inicializar último ID
-        if 'ultimo_id' not in st.session_state:
-            ultimo_id = max([gasto.get('id', 0) for gasto in self.dados] or [0])
-            st.session_state.ultimo_id = ultimo_id
+        # Os dados vêm da base compartilhada do processo: a sessão só guarda
+        # referências, atualizadas quando a versão dos dados muda
+        self._usar_estado(obter_base_compartilhada().atual())
         
         # Inicializar formulário se não existir
         if 'formulario' not in st.session_state:
@@ -241,16 +3283,33 @@ class FinancePro:
                 "data": datetime.now().strftime("%Y-%m-%d")
             }
     
+    def _usar_estado(self, estado):
+        """Aponta a sessão para um estado da base compartilhada (sem copiar)"""
+        st.session_state.dados = estado.tabela
+        st.session_state.cubo = estado.cubo
+        st.session_state.indice_datas = estado.indice_datas
+        st.session_state.indice_texto = estado.indice_texto
+        st.session_state.classificador = estado.classificador
+    
+    def _alterar(self, operacao, mutacao):
+        """Grava a operação via base compartilhada; devolve (gravou, retorno da mutação)"""
+        novo, retorno = obter_base_compartilhada().alterar(operacao, mutacao)
+        if novo is None:
+            return False, retorno
+        self._usar_estado(novo)
+        return True, retorno
+    
     def validar_e_iniciar(self):
         """Valida e inicia a aplicação"""
         try:
-            return self.validador.validar_aplicacao()
+            return aplicacao_validada()
         except Exception as e:
             st.error(f"Erro na validação: {str(e)}")
             return False
     
     def header(self):
         """Header da aplicação"""
+        from streamlit_lottie import st_lottie
         col1, col2, col3 = st.columns([2, 3, 1])
         
         with col1:
@@ -267,7 +3326,7 @@ class FinancePro:
             """, unsafe_allow_html=True)
         
         with col3:
-            total_gastos = sum(gasto.get("valor", 0) for gasto in st.session_state.dados)
+            total_gastos = st.session_state.cubo.total_geral()
             st.markdown(f"""
             <div style="text-align: center; padding: 1rem;">
                 <div style="font-size: 0.9rem; color: #666;">Total Gasto</div>
@@ -291,6 +3350,7 @@ class FinancePro:
             opcoes_navegacao = [
                 "📊 Dashboard", 
                 "💰 Adicionar Gasto", 
+                "📥 Importar Extrato",
                 "📈 Analytics"
             ]
             
@@ -304,10 +3364,10 @@ class FinancePro:
             st.markdown("---")
             st.markdown("**📈 Estatísticas Rápidas**")
             
-            dados_atual = st.session_state.dados
-            total_gastos = sum(gasto.get("valor", 0) for gasto in dados_atual)
+            cubo = st.session_state.cubo
+            total_gastos = cubo.total_geral()
             gastos_mes = self.obter_gastos_mes_atual()
-            categorias_ativas = len(set(gasto.get("categoria", "") for gasto in dados_atual if gasto.get("categoria")))
+            categorias_ativas = len([categoria for categoria in cubo.categorias() if categoria])
             
             st.metric("Total", f"R$ {total_gastos:,.0f}")
             st.metric("Este Mês", f"R$ {gastos_mes:,.0f}")
@@ -326,93 +3386,97 @@ class FinancePro:
             
         return pagina_selecionada
     
+    @medir("consulta.gastos_mes_atual")
     def obter_gastos_mes_atual(self):
         """Calcula gastos do mês atual"""
         try:
             mes_atual = datetime.now().strftime("%Y-%m")
-            return sum(
-                gasto.get("valor", 0) for gasto in st.session_state.dados 
-                if gasto.get("data", "").startswith(mes_atual)
-            )
+            return st.session_state.cubo.total_mes(mes_atual)
         except:
             return 0
     
+    @medir("consulta.gastos_por_mes")
     def obter_gastos_por_mes(self, meses=6):
         """Retorna gastos dos últimos meses"""
         try:
-            hoje = datetime.now()
-            gastos_por_mes = {}
-            
-            # Criar lista dos últimos N meses
-            for i in range(meses):
-                data_ref = hoje.replace(day=1) - timedelta(days=30*i)
-                mes_ano = data_ref.strftime("%Y-%m")
-                gastos_por_mes[mes_ano] = 0
-            
-            # Calcular gastos para cada mês
-            for gasto in st.session_state.dados:
-                data_gasto = gasto.get("data", "")
-                if data_gasto:
-                    mes_gasto = data_gasto[:7]  # YYYY-MM
-                    if mes_gasto in gastos_por_mes:
-                        gastos_por_mes[mes_gasto] += gasto.get("valor", 0)
-            
-            # Ordenar por mês (mais recente primeiro)
-            gastos_ordenados = dict(sorted(gastos_por_mes.items(), reverse=True))
-            
-            return gastos_ordenados
+            # Últimos N meses de calendário, já do mais recente ao mais antigo
+            cubo = st.session_state.cubo
+            return {
+                mes_ano: cubo.total_mes(mes_ano)
+                for mes_ano in meses_anteriores(date.today(), meses)
+            }
         except Exception as e:
             st.error(f"Erro ao calcular gastos por mês: {str(e)}")
             return {}
     
+    @medir("consulta.gastos_por_categoria_mensal")
     def obter_gastos_por_categoria_mensal(self, meses=1):
         """Retorna gastos por categoria do mês atual ou dos últimos meses"""
         try:
-            hoje = datetime.now()
-            data_inicio = hoje.replace(day=1) - timedelta(days=30*(meses-1))
-            
-            gastos_categoria = {}
-            
-            for gasto in st.session_state.dados:
-                data_gasto_str = gasto.get("data", "")
-                if data_gasto_str:
-                    try:
-                        data_gasto = datetime.strptime(data_gasto_str, "%Y-%m-%d")
-                        if data_gasto >= data_inicio:
-                            categoria = gasto.get("categoria", "💼 Outros")
-                            valor = gasto.get("valor", 0)
-                            
-                            if categoria not in gastos_categoria:
-                                gastos_categoria[categoria] = 0
-                            gastos_categoria[categoria] += valor
-                    except Exception as e:
-                        continue
-            
-            return gastos_categoria
+            mes_inicio = meses_anteriores(date.today(), meses)[-1]
+            return self.obter_gastos_por_periodo(datetime.strptime(mes_inicio, "%Y-%m").date())
         except Exception as e:
             st.error(f"Erro ao calcular gastos por categoria mensal: {str(e)}")
             return {}
     
+    @medir("consulta.resumo_dashboard")
+    def obter_resumo_dashboard(self):
+        """Retorna todas as métricas e séries do dashboard de uma vez"""
+        try:
+            return calcular_resumo_dashboard(st.session_state.cubo)
+        except Exception as e:
+            st.error(f"Erro ao calcular resumo do dashboard: {str(e)}")
+            return ResumoDashboard()
+    
+    @medir("consulta.gastos_por_periodo")
+    def obter_gastos_por_periodo(self, inicio, fim=None):
+        """Retorna gastos por categoria entre duas datas (inclusivas)"""
+        try:
+            return st.session_state.indice_datas.totais_por_categoria(inicio, fim)
+        except Exception as e:
+            st.error(f"Erro ao calcular gastos por período: {str(e)}")
+            return {}
+    
+    @medir("consulta.total_periodo")
+    def obter_total_periodo(self, inicio, fim=None, categorias=None):
+        """Retorna o total gasto entre duas datas (inclusivas) nas categorias escolhidas"""
+        try:
+            return st.session_state.indice_datas.total(inicio, fim, categorias)
+        except Exception as e:
+            st.error(f"Erro ao calcular total do período: {str(e)}")
+            return 0.0
+    
+    @medir("consulta.busca_descricao")
+    def buscar_por_descricao(self, consulta):
+        """Retorna as posições (na tabela) dos gastos cuja descrição casa com a busca (None sem busca)"""
+        try:
+            ids = st.session_state.indice_texto.buscar(consulta)
+            return None if ids is None else st.session_state.dados.posicoes_de(ids)
+        except Exception as e:
+            st.error(f"Erro ao buscar gastos: {str(e)}")
+            return None
+    
+    @medir("consulta.gastos_recorrentes")
+    def obter_gastos_recorrentes(self):
+        """Retorna as séries de gastos recorrentes (recalculadas só quando os dados mudam)"""
+        try:
+            return obter_cache_recorrentes().obter(st.session_state.dados)
+        except Exception as e:
+            st.error(f"Erro ao detectar gastos recorrentes: {str(e)}")
+            return []
+    
+    @medir("consulta.gastos_por_categoria_total")
     def obter_gastos_por_categoria_total(self):
         """Retorna gastos totais por categoria"""
         try:
-            gastos_categoria = {}
-            
-            for gasto in st.session_state.dados:
-                categoria = gasto.get("categoria", "💼 Outros")
-                valor = gasto.get("valor", 0)
-                
-                if categoria not in gastos_categoria:
-                    gastos_categoria[categoria] = 0
-                gastos_categoria[categoria] += valor
-            
-            return gastos_categoria
+            return st.session_state.cubo.totais_por_categoria()
         except Exception as e:
             st.error(f"Erro ao calcular gastos por categoria total: {str(e)}")
             return {}
     
     def adicionar_gasto(self, descricao, valor, categoria, data):
         """Adiciona gasto com validação"""
+        from streamlit_lottie import st_lottie
         try:
             # Validações
             if not descricao or not descricao.strip():
@@ -423,12 +3487,17 @@ class FinancePro:
                 st.error("❌ Valor deve ser maior que zero")
                 return False
             
+            if categoria == CATEGORIA_AUTOMATICA:
+                categoria = self.categoria_sugerida(descricao)
+            
             if categoria not in CATEGORIAS_DETALHADAS:
                 st.error("❌ Categoria inválida")
                 return False
             
-            # Criar novo gasto
-            novo_id = st.session_state.ultimo_id + 1
+            # Criar novo gasto (ID reservado no armazenamento: único entre sessões)
+            novo_id = reservar_ids(1)
+            if novo_id is None:
+                return False
             novo_gasto = {
                 "id": novo_id,
                 "descricao": descricao.strip(),
@@ -438,10 +3507,14 @@ class FinancePro:
             }
             
             # Adicionar e salvar
-            st.session_state.dados.append(novo_gasto)
-            st.session_state.ultimo_id = novo_id
+            gravado, _ = self._alterar(
+                {"op": "add", "gasto": novo_gasto},
+                lambda estado: estado.adicionar([novo_gasto])
+            )
             
-            if salvar_dados(st.session_state.dados):
+            if gravado:
+                self.verificar_orcamento(novo_gasto)
+                
                 # Feedback visual
                 success_anim = carregar_lottie_url(ANIMACOES["success"])
                 if success_anim:
@@ -451,28 +3524,182 @@ class FinancePro:
                 return True
             else:
                 st.error("❌ Erro ao salvar dados")
-                # Reverter em caso de erro
-                st.session_state.dados.pop()
                 return False
                 
         except Exception as e:
             st.error(f"❌ Erro ao adicionar gasto: {str(e)}")
             return False
     
+    @medir("consulta.categoria_sugerida")
+    def categoria_sugerida(self, descricao):
+        """Categoria sugerida pela descrição ("💼 Outros" sem sugestão confiável).
+        A escolha também fica guardada para aparecer depois do rerun"""
+        try:
+            sugestao = st.session_state.classificador.sugerir(descricao)
+        except Exception as e:
+            st.error(f"Erro ao sugerir categoria: {str(e)}")
+            sugestao = None
+        if sugestao is None:
+            categoria = "💼 Outros"
+            mensagem = f"🤖 Sem gastos parecidos no histórico: categoria {categoria}"
+        else:
+            categoria, probabilidade = sugestao
+            mensagem = f"🤖 Categoria sugerida pela descrição: {categoria} ({probabilidade:.0%} de confiança)"
+        st.info(mensagem)
+        st.session_state.categoria_sugerida = mensagem
+        return categoria
+    
+    def aviso_orcamento(self, mes, categoria):
+        """Aviso se a categoria está acima do orçamento no mês ('YYYY-MM'), ou None"""
+        situacao = situacao_orcamento(st.session_state.cubo, obter_orcamentos().atuais(), mes, categoria)
+        if situacao is None or situacao[0] <= situacao[1]:
+            return None
+        gasto_mes, limite = situacao
+        return (
+            f"⚠️ {categoria} passou do orçamento de {mes[5:7]}/{mes[:4]}: "
+            f"R$ {gasto_mes:,.2f} de R$ {limite:,.2f} (R$ {gasto_mes - limite:,.2f} acima)"
+        )
+    
+    def verificar_orcamento(self, gasto):
+        """Avisa se o gasto deixou a categoria acima do orçamento do mês
+        (o aviso também fica guardado para aparecer depois do rerun)"""
+        aviso = self.aviso_orcamento(gasto["data"][:7], gasto["categoria"])
+        if aviso:
+            st.warning(aviso)
+            st.session_state.aviso_orcamento = aviso
+    
+    @medir("consulta.orcamentos")
+    def obter_situacao_orcamentos(self):
+        """Retorna (categoria, gasto do mês, limite) de cada categoria com orçamento"""
+        try:
+            mes_atual = date.today().strftime("%Y-%m")
+            limites = obter_orcamentos().atuais()
+            cubo = st.session_state.cubo
+            return [
+                (categoria,) + situacao_orcamento(cubo, limites, mes_atual, categoria)
+                for categoria in CATEGORIAS_DETALHADAS if categoria in limites
+            ]
+        except Exception as e:
+            st.error(f"Erro ao calcular orçamentos: {str(e)}")
+            return []
+    
+    def salvar_orcamentos(self, limites):
+        """Grava os orçamentos mensais por categoria"""
+        try:
+            obter_orcamentos().definir(limites)
+            st.success("✅ Orçamentos salvos com sucesso!")
+            return True
+        except Exception as e:
+            st.error(f"❌ Erro ao salvar orçamentos: {str(e)}")
+            return False
+    
+    def painel_orcamentos(self):
+        """Progresso de cada orçamento no mês atual e formulário dos limites"""
+        with st.container():
+            st.markdown('<div class="custom-card">', unsafe_allow_html=True)
+            st.subheader("🎯 Orçamentos do Mês")
+            
+            situacao = self.obter_situacao_orcamentos()
+            if obter_orcamentos().erro:
+                st.warning(f"⚠️ {obter_orcamentos().erro}. Os orçamentos foram ignorados; salve-os de novo abaixo.")
+            for categoria, gasto_mes, limite in situacao:
+                proporcao = gasto_mes / limite
+                icone = "🔴" if proporcao > 1 else "🟡" if proporcao >= ALERTA_ORCAMENTO else "🟢"
+                st.progress(
+                    min(proporcao, 1.0),
+                    text=f"{icone} {categoria}: R$ {gasto_mes:,.2f} de R$ {limite:,.2f} ({proporcao:.0%})"
+                )
+            if not situacao:
+                st.info("🎯 Nenhum orçamento definido. Defina limites mensais por categoria abaixo.")
+            
+            with st.expander("⚙️ Definir Orçamentos"):
+                limites = obter_orcamentos().atuais()
+                with st.form("form_orcamentos"):
+                    novos_limites = {}
+                    colunas = st.columns(2)
+                    for posicao, (categoria, info) in enumerate(CATEGORIAS_DETALHADAS.items()):
+                        with colunas[posicao % 2]:
+                            novos_limites[categoria] = st.number_input(
+                                f"{categoria} (R$ por mês):",
+                                min_value=0.0,
+                                step=50.0,
+                                format="%.2f",
+                                value=limites.get(categoria, 0.0),
+                                help=f"{info['dica']}. Deixe 0 para não limitar",
+                                key=f"orcamento_{posicao}"
+                            )
+                    
+                    if st.form_submit_button("💾 Salvar Orçamentos", use_container_width=True):
+                        if self.salvar_orcamentos(novos_limites):
+                            st.rerun()
+            
+            st.markdown('</div>', unsafe_allow_html=True)
+    
+    @medir("importacao.gravar")
+    def importar_gastos(self, blocos, categoria_padrao="💼 Outros", categorizar=False):
+        """Importa blocos de um extrato: cada bloco é validado de forma vetorizada,
+        recebe IDs de uma vez e é gravado como um único lote. Com categorizar,
+        linhas sem categoria recebem a sugerida pela descrição"""
+        import numpy as np
+        resultado = ResultadoImportacao()
+        try:
+            for bloco in blocos:
+                # O classificador já inclui os lotes anteriores desta importação
+                classificador = st.session_state.classificador if categorizar else None
+                lote = validar_lote(bloco, categoria_padrao, resultado, classificador)
+                if lote.empty:
+                    continue
+                
+                primeiro_id = reservar_ids(len(lote))
+                if primeiro_id is None:
+                    break
+                lote.insert(0, "id", np.arange(primeiro_id, primeiro_id + len(lote), dtype=np.int64))
+                registros = lote.to_dict("records")
+                
+                gravado, _ = self._alterar(
+                    {"op": "add", "gastos": registros},
+                    lambda estado: estado.adicionar_lote(lote, registros)
+                )
+                if not gravado:
+                    break
+                
+                resultado.importados += len(lote)
+                resultado.lotes += 1
+                resultado.meses_categorias.update(zip(lote["data"].str[:7], lote["categoria"]))
+            
+            # Orçamentos: uma consulta ao cubo por (mês, categoria) importado
+            for mes, categoria in sorted(resultado.meses_categorias):
+                aviso = self.aviso_orcamento(mes, categoria)
+                if aviso:
+                    resultado.avisos_orcamento.append(aviso)
+        except Exception as e:
+            st.error(f"❌ Erro ao importar extrato: {str(e)}")
+        
+        return resultado
+    
     def remover_gasto(self, gasto_id):
         """Remove um gasto específico"""
+        return self.remover_gastos([gasto_id])
+    
+    def remover_gastos(self, gasto_ids):
+        """Remove um ou vários gastos com uma única operação no armazenamento"""
         try:
-            gastos_antes = len(st.session_state.dados)
-            st.session_state.dados = [g for g in st.session_state.dados if g.get('id') != gasto_id]
+            dados = st.session_state.dados
+            ids_existentes = [gasto_id for gasto_id in gasto_ids if dados.posicao(gasto_id) is not None]
             
-            if len(st.session_state.dados) < gastos_antes:
-                if salvar_dados(st.session_state.dados):
-                    st.success(f"✅ Gasto removido com sucesso!")
+            if ids_existentes:
+                gravado, gastos_removidos = self._alterar(
+                    {"op": "remove", "ids": ids_existentes},
+                    lambda estado: estado.remover(ids_existentes)
+                )
+                if gravado:
+                    if len(gastos_removidos) == 1:
+                        st.success(f"✅ Gasto removido com sucesso!")
+                    else:
+                        st.success(f"✅ {len(gastos_removidos)} gastos removidos com sucesso!")
                     return True
                 else:
                     st.error("❌ Erro ao salvar dados após remoção")
-                    # Reverter
-                    st.session_state.dados = carregar_dados()
                     return False
             else:
                 st.error("❌ Gasto não encontrado")
@@ -483,12 +3710,15 @@ class FinancePro:
             return False
     
     def limpar_todos_dados(self):
-        """Remove todos os dados do sistema"""
+        """Remove todos os dados do sistema (depois de um backup do estado atual)"""
         try:
-            st.session_state.dados = []
-            st.session_state.ultimo_id = 0
+            if BACKUP_ATIVO and obter_backup_automatico().criar_ponto() is None:
+                st.error(f"❌ Backup antes de limpar falhou: {obter_backup_automatico().ultimo_erro}")
+                return False
             
-            if salvar_dados(st.session_state.dados):
+            gravado, _ = self._alterar({"op": "clear"}, lambda estado: estado.limpar())
+            
+            if gravado:
                 st.success("✅ Todos os dados foram removidos com sucesso!")
                 return True
             else:
@@ -499,6 +3729,58 @@ class FinancePro:
             st.error(f"❌ Erro ao limpar dados: {str(e)}")
             return False
     
+    def restaurar_backup(self, ponto):
+        """Volta os dados para um ponto de backup (o estado atual vira um ponto antes)"""
+        backup = obter_backup_automatico()
+        try:
+            if backup.criar_ponto() is None:
+                st.error(f"❌ Erro ao criar backup do estado atual: {backup.ultimo_erro}")
+                return False
+            
+            backup.restaurar(ponto)
+            agendar_backup()
+            self._usar_estado(obter_base_compartilhada().atual())
+            st.success("✅ Dados restaurados com sucesso!")
+            return True
+            
+        except Exception as e:
+            st.error(f"❌ Erro ao restaurar backup: {str(e)}")
+            return False
+    
+    def painel_backups(self):
+        """Pontos de restauração do backup automático"""
+        backup = obter_backup_automatico()
+        with st.expander("🛟 Backups Automáticos"):
+            if backup.ultimo_erro:
+                st.error(f"❌ O último backup falhou: {backup.ultimo_erro}")
+            
+            pontos = {ponto["nome"]: ponto for ponto in backup.pontos()}
+            if not pontos:
+                st.info("Nenhum ponto de restauração ainda: o primeiro é criado logo após a próxima alteração.")
+            else:
+                st.caption(
+                    f"Pontos de restauração: {len(pontos)} • "
+                    f"{backup.armazem.tamanho_em_disco() / 1024 / 1024:.2f} MB em disco "
+                    f"(blocos repetidos entre pontos são gravados uma única vez)"
+                )
+                
+                def rotulo_ponto(nome):
+                    ponto = pontos[nome]
+                    tamanho = sum(arquivo["tamanho"] for arquivo in ponto["arquivos"].values())
+                    criado_em = datetime.fromisoformat(ponto["criado_em"]).strftime("%d/%m/%Y %H:%M:%S")
+                    return f"{criado_em} • versão {ponto['versao']} • {tamanho / 1024:,.0f} KB"
+                
+                nome = st.selectbox("Ponto de restauração", list(pontos), format_func=rotulo_ponto, key="backup_ponto")
+                st.caption("💡 O estado atual é salvo como um novo ponto antes de restaurar")
+                if st.button("🔄 Restaurar este ponto", use_container_width=True):
+                    if self.restaurar_backup(pontos[nome]):
+                        st.rerun()
+            
+            if st.button("💾 Criar backup agora", use_container_width=True):
+                if backup.criar_ponto() is not None:
+                    st.rerun()
+                st.error(f"❌ Erro ao criar backup: {backup.ultimo_erro}")
+    
     def criar_exportacao_google_sheets(self):
         """Cria dados formatados para Google Sheets"""
         dados = st.session_state.dados
@@ -507,7 +3789,7 @@ class FinancePro:
             return None
         
         # Criar DataFrame organizado
-        df = pd.DataFrame(dados)
+        df = dados.para_dataframe()
         
         # Formatar colunas para melhor visualização
         df_export = df[['id', 'data', 'descricao', 'categoria', 'valor']].copy()
@@ -516,17 +3798,52 @@ class FinancePro:
         
         return df_export
     
+    def botao_exportacao(self, formato):
+        """Botão "Preparar" que gera o arquivo (ou reaproveita o da versão atual
+        dos dados) e mostra o download só nesse rerun: o arquivo só é lido para
+        a memória quando o usuário pede"""
+        dados = st.session_state.dados
+        config = FORMATOS_EXPORTACAO[formato]
+        
+        if not dados:
+            st.button(config["rotulo"], disabled=True, use_container_width=True)
+            return
+        
+        if not st.button(config["preparar"], key=f"preparar_{formato}",
+                         use_container_width=True, help=config["ajuda"]):
+            return
+        
+        try:
+            with st.spinner("Gerando arquivo..."):
+                caminho = obter_exportacoes().preparar(dados, formato)
+            with open(caminho, "rb") as arquivo:
+                st.download_button(
+                    label=config["rotulo"],
+                    data=arquivo,
+                    file_name=f"financepro_{datetime.now().strftime('%Y%m%d')}.{config['extensao']}",
+                    mime=config["mime"],
+                    use_container_width=True,
+                    help=config["ajuda"],
+                    key=f"baixar_{formato}"
+                )
+        except Exception as e:
+            st.error(f"❌ Erro ao gerar exportação: {str(e)}")
+    
+    @medir("pagina.dashboard")
     def dashboard(self):
         """Dashboard principal"""
         self.header()
         
         dados = st.session_state.dados
+        resumo = self.obter_resumo_dashboard()
+        figuras = obter_cache_figuras()
+        versao_dados = dados.chave_versao()
         
         # Métricas Principais
         col1, col2, col3, col4 = st.columns(4)
         
         with col1:
-            total_geral = sum(gasto.get("valor", 0) for gasto in dados)
+            total_geral = resumo.total_geral
             st.markdown(f"""
             <div class="metric-card">
                 <div style="font-size: 0.9rem;">Total Geral</div>
@@ -535,7 +3852,7 @@ class FinancePro:
             """, unsafe_allow_html=True)
         
         with col2:
-            gastos_mes = self.obter_gastos_mes_atual()
+            gastos_mes = resumo.gastos_mes_atual
             st.markdown(f"""
             <div class="metric-card">
                 <div style="font-size: 0.9rem;">Este Mês</div>
@@ -544,8 +3861,7 @@ class FinancePro:
             """, unsafe_allow_html=True)
         
         with col3:
-            meses_unicos = len(set(gasto.get("data", "")[:7] for gasto in dados if gasto.get("data")))
-            media_mensal = total_geral / max(1, meses_unicos)
+            media_mensal = resumo.media_mensal
             st.markdown(f"""
             <div class="metric-card">
                 <div style="font-size: 0.9rem;">Média Mensal</div>
@@ -554,7 +3870,7 @@ class FinancePro:
             """, unsafe_allow_html=True)
         
         with col4:
-            total_registros = len(dados)
+            total_registros = resumo.total_registros
             st.markdown(f"""
             <div class="metric-card">
                 <div style="font-size: 0.9rem;">Total Registros</div>
@@ -562,47 +3878,28 @@ class FinancePro:
             </div>
             """, unsafe_allow_html=True)
         
+        self.painel_orcamentos()
+        
         # Seção de Exportação
         with st.container():
             st.markdown('<div class="custom-card">', unsafe_allow_html=True)
             st.subheader("📤 Exportar Dados")
             
-            col_exp1, col_exp2, col_exp3 = st.columns(3)
+            col_exp1, col_exp2, col_exp3, col_exp4 = st.columns(4)
             
             with col_exp1:
                 # Exportar para CSV
-                if dados:
-                    csv_data = pd.DataFrame(dados).to_csv(index=False)
-                    st.download_button(
-                        label="📥 Baixar CSV",
-                        data=csv_data,
-                        file_name=f"financepro_{datetime.now().strftime('%Y%m%d')}.csv",
-                        mime="text/csv",
-                        use_container_width=True,
-                        help="Baixe os dados em formato CSV para Excel ou outros programas"
-                    )
-                else:
-                    st.button("📥 Baixar CSV", disabled=True, use_container_width=True)
+                self.botao_exportacao("csv")
             
             with col_exp2:
                 # Exportar para Excel
-                if dados:
-                    output = io.BytesIO()
-                    with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-                        pd.DataFrame(dados).to_excel(writer, index=False, sheet_name='Gastos')
-                    excel_data = output.getvalue()
-                    st.download_button(
-                        label="📊 Baixar Excel",
-                        data=excel_data,
-                        file_name=f"financepro_{datetime.now().strftime('%Y%m%d')}.xlsx",
-                        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                        use_container_width=True,
-                        help="Baixe os dados em formato Excel"
-                    )
-                else:
-                    st.button("📊 Baixar Excel", disabled=True, use_container_width=True)
+                self.botao_exportacao("excel")
             
             with col_exp3:
+                # Exportar para JSON (formato de troca)
+                self.botao_exportacao("json")
+            
+            with col_exp4:
                 # Instruções Google Sheets
                 if dados:
                     with st.expander("🌐 Google Sheets", icon="📋"):
@@ -634,40 +3931,11 @@ class FinancePro:
                 st.markdown('<div class="custom-card">', unsafe_allow_html=True)
                 st.subheader("📈 Evolução Mensal")
                 
-                gastos_mensais = self.obter_gastos_por_mes(6)
+                gastos_mensais = resumo.gastos_por_mes
                 if gastos_mensais and any(gastos_mensais.values()):
-                    # Converter para DataFrame para o gráfico
-                    meses = []
-                    valores = []
-                    
-                    for mes, valor in gastos_mensais.items():
-                        meses.append(f"{mes[5:7]}/{mes[2:4]}")  # MM/YY
-                        valores.append(valor)
-                    
-                    df_mensal = pd.DataFrame({
-                        'Mês': meses,
-                        'Gastos': valores
-                    })
-                    
-                    fig = px.line(
-                        df_mensal, x='Mês', y='Gastos',
-                        markers=True,
-                        line_shape='spline',
-                        color_discrete_sequence=['#667eea'],
-                        title="Gastos dos Últimos 6 Meses"
-                    )
-                    fig.update_layout(
-                        plot_bgcolor='rgba(0,0,0,0)',
-                        paper_bgcolor='rgba(0,0,0,0)',
-                        height=300,
-                        margin=dict(l=20, r=20, t=50, b=20),
-                        xaxis_title="Mês",
-                        yaxis_title="Gastos (R$)",
-                        showlegend=False
-                    )
-                    fig.update_traces(
-                        line=dict(width=3),
-                        marker=dict(size=8)
+                    fig = figuras.obter(
+                        (versao_dados, "evolucao_mensal", tuple(gastos_mensais)),
+                        lambda: figura_evolucao_mensal(gastos_mensais)
                     )
                     st.plotly_chart(fig, use_container_width=True)
                     
@@ -697,25 +3965,35 @@ class FinancePro:
                 # Obter dados conforme a seleção
                 if tipo_visualizacao == "Mensal":
                     with col_view2:
-                        periodo_opcoes = ["Este Mês", "Últimos 3 Meses", "Últimos 6 Meses"]
+                        periodo_opcoes = ["Este Mês", "Últimos 3 Meses", "Últimos 6 Meses", "Personalizado"]
                         periodo = st.selectbox(
                             "Período:",
                             periodo_opcoes,
                             key="periodo_mensal"
                         )
+                        
+                        if periodo == "Personalizado":
+                            hoje = date.today()
+                            intervalo = st.date_input(
+                                "Intervalo:",
+                                (hoje.replace(day=1), hoje),
+                                key="periodo_personalizado"
+                            )
                     
-                    if periodo == "Este Mês":
-                        gastos_categoria = self.obter_gastos_por_categoria_mensal(1)
-                        titulo_grafico = "Gastos por Categoria - Este Mês"
-                    elif periodo == "Últimos 3 Meses":
-                        gastos_categoria = self.obter_gastos_por_categoria_mensal(3)
-                        titulo_grafico = "Gastos por Categoria - Últimos 3 Meses"
-                    else:  # Últimos 6 Meses
-                        gastos_categoria = self.obter_gastos_por_categoria_mensal(6)
-                        titulo_grafico = "Gastos por Categoria - Últimos 6 Meses"
+                    if periodo in PERIODOS_CATEGORIA:
+                        gastos_categoria = resumo.gastos_por_categoria[periodo]
+                        titulo_grafico = f"Gastos por Categoria - {periodo}"
+                        opcoes_grafico = (tipo_visualizacao, periodo, date.today())
+                    else:  # Personalizado
+                        # Enquanto o usuário escolhe, o intervalo tem só a data inicial
+                        inicio, fim = (intervalo[0], intervalo[-1]) if intervalo else (hoje, hoje)
+                        gastos_categoria = self.obter_gastos_por_periodo(inicio, fim)
+                        titulo_grafico = f"Gastos por Categoria - {inicio:%d/%m/%Y} a {fim:%d/%m/%Y}"
+                        opcoes_grafico = (tipo_visualizacao, periodo, inicio, fim)
                 else:  # Total
-                    gastos_categoria = self.obter_gastos_por_categoria_total()
+                    gastos_categoria = resumo.gastos_por_categoria["Total"]
                     titulo_grafico = "Gastos por Categoria - Total"
+                    opcoes_grafico = (tipo_visualizacao,)
                 
                 if gastos_categoria and any(valor > 0 for valor in gastos_categoria.values()):
                     # Preparar dados para o gráfico
@@ -731,44 +4009,11 @@ class FinancePro:
                             valores.append(valor)
                             cores.append(CATEGORIAS_DETALHADAS.get(cat, {}).get('cor', '#B2B2B2'))
                     
-                    # Criar DataFrame para o gráfico
-                    df_pizza = pd.DataFrame({
-                        'Categoria': categorias_nomes,
-                        'Valor': valores,
-                        'Cor': cores
-                    })
-                    
-                    # Criar gráfico de pizza
-                    fig = px.pie(
-                        df_pizza,
-                        values='Valor',
-                        names='Categoria',
-                        color='Categoria',
-                        color_discrete_map=dict(zip(categorias_nomes, cores)),
-                        hole=0.4,
-                        title=titulo_grafico
-                    )
-                    
-                    fig.update_layout(
-                        height=400,
-                        margin=dict(l=20, r=20, t=50, b=20),
-                        showlegend=True,
-                        legend=dict(
-                            orientation="v",
-                            yanchor="middle",
-                            y=0.5,
-                            xanchor="left",
-                            x=1.1
-                        )
-                    )
-                    
-                    fig.update_traces(
-                        textposition='inside',
-                        textinfo='percent+label',
-                        texttemplate='%{label}<br>%{percent}<br>R$ %{value:,.2f}',
-                        hovertemplate='<b>%{label}</b><br>Valor: R$ %{value:,.2f}<br>Percentual: %{percent}'
+                    # Gráfico de pizza (reaproveitado enquanto dados e opções não mudam)
+                    fig = figuras.obter(
+                        (versao_dados, "categorias") + opcoes_grafico,
+                        lambda: figura_pizza_categorias(categorias_nomes, valores, cores, titulo_grafico)
                     )
-                    
                     st.plotly_chart(fig, use_container_width=True)
                     
                     # Mostrar tabela de resumo
@@ -788,11 +4033,8 @@ class FinancePro:
             st.subheader("📋 Gastos Recentes")
             
             if dados:
-                # Ordenar por data (mais recente primeiro)
-                dados_ordenados = sorted(dados, key=lambda x: x.get('data', ''), reverse=True)
-                
-                # Pegar últimos 6 gastos
-                dados_recentes = dados_ordenados[:6]
+                # Pegar os 6 gastos mais recentes (por data)
+                dados_recentes = dados.recentes(6)
                 
                 # Criar uma linha para cada gasto com opção de remover
                 for gasto in dados_recentes:
@@ -824,8 +4066,8 @@ class FinancePro:
                 # Botão para limpar todos os dados
                 with st.expander("⚠️ Limpar Todos os Dados"):
                     st.warning("""
-                    **ATENÇÃO:** Esta ação remove TODOS os dados permanentemente.
-                    **FAÇA BACKUP** exportando os dados antes de usar esta opção!
+                    **ATENÇÃO:** Esta ação remove TODOS os dados.
+                    Um ponto de restauração é criado antes (veja **🛟 Backups Automáticos**).
                     """)
                     
                     confirmacao = st.text_input(
@@ -843,12 +4085,26 @@ class FinancePro:
             else:
                 st.info("💸 Nenhum gasto registrado. Adicione seu primeiro gasto!")
             
+            # Fora do "if dados": depois de limpar tudo é daqui que se restaura
+            if BACKUP_ATIVO:
+                self.painel_backups()
+            
             st.markdown('</div>', unsafe_allow_html=True)
     
+    @medir("pagina.adicionar_gasto")
     def adicionar_gasto_tela(self):
         """Interface para adicionar gastos"""
+        from streamlit_lottie import st_lottie
         self.header()
         
+        # Categoria sugerida e aviso de orçamento do gasto salvo antes do rerun
+        categoria_sugerida = st.session_state.pop("categoria_sugerida", None)
+        if categoria_sugerida:
+            st.info(categoria_sugerida)
+        aviso_orcamento = st.session_state.pop("aviso_orcamento", None)
+        if aviso_orcamento:
+            st.warning(aviso_orcamento)
+        
         col1, col2 = st.columns([2, 1])
         
         with col1:
@@ -877,9 +4133,10 @@ class FinancePro:
                         
                         categoria = st.selectbox(
                             "🏷️ Categoria",
-                            options=list(CATEGORIAS_DETALHADAS.keys()),
-                            format_func=lambda x: f"{CATEGORIAS_DETALHADAS[x]['icone']} {x.split(' ')[1]}",
-                            help="Selecione a categoria do gasto"
+                            options=[CATEGORIA_AUTOMATICA] + list(CATEGORIAS_DETALHADAS.keys()),
+                            format_func=lambda x: x if x == CATEGORIA_AUTOMATICA else f"{CATEGORIAS_DETALHADAS[x]['icone']} {x.split(' ')[1]}",
+                            help="Selecione a categoria do gasto, ou deixe a automática: "
+                                 "a categoria de gastos parecidos já registrados"
                         )
                     
                     with col_b:
@@ -925,7 +4182,7 @@ class FinancePro:
                 """, unsafe_allow_html=True)
                 
                 # Estatísticas simples
-                total_geral = sum(gasto.get("valor", 0) for gasto in st.session_state.dados)
+                total_geral = st.session_state.cubo.total_geral()
                 st.metric("Total Geral", f"R$ {total_geral:,.2f}")
                 
                 st.markdown('</div>', unsafe_allow_html=True)
@@ -935,6 +4192,71 @@ class FinancePro:
             if animacao:
                 st_lottie(animacao, height=150, key="add_anim")
     
+    @medir("pagina.importar")
+    def importar_tela(self):
+        """Importação em massa de extratos CSV/OFX e de exportações JSON"""
+        self.header()
+        
+        st.markdown('<div class="custom-card">', unsafe_allow_html=True)
+        st.subheader("📥 Importar Extrato")
+        
+        arquivo = st.file_uploader(
+            "Arquivo do extrato",
+            type=["csv", "ofx", "json"],
+            help="CSV com colunas descricao, valor, data (e opcionalmente categoria), extrato OFX do banco "
+                 "ou JSON exportado pelo FinancePro"
+        )
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            categoria_padrao = st.selectbox(
+                "🏷️ Categoria para linhas sem categoria",
+                options=list(CATEGORIAS_DETALHADAS.keys()),
+                index=list(CATEGORIAS_DETALHADAS).index("💼 Outros"),
+                key="importacao_categoria"
+            )
+        with col2:
+            debitos_negativos = st.checkbox(
+                "Saídas aparecem como valores negativos",
+                help="Marque para extratos em CSV onde os gastos vêm negativos (créditos serão ignorados). "
+                     "No OFX isso é automático.",
+                key="importacao_debitos_negativos"
+            )
+            categorizar = st.checkbox(
+                "🤖 Sugerir a categoria pela descrição",
+                value=True,
+                help="Linhas sem categoria recebem a categoria de gastos parecidos já registrados; "
+                     "sem sugestão confiável, fica a categoria acima",
+                key="importacao_categorizar"
+            )
+        
+        if arquivo is not None and st.button("📥 Importar", type="primary", use_container_width=True):
+            if arquivo.name.lower().endswith(".ofx"):
+                blocos = ler_ofx_em_blocos(arquivo)
+            elif arquivo.name.lower().endswith(".json"):
+                blocos = ler_json_em_blocos(arquivo)
+            else:
+                blocos = ler_csv_em_blocos(arquivo, debitos_negativos=debitos_negativos)
+            
+            with st.spinner("Importando extrato..."):
+                resultado = self.importar_gastos(blocos, categoria_padrao, categorizar)
+            
+            if resultado.importados:
+                st.success(f"🎉 {resultado.importados} gastos importados com sucesso!")
+            if resultado.categorizados:
+                st.info(f"🤖 {resultado.categorizados} gastos sem categoria foram categorizados pela descrição")
+            for aviso in resultado.avisos_orcamento:
+                st.warning(aviso)
+            if resultado.rejeitados:
+                st.warning(f"⚠️ {resultado.rejeitados} linhas ignoradas:")
+                for motivo, quantidade in resultado.motivos.items():
+                    st.markdown(f"- {motivo}: {quantidade}")
+            if not resultado.importados and not resultado.rejeitados:
+                st.info("Nenhuma transação encontrada no arquivo")
+        
+        st.markdown('</div>', unsafe_allow_html=True)
+    
+    @medir("pagina.analytics")
     def analytics(self):
         """Página de análises"""
         self.header()
@@ -952,56 +4274,293 @@ class FinancePro:
         # Gráfico de barras por categoria
         gastos_categoria = self.obter_gastos_por_categoria_total()
         if gastos_categoria:
-            df_cat = pd.DataFrame({
-                'Categoria': [cat.split(' ')[1] if ' ' in cat else cat for cat in gastos_categoria.keys()],
-                'Gastos': list(gastos_categoria.values()),
-                'Cor': [CATEGORIAS_DETALHADAS.get(cat, {}).get('cor', '#B2B2B2') for cat in gastos_categoria.keys()]
-            })
-            
-            fig = px.bar(
-                df_cat, x='Categoria', y='Gastos',
-                color='Cor',
-                color_discrete_map='identity',
-                text_auto='.2s',
-                title="Gastos Totais por Categoria"
-            )
-            fig.update_layout(
-                plot_bgcolor='rgba(0,0,0,0)',
-                paper_bgcolor='rgba(0,0,0,0)',
-                showlegend=False,
-                height=400
+            fig = obter_cache_figuras().obter(
+                (dados.chave_versao(), "categorias_total"),
+                lambda: figura_barras_categorias(gastos_categoria)
             )
             st.plotly_chart(fig, use_container_width=True)
         
-        # Tabela completa
+        self.evolucao_no_tempo(dados)
+        
+        self.gastos_recorrentes()
+        
+        # Tabela paginada: filtros e ordenação rodam sobre as colunas,
+        # e só a página visível é montada e formatada
         st.subheader("📋 Todos os Gastos")
         if dados:
-            df_completo = pd.DataFrame(dados)
-            if not df_completo.empty:
-                df_display = df_completo[['id', 'data', 'descricao', 'categoria', 'valor']].copy()
+            ordenacoes = {"data": "Data", "valor": "Valor", "descricao": "Descrição", "id": "ID"}
+            
+            busca = st.text_input(
+                "🔍 Buscar na descrição:",
+                placeholder="Ex: mercado, uber, aluguel",
+                help="Todas as palavras precisam aparecer (também como parte de palavras, sem acentos)",
+                key="tabela_busca"
+            )
+            
+            with st.expander("🔎 Filtros e Ordenação"):
+                col_f1, col_f2, col_f3 = st.columns(3)
+                
+                with col_f1:
+                    periodo_tabela = st.date_input(
+                        "Período:",
+                        dados.intervalo_datas() or [],
+                        min_value=date(1900, 1, 1),
+                        max_value=date(2100, 12, 31),
+                        key="tabela_periodo"
+                    )
+                    categorias_tabela = st.multiselect(
+                        "Categorias:",
+                        options=list(CATEGORIAS_DETALHADAS.keys()),
+                        key="tabela_categorias"
+                    )
+                
+                with col_f2:
+                    valor_min = st.number_input(
+                        "Valor mínimo (R$):", min_value=0.0, step=10.0, format="%.2f",
+                        key="tabela_valor_min"
+                    )
+                    valor_max = st.number_input(
+                        "Valor máximo (R$):", min_value=0.0, step=10.0, format="%.2f",
+                        help="Deixe 0 para não limitar", key="tabela_valor_max"
+                    )
+                
+                with col_f3:
+                    ordenar_por = st.selectbox(
+                        "Ordenar por:", options=list(ordenacoes), format_func=ordenacoes.get,
+                        key="tabela_ordenar_por"
+                    )
+                    direcao = st.radio(
+                        "Ordem:", ["Decrescente", "Crescente"], horizontal=True,
+                        key="tabela_direcao"
+                    )
+                    tamanho_pagina = st.selectbox(
+                        "Itens por página:", [25, 50, 100, 250], key="tabela_tamanho_pagina"
+                    )
+            
+            # Enquanto o usuário escolhe, o intervalo tem só a data inicial
+            inicio = periodo_tabela[0] if periodo_tabela else None
+            fim = periodo_tabela[-1] if periodo_tabela else None
+            posicoes = dados.consultar(
+                inicio=inicio,
+                fim=fim,
+                categorias=categorias_tabela,
+                valor_min=valor_min or None,
+                valor_max=valor_max or None,
+                ordenar_por=ordenar_por,
+                decrescente=direcao == "Decrescente",
+                posicoes=self.buscar_por_descricao(busca)
+            )
+            
+            total_filtrado = len(posicoes)
+            total_paginas = max(1, -(-total_filtrado // tamanho_pagina))
+            # Filtros mais restritivos podem deixar a página atual fora do alcance
+            if st.session_state.get("tabela_pagina", 1) > total_paginas:
+                st.session_state.tabela_pagina = total_paginas
+            pagina = st.number_input(
+                f"Página (de {total_paginas}):",
+                min_value=1,
+                max_value=total_paginas,
+                step=1,
+                key="tabela_pagina"
+            )
+            
+            primeira = (pagina - 1) * tamanho_pagina
+            posicoes_pagina = posicoes[primeira:primeira + tamanho_pagina]
+            
+            if total_filtrado:
+                df_display = dados.para_dataframe(posicoes_pagina)[['id', 'data', 'descricao', 'categoria', 'valor']]
                 df_display['categoria'] = df_display['categoria'].apply(lambda x: x.split(' ')[1] if ' ' in x else x)
                 df_display['valor'] = df_display['valor'].apply(lambda x: f'R$ {x:,.2f}')
                 
-                st.dataframe(df_display, use_container_width=True, height=300)
+                st.dataframe(df_display, use_container_width=True, hide_index=True)
+                st.caption(f"Mostrando {primeira + 1}–{primeira + len(posicoes_pagina)} de {total_filtrado} gastos")
+            else:
+                st.info("🔎 Nenhum gasto encontrado com esses filtros")
             
-            # Controles de remoção individual
-            st.subheader("🗑️ Remover Gastos Individualmente")
-            gasto_ids = [gasto.get('id') for gasto in dados if gasto.get('id') is not None]
+            # Controles de remoção (um ou vários de uma vez), sobre a página visível
+            st.subheader("🗑️ Remover Gastos")
+            gasto_ids = [dados.ids[int(p)] for p in posicoes_pagina]
             if gasto_ids:
-                gasto_selecionado = st.selectbox(
-                    "Selecione o gasto para remover:",
+                def rotulo_gasto(gasto_id):
+                    posicao = dados.posicao(gasto_id)
+                    return f"ID {gasto_id}: {dados.descricoes[posicao]} - R$ {dados.valores[posicao]:.2f}"
+                
+                gastos_selecionados = st.multiselect(
+                    "Selecione os gastos desta página para remover:",
                     options=gasto_ids,
-                    format_func=lambda x: f"ID {x}: {next((g['descricao'] for g in dados if g['id'] == x), 'N/A')} - R$ {next((g['valor'] for g in dados if g['id'] == x), 0):.2f}"
+                    format_func=rotulo_gasto
                 )
                 
-                if st.button("Remover Gasto Selecionado", type="secondary"):
-                    if self.remover_gasto(gasto_selecionado):
+                if st.button("Remover Gastos Selecionados", type="secondary", disabled=not gastos_selecionados):
+                    if self.remover_gastos(gastos_selecionados):
                         st.rerun()
         
         st.markdown('</div>', unsafe_allow_html=True)
     
+    def evolucao_no_tempo(self, dados):
+        """Visões diárias, semanais, móveis e comparativas (somas prefixadas)"""
+        st.subheader("📆 Evolução no Tempo")
+        hoje = date.today()
+        indice = st.session_state.indice_datas
+        
+        col_s1, col_s2 = st.columns([3, 1])
+        with col_s1:
+            categorias = st.multiselect(
+                "Categorias:", options=list(CATEGORIAS_DETALHADAS.keys()),
+                help="Deixe vazio para considerar todas", key="series_categorias"
+            )
+        with col_s2:
+            periodos = {"90 dias": 90, "1 ano": 365, "2 anos": 730, "5 anos": 1825}
+            dias = periodos[st.selectbox("Período:", list(periodos), index=1, key="series_periodo")]
+        
+        # Métricas: cada uma é uma diferença de somas prefixadas
+        inicio_mes = hoje.replace(day=1)
+        fim_anterior = inicio_mes - timedelta(days=1)
+        mesmo_dia_mes_anterior = fim_anterior.replace(day=min(hoje.day, fim_anterior.day))
+        ano_anterior = mesmo_dia_ano_anterior(hoje)
+        
+        mes_atual = self.obter_total_periodo(inicio_mes, hoje, categorias)
+        mes_anterior = self.obter_total_periodo(fim_anterior.replace(day=1), mesmo_dia_mes_anterior, categorias)
+        ano_atual = self.obter_total_periodo(hoje.replace(month=1, day=1), hoje, categorias)
+        ano_passado = self.obter_total_periodo(ano_anterior.replace(month=1, day=1), ano_anterior, categorias)
+        
+        def variacao(atual, anterior):
+            return f"{(atual - anterior) / anterior * 100:+.1f}%" if anterior else None
+        
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            st.metric("📅 Últimos 7 dias", f"R$ {self.obter_total_periodo(hoje - timedelta(days=6), hoje, categorias):,.2f}")
+        with col2:
+            st.metric("🗓️ Últimos 30 dias", f"R$ {self.obter_total_periodo(hoje - timedelta(days=29), hoje, categorias):,.2f}")
+        with col3:
+            st.metric(
+                "📆 Mês até hoje", f"R$ {mes_atual:,.2f}", variacao(mes_atual, mes_anterior),
+                delta_color="inverse", help="Comparado ao mesmo período do mês anterior"
+            )
+        with col4:
+            st.metric(
+                "📈 Ano até hoje", f"R$ {ano_atual:,.2f}", variacao(ano_atual, ano_passado),
+                delta_color="inverse", help="Comparado ao mesmo período do ano anterior"
+            )
+        
+        chave = (dados.chave_versao(), hoje, tuple(categorias))
+        cache = obter_cache_figuras()
+        aba_moveis, aba_semanal, aba_mes, aba_ano = st.tabs(
+            ["📉 Somas Móveis", "📊 Semanal", "🗓️ Mês × Mês Anterior", "📆 Ano × Ano Anterior"]
+        )
+        with aba_moveis:
+            fig = cache.obter(
+                chave + ("series_moveis", dias),
+                lambda: figura_series_moveis(series_moveis(indice, hoje, dias, categorias))
+            )
+            st.plotly_chart(fig, use_container_width=True)
+        with aba_semanal:
+            fig = cache.obter(
+                chave + ("semanal", dias),
+                lambda: figura_semanal(totais_semanais(indice, hoje, max(4, dias // 7), categorias))
+            )
+            st.plotly_chart(fig, use_container_width=True)
+        with aba_mes:
+            fig = cache.obter(
+                chave + ("mes_a_mes",),
+                lambda: figura_mes_a_mes(comparativo_mes_atual(indice, hoje, categorias))
+            )
+            st.plotly_chart(fig, use_container_width=True)
+        with aba_ano:
+            fig = cache.obter(
+                chave + ("ano_a_ano",),
+                lambda: figura_ano_a_ano(comparativo_anual(indice, hoje, categorias))
+            )
+            st.plotly_chart(fig, use_container_width=True)
+    
+    def gastos_recorrentes(self):
+        """Séries recorrentes ativas (aluguel, assinaturas...) com as próximas datas previstas"""
+        import pandas as pd
+        st.subheader("🔁 Gastos Recorrentes")
+        hoje = date.today()
+        series = self.obter_gastos_recorrentes()
+        ativas = [serie for serie in series if serie_ativa(serie, hoje)]
+        
+        if not ativas:
+            st.info("Nenhum gasto recorrente encontrado (são precisos ao menos 3 gastos parecidos em intervalos regulares)")
+            return
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            st.metric("🔁 Séries ativas", len(ativas))
+        with col2:
+            st.metric(
+                "📅 Custo mensal estimado", f"R$ {sum(serie['custo_mensal'] for serie in ativas):,.2f}",
+                help="Soma das séries ativas convertidas para o equivalente mensal"
+            )
+        
+        df_recorrentes = pd.DataFrame([{
+            "Descrição": serie["descricao"],
+            "Categoria": serie["categoria"],
+            "Valor": f"R$ {serie['valor']:,.2f}",
+            "Frequência": PERIODICIDADES[serie["periodicidade"]][0],
+            "Ocorrências": serie["ocorrencias"],
+            "Última": serie["ultima"].strftime("%d/%m/%Y"),
+            "Próximas": ", ".join(dia.strftime("%d/%m/%Y") for dia in proximas_ocorrencias(serie, hoje))
+        } for serie in ativas])
+        st.dataframe(df_recorrentes, use_container_width=True, hide_index=True)
+        
+        encerradas = len(series) - len(ativas)
+        if encerradas:
+            st.caption(f"{encerradas} série(s) sem ocorrência há mais de dois períodos não aparecem na lista")
+    
+    def painel_diagnostico(self):
+        """Tempos e contadores acumulados no processo (FINANCEPRO_DIAGNOSTICO=1)"""
+        import pandas as pd
+        metricas = obter_metricas()
+        with metricas.lock:
+            tempos = {nome: list(tempo) for nome, tempo in metricas.tempos.items()}
+            contadores = dict(metricas.contadores)
+
+        with st.sidebar:
+            st.markdown("---")
+            with st.expander("🩺 Diagnóstico"):
+                if tempos:
+                    df_tempos = pd.DataFrame(
+                        [
+                            {
+                                "Seção": nome,
+                                "Chamadas": chamadas,
+                                "Média (ms)": soma / chamadas * 1000,
+                                "Máx (ms)": maximo * 1000,
+                                "Última (ms)": ultima * 1000
+                            }
+                            for nome, (chamadas, soma, maximo, ultima) in tempos.items()
+                        ]
+                    ).sort_values("Última (ms)", ascending=False)
+                    st.dataframe(df_tempos, hide_index=True, use_container_width=True)
+                else:
+                    st.caption("Nenhuma medição ainda")
+
+                if contadores:
+                    st.dataframe(
+                        pd.DataFrame(sorted(contadores.items()), columns=["Evento", "Total"]),
+                        hide_index=True, use_container_width=True
+                    )
+
+                st.download_button(
+                    "📥 Métricas (Prometheus)",
+                    data=metricas.como_prometheus(),
+                    file_name="financepro_metricas.prom",
+                    mime="text/plain",
+                    key="diagnostico_metricas"
+                )
+
+        try:
+            metricas.gravar()
+        except OSError:
+            # Não é fatal: o painel continua mostrando as métricas
+            pass
+
+    @medir("rerun")
     def executar(self):
         """Executa a aplicação principal"""
+        contar("reruns")
         try:
             # Validar aplicação primeiro
             if not self.validar_e_iniciar():
@@ -1015,6 +4574,8 @@ class FinancePro:
                 self.dashboard()
             elif pagina == "💰 Adicionar Gasto":
                 self.adicionar_gasto_tela()
+            elif pagina == "📥 Importar Extrato":
+                self.importar_tela()
             elif pagina == "📈 Analytics":
                 self.analytics()
                 
@@ -1022,6 +4583,9 @@ class FinancePro:
             st.error(f"❌ Ocorreu um erro inesperado: {str(e)}")
             st.info("🔄 Tente recarregar a página")
 
+        if DIAGNOSTICO_ATIVO:
+            self.painel_diagnostico()
+
            
      # === RODAPÉ MINIMALISTA CORRIGIDO ===
     st.markdown("---")
@@ -0,0 +1,48 @@
+import io
+import math
+import os
+
+os.environ.setdefault("FINANCEPRO_BACKUP", "0")
+
+import pandas as pd
+
+from financepro_final import ResultadoImportacao, _valores_numericos, ler_csv_em_blocos, validar_lote
+
+
+def test_valores_com_separadores_de_milhar_e_decimal():
+    casos = {
+        "R$ 1.000": 1000.0,
+        "1,000": 1000.0,
+        "1.000.000": 1000000.0,
+        "1,234.56": 1234.56,
+        "1.234,56": 1234.56,
+        "-1.234,56": -1234.56,
+        "1.000,5": 1000.5,
+        "R$ 10,00": 10.0,
+        "10,50": 10.5,
+        "12.5": 12.5,
+        "0.500": 0.5,
+    }
+    valores = _valores_numericos(pd.Series(list(casos), dtype=object))
+    assert valores.tolist() == list(casos.values())
+
+
+def test_valores_invalidos_viram_nan():
+    valores = _valores_numericos(pd.Series(["1,2,3", "12.34.5", "abc", "", None], dtype=object))
+    assert all(math.isnan(valor) for valor in valores)
+
+
+def test_importacao_rejeita_valor_invalido_com_motivo():
+    csv = io.BytesIO(
+        "descricao;valor;data\n"
+        "Aluguel;R$ 1.000;2024-01-05\n"
+        "Notebook;1,234.56;2024-01-06\n"
+        "Mercado;1.234,56;2024-01-07\n"
+        "Erro;1,2,3;2024-01-08\n"
+        "Zero;0,00;2024-01-09\n".encode("utf-8")
+    )
+    resultado = ResultadoImportacao()
+    lotes = [validar_lote(bloco, "💼 Outros", resultado) for bloco in ler_csv_em_blocos(csv)]
+    validos = pd.concat(lotes)
+    assert validos["valor"].tolist() == [1000.0, 1234.56, 1234.56]
+    assert resultado.motivos == {"Valor inválido": 1, "Valor deve ser maior que zero": 1}
@@ -0,0 +1,36 @@
+import os
+
+os.environ.setdefault("FINANCEPRO_BACKUP", "0")
+
+from financepro_final import IndiceTexto, TabelaGastos
+
+
+def _gasto(gasto_id, descricao):
+    return {"id": gasto_id, "descricao": descricao, "valor": 1.0,
+            "categoria": "💼 Outros", "data": "2024-01-01"}
+
+
+def test_palavra_nova_depois_de_compactar_trigramas_vazios():
+    """Trigramas que ficaram vazios na compactação continuam recebendo
+    palavras novas (na mesma instância, sem passar por copia())"""
+    gastos = [_gasto(1, "Padaria"), _gasto(2, "Padaria"), _gasto(3, "Mercado")]
+    indice = IndiceTexto.construir(TabelaGastos.de_registros(gastos))
+    for gasto in gastos[:2]:
+        indice.remover(gasto)
+    indice.compactar()
+    assert indice.buscar("padaria").tolist() == []
+
+    indice.adicionar(_gasto(4, "Padaria Nova"))
+    assert indice.buscar("pad").tolist() == [4]
+    assert indice.buscar("padaria").tolist() == [4]
+    assert indice.buscar("mercado").tolist() == [3]
+
+
+def test_copia_nao_altera_o_original():
+    indice = IndiceTexto.construir(TabelaGastos.de_registros([_gasto(1, "Padaria")]))
+    copia = indice.copia()
+    copia.remover(_gasto(1, "Padaria"))
+    copia.compactar()
+    copia.adicionar(_gasto(2, "Padoca"))
+    assert indice.buscar("pad").tolist() == [1]
+    assert copia.buscar("pad").tolist() == [2]
@@ -0,0 +1,82 @@
+import os
+import random
+
+os.environ.setdefault("FINANCEPRO_BACKUP", "0")
+
+from financepro_final import TabelaGastos
+
+
+def _tabela(ids):
+    return TabelaGastos.de_registros([
+        {"id": gasto_id, "descricao": f"Gasto {gasto_id}", "valor": 1.0,
+         "categoria": "💼 Outros", "data": "2024-01-01"}
+        for gasto_id in ids
+    ])
+
+
+def _conferir(tabela, vivos, removidos):
+    assert len(tabela) == len(vivos)
+    for gasto_id in vivos:
+        posicao = tabela.posicao(gasto_id)
+        assert posicao is not None and tabela.ids[posicao] == gasto_id
+    for gasto_id in removidos:
+        assert tabela.posicao(gasto_id) is None
+
+
+def test_remocao_aleatoria_mantem_indice_de_posicoes():
+    """Remover quase tudo em ordem aleatória (encolhendo a tabela) não pode
+    deixar IDs apontando para posições antigas, nem nas cópias"""
+    aleatorio = random.Random(7)
+    # IDs sequenciais (array denso) e alguns grandes/negativos (dict esparso)
+    ids = list(range(1, 5001)) + [10**9 + k for k in range(50)] + [-k for k in range(1, 21)]
+    tabela = _tabela(ids)
+    ordem = ids[:]
+    aleatorio.shuffle(ordem)
+
+    vivos, removidos = set(ids), set()
+    for inicio in range(0, len(ordem) - 100, 250):
+        lote = ordem[inicio:inicio + 250]
+        tabela = tabela.copia()
+        assert len(tabela.remover_varios(lote)) == len(lote)
+        vivos.difference_update(lote)
+        removidos.update(lote)
+        _conferir(tabela, vivos, removidos)
+
+
+def test_remocao_um_a_um_com_reinsercao():
+    aleatorio = random.Random(11)
+    tabela = _tabela(range(1, 3001))
+    vivos = set(range(1, 3001))
+    removidos = set()
+    for passo in range(2800):
+        gasto_id = aleatorio.choice(sorted(vivos)) if passo % 50 else max(vivos)
+        assert tabela.remover(gasto_id)["id"] == gasto_id
+        vivos.discard(gasto_id)
+        removidos.add(gasto_id)
+        if passo % 400 == 0:
+            novo = 3001 + passo
+            tabela.append({"id": novo, "descricao": "Novo", "valor": 2.0, "data": "2024-02-01"})
+            vivos.add(novo)
+        assert len(tabela) == len(vivos)
+        if passo % 100 == 0:
+            _conferir(tabela, vivos, removidos)
+    _conferir(tabela, vivos, removidos)
+
+
+def test_copias_compartilham_colunas_sem_alterar_versoes_antigas():
+    """Inclusões e remoções numa cópia (e numa cópia irmã) não aparecem na
+    versão original, nem quando um ID removido volta"""
+    original = _tabela(range(1, 101))
+    nova = original.copia()
+    nova.append({"id": 101, "descricao": "Novo", "valor": 2.0, "data": "2024-02-01"})
+    assert nova.remover(5)["id"] == 5
+    irma = original.copia()
+    irma.append({"id": 200, "descricao": "Irmã", "valor": 3.0, "data": "2024-03-01"})
+    nova.append({"id": 5, "descricao": "De volta", "valor": 4.0, "data": "2024-04-01"})
+
+    _conferir(original, range(1, 101), [101, 200])
+    assert original.buscar(5)["descricao"] == "Gasto 5"
+    _conferir(nova, list(range(1, 102)), [200])
+    assert nova.buscar(5)["descricao"] == "De volta"
+    _conferir(irma, list(range(1, 101)) + [200], [101])
+    assert [gasto["id"] for gasto in irma][-1] == 200